@@ -0,0 +1,162 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from fake_openai_server import start_fake_server
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_designer(args):
+    """对比串行与并行候选思维链在假接口上的耗时"""
+    from simplified_nl2sql import SQLDesignerAgent, run_sync
+
+    query = "Question: How many male patients have elevated total bilirubin?"
+    modes = [
+        ("sequential", dict(num_candidates=args.candidates, max_workers=1)),
+        ("concurrent", dict(num_candidates=args.candidates, max_workers=args.candidates)),
+        ("concurrent+quorum", dict(num_candidates=args.candidates, max_workers=args.candidates,
+                                   agreement_quorum=args.quorum)),
+        ("single_call", dict(num_candidates=args.candidates, max_workers=args.candidates,
+                             reasoning_mode="single_call")),
+    ]
+    for name, kwargs in modes:
+        agent = SQLDesignerAgent(chain_timeout=args.chain_timeout, **kwargs)
+        candidates, elapsed = _timed(lambda: run_sync(agent._agenerate_candidates(query)))
+        print(f"{name:<20} candidates={len(candidates):<3} time={elapsed:.2f}s")
+
+
+def bench_tokens(args):
+    """对比完整历史与窗口化历史下每条思维链的 token 用量（假接口按字符数估算 usage）"""
+    from simplified_nl2sql import SQLDesignerAgent, run_sync
+
+    query = "Question: How many male patients have elevated total bilirubin?"
+    for window in (None, args.window):
+        agent = SQLDesignerAgent(num_candidates=args.candidates, history_window=window)
+        usages = []
+        _, elapsed = _timed(lambda: run_sync(agent._agenerate_candidates(query, usages)))
+        total = sum(usage.total_tokens for usage in usages)
+        per_chain = ", ".join(str(usage.prompt_tokens) for usage in usages)
+        print(f"history_window={str(window):<5} calls={sum(u.calls for u in usages):<4} "
+              f"prompt_tokens/chain=[{per_chain}] total_tokens={total} time={elapsed:.2f}s")
+
+
+def bench_throughput(args):
+    """在同一个事件循环中并发运行多个问题的思维链，统计吞吐量"""
+    import asyncio
+    from simplified_nl2sql import agenerate_o1_reasoning, run_sync
+
+    async def run_all():
+        prompts = [f"Question {i}: How many male patients have elevated total bilirubin?" for i in range(args.questions)]
+        return await asyncio.gather(*(agenerate_o1_reasoning(p) for p in prompts))
+
+    results, elapsed = _timed(lambda: run_sync(run_all()))
+    print(f"questions={len(results)} time={elapsed:.2f}s throughput={len(results) / elapsed:.1f} q/s")
+
+
+def bench_embedding(args):
+    """对比逐条与批量嵌入写入 ChromaDB 的吞吐量（使用确定性替身嵌入器）"""
+    import chromadb
+    from embedding_pipeline import EmbeddingPipeline, HashEmbedder
+
+    client = chromadb.EphemeralClient()
+    texts = [f"value {i % args.distinct}" for i in range(args.rows)]
+    metadatas = [{"index": i, "text": text} for i, text in enumerate(texts)]
+    ids = [f"id{i}" for i in range(args.rows)]
+    for batch_size in (1, args.batch_size):
+        embedder = HashEmbedder(latency=args.embed_latency)
+        collection = client.get_or_create_collection(f"bench_batch_{batch_size}")
+        stats = EmbeddingPipeline(embedder, batch_size=batch_size).run(collection, texts, metadatas, ids)
+        print(f"batch_size={batch_size:<5} calls={embedder.calls:<6} {stats}")
+
+
+def bench_prompt(args):
+    """对比缩进 JSON 与紧凑渲染的结构提示词 token 数（合成的宽表结构）"""
+    import json
+    from prompt_schema import render_schema, count_tokens
+
+    tables = {f"table_{t}": [f"column_{t}_{c}" for c in range(args.columns)] for t in range(args.tables)}
+    descriptions = {
+        table: {
+            column: {
+                "column_description": f"description of {column} in {table}",
+                "value_description": f"{column} stores a coded value. " * 6,
+            }
+            for column in columns
+        }
+        for table, columns in tables.items()
+    }
+    types = {table: {column: "TEXT" for column in columns} for table, columns in tables.items()}
+
+    legacy = (f"DATABASE SCHEMA: {json.dumps(tables, ensure_ascii=False, indent=4)}\n"
+              f"COLUMN DESCRIPTION: {json.dumps(descriptions, ensure_ascii=False, indent=4)}")
+    variants = [
+        ("json indent=4", legacy),
+        ("json minified", render_schema(tables, descriptions, "json")),
+        ("ddl", render_schema(tables, descriptions, "ddl", types)),
+        (f"ddl budget={args.budget}", render_schema(tables, descriptions, "ddl", types, token_budget=args.budget)),
+    ]
+    for name, text in variants:
+        start = time.perf_counter()
+        tokens = count_tokens(text)
+        print(f"{name:<20} chars={len(text):<8} tokens={tokens:<8} count_time={time.perf_counter() - start:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NL2SQL 基准测试（使用本地假 OpenAI 接口）")
+    parser.add_argument("--latency", type=float, default=0.2, help="假接口每次调用的延迟（秒）")
+    parser.add_argument("--steps", type=int, default=4, help="每条思维链的推理步数")
+    parser.add_argument("--max-connections", type=int, default=None, help="共享 HTTP 连接池的最大连接数")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    designer = subparsers.add_parser("designer", help="SQLDesignerAgent 候选链并行度")
+    designer.add_argument("--candidates", type=int, default=3)
+    designer.add_argument("--quorum", type=int, default=2)
+    designer.add_argument("--chain-timeout", type=float, default=None)
+    designer.set_defaults(func=bench_designer)
+
+    tokens = subparsers.add_parser("tokens", help="思维链历史窗口的 token 用量")
+    tokens.add_argument("--candidates", type=int, default=3)
+    tokens.add_argument("--window", type=int, default=2)
+    tokens.set_defaults(func=bench_tokens)
+
+    throughput = subparsers.add_parser("throughput", help="单事件循环并发问题吞吐量")
+    throughput.add_argument("--questions", type=int, default=100)
+    throughput.set_defaults(func=bench_throughput)
+
+    embed = subparsers.add_parser("embed", help="批量嵌入流水线吞吐量")
+    embed.add_argument("--rows", type=int, default=5000)
+    embed.add_argument("--distinct", type=int, default=50)
+    embed.add_argument("--batch-size", type=int, default=256)
+    embed.add_argument("--embed-latency", type=float, default=0.002, help="替身嵌入器每次调用的延迟（秒）")
+    embed.set_defaults(func=bench_embedding)
+
+    prompt = subparsers.add_parser("prompt", help="结构提示词的 token 数")
+    prompt.add_argument("--tables", type=int, default=20)
+    prompt.add_argument("--columns", type=int, default=30)
+    prompt.add_argument("--budget", type=int, default=8000)
+    prompt.set_defaults(func=bench_prompt)
+
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(latency=args.latency, steps=args.steps)
+    os.environ["OPENAI_API_BASE"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    if args.max_connections:
+        from llm_client import configure_client_pool
+        configure_client_pool(max_connections=args.max_connections)
+    try:
+        args.func(args)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
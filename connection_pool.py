@@ -0,0 +1,225 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional
+
+_pools: Dict[str, "ReadOnlyConnectionPool"] = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """在 acquire_timeout 内没有可用连接"""
+
+
+class ReadOnlyConnectionPool:
+    """
+    单个 SQLite 数据库的只读连接池。
+
+    连接以 mode=ro 打开并设置 query_only；没有 -wal / -journal 旁路文件时额外使用 immutable=1，
+    跳过文件锁和变更检测。每次取出连接时比较文件的 mtime / size，变化后丢弃所有空闲连接重新打开，
+    因此 immutable 连接不会读到过期的页。
+    连接以 check_same_thread=False 打开，可以在线程池中复用，但同一时刻只被一个线程借出。
+    归还时检查 query_only、cache_size、mmap_size 和临时对象，与刚打开时不同的连接直接关闭，不再放回池中。
+    """
+
+    def __init__(self, sqlite_path: Path, db_name: Optional[str] = None, max_size: int = 8,
+                 immutable: Optional[bool] = None, mmap_size: int = 256 * 1024 * 1024,
+                 cache_size_kib: int = 16 * 1024, acquire_timeout: Optional[float] = 30.0):
+        """
+        Args:
+            sqlite_path (Path): 数据库文件路径。
+            db_name (Optional[str]): 统计信息中显示的名称，默认取文件名。
+            max_size (int): 同时打开的连接上限，借出的连接达到上限后 acquire 等待。
+            immutable (Optional[bool]): 是否使用 immutable=1；None 表示没有 -wal / -journal 文件时启用。
+            mmap_size (int): PRAGMA mmap_size（字节），0 表示不使用内存映射。
+            cache_size_kib (int): 每个连接的页缓存大小（KiB）。
+            acquire_timeout (Optional[float]): 等待空闲连接的最长时间（秒），None 表示一直等待。
+        """
+        self.sqlite_path = Path(sqlite_path).resolve()
+        self.db_name = db_name or self.sqlite_path.stem
+        self.max_size = max_size
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.acquire_timeout = acquire_timeout
+        self._idle = deque()
+        self._size = 0
+        self._signature = None
+        self._baseline_state = None
+        self._condition = threading.Condition()
+        self._metrics = {"opened": 0, "closed": 0, "acquired": 0, "reused": 0, "waits": 0,
+                         "wait_time": 0.0, "timeouts": 0, "reloads": 0, "dirty": 0}
+
+    def _file_signature(self):
+        stat = os.stat(self.sqlite_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _use_immutable(self) -> bool:
+        if self.immutable is not None:
+            return self.immutable
+        # 有 WAL 或回滚日志说明可能有写入者，这时 immutable 会读到不一致的数据
+        return not any(os.path.exists(f"{self.sqlite_path}{suffix}") for suffix in ("-wal", "-journal"))
+
+    def _open(self) -> sqlite3.Connection:
+        uri = f"{self.sqlite_path.as_uri()}?mode=ro"
+        if self._use_immutable():
+            uri += "&immutable=1"
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        connection.execute("PRAGMA query_only = 1")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        connection.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        state = self._connection_state(connection)
+        with self._condition:
+            self._baseline_state = state
+            self._metrics["opened"] += 1
+        return connection
+
+    @staticmethod
+    def _connection_state(connection: sqlite3.Connection) -> tuple:
+        """借出者可能改动的连接级状态：只读开关、缓存设置和临时表 / 视图 / 触发器"""
+        return (
+            connection.execute("PRAGMA query_only").fetchone()[0],
+            connection.execute("PRAGMA cache_size").fetchone()[0],
+            connection.execute("PRAGMA mmap_size").fetchone()[0],
+            connection.execute("SELECT COUNT(*) FROM temp.sqlite_master").fetchone()[0],
+        )
+
+    def _discard_idle(self) -> None:
+        while self._idle:
+            self._idle.popleft().close()
+            self._size -= 1
+            self._metrics["closed"] += 1
+
+    def acquire(self, timeout: Optional[float] = None) -> sqlite3.Connection:
+        """
+        借出一个连接，用完后必须调用 release（或使用 connection() 上下文）。
+
+        Args:
+            timeout (Optional[float]): 等待时间，默认使用 acquire_timeout。
+
+        Returns:
+            sqlite3.Connection: 只读连接。
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        signature = self._file_signature()
+        start = time.perf_counter()
+        waited = False
+        with self._condition:
+            if signature != self._signature:
+                # 文件被替换或修改过，旧连接（尤其是 immutable 的）不能再用
+                if self._signature is not None:
+                    self._metrics["reloads"] += 1
+                self._discard_idle()
+                self._signature = signature
+            while not self._idle and self._size >= self.max_size:
+                waited = True
+                remaining = None if timeout is None else timeout - (time.perf_counter() - start)
+                if remaining is not None and remaining <= 0:
+                    self._metrics["timeouts"] += 1
+                    raise PoolTimeout(f"No free connection for {self.db_name} within {timeout}s")
+                self._condition.wait(remaining)
+            if waited:
+                self._metrics["waits"] += 1
+                self._metrics["wait_time"] += time.perf_counter() - start
+            self._metrics["acquired"] += 1
+            if self._idle:
+                self._metrics["reused"] += 1
+                return self._idle.pop()
+            # 先占位再在锁外打开连接，避免打开期间阻塞其他线程
+            self._size += 1
+        try:
+            return self._open()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        """归还连接；未结束的事务会被回滚，连接级状态被改动过的连接直接关闭"""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            healthy = True
+            clean = self._connection_state(connection) == self._baseline_state
+        except sqlite3.Error:
+            healthy = clean = False
+        with self._condition:
+            if healthy and not clean:
+                self._metrics["dirty"] += 1
+            if clean and self._signature == self._file_signature():
+                self._idle.append(connection)
+            else:
+                connection.close()
+                self._size -= 1
+                self._metrics["closed"] += 1
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[sqlite3.Connection]:
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self) -> None:
+        """关闭所有空闲连接；借出的连接归还时仍会放回池中"""
+        with self._condition:
+            self._discard_idle()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            acquired = self._metrics["acquired"]
+            return {
+                "db_name": self.db_name,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+                **self._metrics,
+                "reuse_rate": self._metrics["reused"] / acquired if acquired else 0.0,
+            }
+
+    def __str__(self) -> str:
+        stats = self.stats()
+        return (f"{stats['db_name']}: {stats['in_use']}/{stats['size']} in use, {stats['acquired']} acquired "
+                f"({stats['reuse_rate']:.0%} reused), {stats['waits']} waits, {stats['reloads']} reloads, "
+                f"{stats['dirty']} dirty")
+
+
+def get_connection_pool(sqlite_path: Path, db_name: Optional[str] = None, **kwargs) -> ReadOnlyConnectionPool:
+    """
+    获取数据库文件对应的共享连接池，同一个文件在进程内只有一个池。
+
+    Args:
+        sqlite_path (Path): 数据库文件路径。
+        db_name (Optional[str]): 数据库名称，默认取文件名。
+        **kwargs: 首次创建时传给 ReadOnlyConnectionPool 的参数。
+
+    Returns:
+        ReadOnlyConnectionPool: 连接池。
+    """
+    key = str(Path(sqlite_path).resolve())
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ReadOnlyConnectionPool(sqlite_path, db_name, **kwargs)
+        return _pools[key]
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """所有连接池的统计信息，按数据库名称索引"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.db_name: pool.stats() for pool in pools}
+
+
+def close_all_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
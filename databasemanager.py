@@ -1,11 +1,21 @@
 import os
+import hashlib
 from pathlib import Path
 import chromadb
 import pandas as pd
 import sqlite3
-import ollama
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 from disk_manager import manage_vector_store,save_vector_data_to_disk,load_vector_data_from_disk
+from schema_catalog import SchemaCatalog, get_schema_catalog
+from description_index import DescriptionIndex, get_description_index
+from embedding_pipeline import OllamaEmbedder, CachedEmbedder, EmbeddingPipeline, EmbeddingStats
+from index_manifest import IndexManifest, row_hash, content_fingerprint
+from value_index import LexicalValueIndex
+from minhash_lsh import ColumnLSHIndex
+from connection_pool import ReadOnlyConnectionPool, get_connection_pool
+
+# 值向量集合中每个值最多记录的 rowid 数，完整的出现次数记在 count 中
+MAX_ROW_REFS = 1000
 
 class DatabaseManager:
     _instances = {}  
@@ -20,6 +30,13 @@ class DatabaseManager:
         self.db_name = db_name
         self.set_path()
         self.client = chromadb.PersistentClient(path=str(self.chromadb_path)) 
+        # 嵌入后端可替换，例如测试时换成 CachedEmbedder(HashEmbedder())
+        # 相同文本的向量按 (model, 文本哈希) 缓存，跨列、跨数据库复用
+        self.embedder = CachedEmbedder(OllamaEmbedder())
+        self.embedding_batch_size = 64
+        self.embedding_concurrency = 1
+        self._value_index = None
+        self._lsh_index = None
 
 
     def set_path(self):
@@ -28,6 +45,10 @@ class DatabaseManager:
         self.sqlite_path = base_dir / self.db_name / f"{self.db_name}.sqlite"
         self.table_description_path = base_dir / self.db_name / "database_description"
         self.chromadb_path = base_dir / self.db_name / f"{self.db_name}.chromadb"
+        self.schema_cache_path = base_dir / self.db_name / f"{self.db_name}_schema.json"
+        self.index_manifest_path = base_dir / self.db_name / f"{self.db_name}_index_manifest.json"
+        self.value_index_path = base_dir / self.db_name / f"{self.db_name}_values.sqlite"
+        self.lsh_index_path = base_dir / self.db_name / f"{self.db_name}_lsh.pkl"
         print(f"SQLite Path: {self.sqlite_path}")
         print(f"Table Description Path: {self.table_description_path}")
 
@@ -49,47 +70,145 @@ class DatabaseManager:
             converted_names[column] = converted_name
         return converted_names
 
-    def save_vectordb(self):
+    def embedding_pipeline(self) -> EmbeddingPipeline:
+        """返回使用当前嵌入后端、批大小和并发度的嵌入流水线"""
+        return EmbeddingPipeline(self.embedder, batch_size=self.embedding_batch_size, concurrency=self.embedding_concurrency)
+
+    def get_index_manifest(self) -> IndexManifest:
+        """返回向量索引进度清单"""
+        return IndexManifest(self.index_manifest_path, self.db_name)
+
+    def _existing_row_hashes(self, vector_store, ids: List[str], page_size: int = 5000) -> Dict[str, str]:
+        """读取向量库中已有行的内容哈希"""
+        existing = {}
+        for start in range(0, len(ids), page_size):
+            result = vector_store.get(ids=ids[start:start + page_size], include=['metadatas'])
+            for id_, meta in zip(result['ids'], result['metadatas']):
+                existing[id_] = (meta or {}).get('hash')
+        return existing
+
+    def index_collection(self, manifest: IndexManifest, pipeline: EmbeddingPipeline, collection_name: str,
+                         texts: List[str], metadata: List[Dict[str, Any]], ids: List[str],
+                         docs: List[str] = None, rebuild: bool = False) -> EmbeddingStats:
+        """
+        增量写入一个向量集合：内容指纹未变则跳过；中断的任务从水位线继续；
+        内容变化时只写入新增或变化的行，并删除已不存在的行。
+        
+        Args:
+            manifest (IndexManifest): 进度清单。
+            pipeline (EmbeddingPipeline): 嵌入流水线。
+            collection_name (str): 集合名称。
+            texts (List[str]): 待嵌入文本。
+            metadata (List[Dict[str, Any]]): 每行元数据，会补充内容哈希。
+            ids (List[str]): 每行 id。
+            docs (List[str]): 每行文档，默认使用 texts。
+            rebuild (bool): 是否删除集合后完整重建。
+        
+        Returns:
+            EmbeddingStats: 本次实际写入的统计。
+        """
+        if docs is None:
+            docs = texts
+        hashes = [row_hash(text, doc, meta) for text, doc, meta in zip(texts, docs, metadata)]
+        # 指纹同时覆盖 id，行的增删不会被相同的内容序列掩盖
+        fingerprint = content_fingerprint([f"{id_}:{hash_}" for id_, hash_ in zip(ids, hashes)])
+
+        if not rebuild and manifest.is_complete(collection_name, fingerprint):
+            print(f"Collection '{collection_name}' is up to date, skipped.")
+            return EmbeddingStats()
+
+        vector_store = manage_vector_store(self.client, collection_name, reset=rebuild)
+        if not vector_store:
+            return EmbeddingStats()
+
+        watermark = 0 if rebuild else manifest.resume_watermark(collection_name, fingerprint)
+        if watermark:
+            print(f"Resuming collection '{collection_name}' from row {watermark}.")
+        else:
+            # 删除已不存在的行（例如表变短了）
+            current_ids = set(ids)
+            stale_ids = [id_ for id_ in vector_store.get(include=[])['ids'] if id_ not in current_ids]
+            if stale_ids:
+                vector_store.delete(ids=stale_ids)
+        manifest.start(collection_name, fingerprint, len(ids), watermark)
+
+        existing = {} if rebuild else self._existing_row_hashes(vector_store, ids[watermark:])
+        rows = [idx for idx in range(watermark, len(ids)) if existing.get(ids[idx]) != hashes[idx]]
+
+        def on_chunk(done: int):
+            # 行按升序写入，已写入部分之前的行都已落盘
+            next_row = rows[done] if done < len(rows) else len(ids)
+            manifest.advance(collection_name, next_row)
+
+        stats = pipeline.run(
+            vector_store,
+            [texts[idx] for idx in rows],
+            [dict(metadata[idx], hash=hashes[idx]) for idx in rows],
+            [ids[idx] for idx in rows],
+            [docs[idx] for idx in rows],
+            on_chunk=on_chunk
+        )
+        manifest.complete(collection_name)
+        print(f"Collection '{collection_name}': {len(rows)} of {len(ids)} rows written. {stats}")
+        return stats
+
+    def value_entries(self, column_data: pd.Series) -> Tuple[List[str], List[Dict[str, Any]], List[str]]:
+        """
+        把一列数据折叠成每个不同值一条记录，值在所有出现位置共用一个向量。
+
+        Args:
+            column_data (pd.Series): 以 rowid 为索引的列数据。
+
+        Returns:
+            Tuple[List[str], List[Dict[str, Any]], List[str]]: 不同的值（按首次出现顺序）、元数据
+                （text、count 和前 MAX_ROW_REFS 个出现位置的 rowid，逗号分隔）、由值内容得到的 id。
+        """
+        occurrences = {}
+        column_data = column_data.dropna()
+        for rowid, value in zip(column_data.index, column_data.astype(str).tolist()):
+            occurrences.setdefault(value, []).append(int(rowid))
+        values = list(occurrences)
+        metadata = [
+            {'text': value, 'count': len(occurrences[value]),
+             'rows': ",".join(map(str, occurrences[value][:MAX_ROW_REFS]))}
+            for value in values
+        ]
+        ids = [f"val{hashlib.sha1(value.encode('utf-8')).hexdigest()}" for value in values]
+        return values, metadata, ids
+
+    def save_vectordb(self, rebuild: bool = False):
+        manifest = self.get_index_manifest()
+        run = manifest.begin_run("save_vectordb")
         try:                
             df_dict = self.get_data_to_embed()
             table_names = self.get_table_description_filenames()
+            pipeline = self.embedding_pipeline()
+            total_stats = EmbeddingStats()
             
-            with open('database_progress.txt', 'a', encoding='utf-8') as f:
-                for table_name in table_names:
-                    table_name = table_name.replace(".csv", "")
-                    f.write(f"Embedding table '{table_name}'...\n")
-                    f.flush() 
-                    
-                    print(f"Embedding table '{table_name}'...")
-                    df = df_dict[table_name]
-                    columns_to_embed = df.columns.tolist()
-                    vector_store_filename_dict = self.convert_chromadb_name(self.db_name, table_name, columns_to_embed)
-
-                    for column in columns_to_embed:
-                        if column in df.columns:
-                            print(f"Embedding column '{column}'...")
-                            column_data = df[column].fillna('null').to_string(index=False).split('\n')
-
-                            column_name = vector_store_filename_dict[column]
-                            vector_store = manage_vector_store(self.client, column_name)
-                            embeddings, metadata, ids, docs = [], [], [], []
-                            
-                            for idx, out_string in enumerate(column_data):
-                                print(f"Embedding idx '{idx}'...")
-                                embedding = self._embedding_function(out_string)
-                                embeddings.append(embedding)
-                                metadata.append({'index': idx, 'text': out_string})
-                                ids.append(f"id{idx}")
-                                docs.append(str(df.iloc[idx].to_list()))
-                            
-                            if vector_store:
-                                vector_store.add(embeddings=embeddings, metadatas=metadata, ids=ids, documents=docs)
-
-                            print(f"Column '{column}' has been embedded and stored in ChromaDB.")
-                        else:
-                            print(f"Column '{column}' does not exist in the CSV file.")
+            for table_name in table_names:
+                table_name = table_name.replace(".csv", "")
+                print(f"Embedding table '{table_name}'...")
+                df = df_dict[table_name]
+                columns_to_embed = df.columns.tolist()
+                vector_store_filename_dict = self.convert_chromadb_name(self.db_name, table_name, columns_to_embed)
+                for column in columns_to_embed:
+                    if column in df.columns:
+                        # 每个不同的值只存一个向量，出现位置（rowid，见 get_data_to_embed）记在元数据中；
+                        # id 由值本身决定，插入或删除行只会改写受影响的值
+                        values, metadata, ids = self.value_entries(df[column])
+
+                        column_name = vector_store_filename_dict[column]
+                        stats = self.index_collection(manifest, pipeline, column_name, values, metadata, ids, rebuild=rebuild)
+                        total_stats.merge(stats)
+                    else:
+                        print(f"Column '{column}' does not exist in the CSV file.")
+            summary = f"{total_stats}; embedding cache: {self.embedder}"
+            print(f"Database '{self.db_name}' embedded: {summary}")
+            manifest.end_run(run, "complete", summary)
         except Exception as e:
             print(f"Error saving vector database: {e}")
+            manifest.end_run(run, "failed", str(e))
+            raise
 
     def get_table_description(self) -> Dict[str, Dict[str, Any]]:
         """
@@ -114,37 +233,26 @@ class DatabaseManager:
             Dict[str, Any]: 包含格式化后的主键字典和外键关系列表的字典。
         """
         keys_info = {}
-
-        with sqlite3.connect(self.sqlite_path) as connection:
-            cursor = connection.cursor()
-            
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-
-            for table in tables:
-                table_name = table[0]
-                cursor.execute(f'PRAGMA table_info("{table_name}");')
-                columns_info = cursor.fetchall()
-
-                primary_keys = [col[1] for col in columns_info if col[5] == 1] 
-                keys_info[table_name] = {
-                    "primary_keys": primary_keys,
-                    "foreign_keys": [],
-                    "foreign_key_relations": {}
-                }
-
-                cursor.execute(f'PRAGMA foreign_key_list("{table_name}");')
-                foreign_keys_info = cursor.fetchall()
-                for fk in foreign_keys_info:
-                    foreign_key_column = fk[3] 
-                    referenced_table = fk[2]   
-                    referenced_column = fk[4] 
-
-                    keys_info[table_name]["foreign_keys"].append(foreign_key_column)
-                    
-                    if referenced_table not in keys_info[table_name]["foreign_key_relations"]:
-                        keys_info[table_name]["foreign_key_relations"][referenced_table] = []
-                    keys_info[table_name]["foreign_key_relations"][referenced_table].append(referenced_column)
+        catalog = self.get_schema_catalog()
+
+        for table_name, table_info in catalog.tables.items():
+            primary_keys = [col["name"] for col in table_info["columns"] if col["pk"] == 1] 
+            keys_info[table_name] = {
+                "primary_keys": primary_keys,
+                "foreign_keys": [],
+                "foreign_key_relations": {}
+            }
+
+            for fk in table_info["foreign_keys"]:
+                foreign_key_column = fk["column"] 
+                referenced_table = fk["ref_table"]   
+                referenced_column = fk["ref_column"] 
+
+                keys_info[table_name]["foreign_keys"].append(foreign_key_column)
+                
+                if referenced_table not in keys_info[table_name]["foreign_key_relations"]:
+                    keys_info[table_name]["foreign_key_relations"][referenced_table] = []
+                keys_info[table_name]["foreign_key_relations"][referenced_table].append(referenced_column)
 
         print("Primary and foreign keys extracted successfully.")
         
@@ -221,11 +329,7 @@ class DatabaseManager:
         Returns:
             list: 嵌入向量表示（示例）。
         """
-        response = ollama.embeddings(
-            prompt=text,
-            model="mxbai-embed-large"
-        )
-        return response['embedding']  
+        return self.embedder.embed([text])[0]
 
     def _parse_csv(self, file_path: Path) -> Dict[str, Any]:
         """
@@ -255,10 +359,11 @@ class DatabaseManager:
     def get_data_to_embed(self) -> Dict[str, pd.DataFrame]:
         """
         从 SQLite 数据库获取所有表及其内容，并转换为 DataFrame 格式。
+        DataFrame 的索引是表的 rowid；WITHOUT ROWID 表没有 rowid，使用行的位置。
         """
         dataframes = {}
         
-        with sqlite3.connect(self.sqlite_path) as connection:
+        with self.get_connection_pool().connection() as connection:
             try:
                 cursor = connection.cursor()
                 cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
@@ -268,10 +373,18 @@ class DatabaseManager:
                     table_name = table[0]
                     # print(f"Reading table: {table_name}")
                     try:
-                        table_data = pd.read_sql_query(
-                            f'SELECT * FROM "{table_name}";', 
-                            connection
-                        )
+                        try:
+                            table_data = pd.read_sql_query(
+                                f'SELECT rowid AS "__rowid__", * FROM "{table_name}";',
+                                connection,
+                                index_col="__rowid__"
+                            )
+                            table_data.index.name = None
+                        except Exception:
+                            table_data = pd.read_sql_query(
+                                f'SELECT * FROM "{table_name}";', 
+                                connection
+                            )
                         for column in table_data.select_dtypes(include=['object']).columns:
                             table_data[column] = table_data[column].apply(
                                 lambda x: x.encode('utf-8', 'replace').decode('utf-8') if isinstance(x, str) else x
@@ -305,6 +418,101 @@ class DatabaseManager:
             return []
         
 
+    def get_connection_pool(self) -> ReadOnlyConnectionPool:
+        """
+        获取源数据库的共享只读连接池（与 RefinerAgent 的候选执行共用）。
+        
+        Returns:
+            ReadOnlyConnectionPool: 连接池。
+        """
+        return get_connection_pool(self.sqlite_path, self.db_name)
+
+    def get_schema_catalog(self) -> SchemaCatalog:
+        """
+        获取数据库结构目录（基于 PRAGMA table_info，按文件 mtime/size 缓存）。
+        
+        Returns:
+            SchemaCatalog: 数据库结构目录。
+        """
+        return get_schema_catalog(self.db_name, self.sqlite_path, self.schema_cache_path)
+
+    def get_description_index(self) -> DescriptionIndex:
+        """
+        获取列描述索引（description CSV 只解析一次，按文件 mtime 刷新）。
+        
+        Returns:
+            DescriptionIndex: 列描述索引。
+        """
+        return get_description_index(self.db_name, self.table_description_path)
+
+    def create_value_index(self) -> LexicalValueIndex:
+        """
+        一次批量构建字面值索引（<db>_values.sqlite：去重文本值 + FTS5 trigram）。
+        
+        Returns:
+            LexicalValueIndex: 构建好的索引。
+        """
+        catalog = self.get_schema_catalog()
+        if self._value_index is not None:
+            self._value_index.close()
+        self._value_index = LexicalValueIndex.build(self.sqlite_path, self.value_index_path, catalog.table_columns_dict())
+        return self._value_index
+
+    def get_value_index(self):
+        """
+        懒加载字面值索引，索引文件不存在时返回 None。
+        
+        Returns:
+            Optional[LexicalValueIndex]: 字面值索引。
+        """
+        if self._value_index is None:
+            if not self.value_index_path.exists():
+                return None
+            try:
+                self._value_index = LexicalValueIndex(self.value_index_path)
+            except Exception as e:
+                print(f"Error loading lexical value index: {e}")
+                return None
+            if not self._value_index.is_fresh(self.sqlite_path):
+                print(f"Lexical value index of '{self.db_name}' is older than the database; run create_value_index() to refresh it.")
+        return self._value_index
+
+    def create_lsh_index(self, num_perm: int = 64, bands: int = 16, max_values_per_column: int = 5000) -> ColumnLSHIndex:
+        """
+        预计算每列去重值的 MinHash 签名并建立 LSH 索引，保存到 <db>_lsh.pkl。
+        
+        Args:
+            num_perm (int): MinHash 排列数。
+            bands (int): LSH band 数。
+            max_values_per_column (int): 每列参与索引的去重值上限。
+        
+        Returns:
+            ColumnLSHIndex: 构建好的索引。
+        """
+        catalog = self.get_schema_catalog()
+        self._lsh_index = ColumnLSHIndex.build(self.sqlite_path, catalog.table_columns_dict(),
+                                               num_perm, bands, max_values_per_column)
+        self._lsh_index.save(self.lsh_index_path)
+        return self._lsh_index
+
+    def get_lsh_index(self):
+        """
+        懒加载 MinHash/LSH 列路由索引，索引文件不存在时返回 None。
+        
+        Returns:
+            Optional[ColumnLSHIndex]: 列路由索引。
+        """
+        if self._lsh_index is None:
+            if not self.lsh_index_path.exists():
+                return None
+            self._lsh_index = ColumnLSHIndex.load(self.lsh_index_path)
+            if self._lsh_index is None:
+                print(f"Error loading MinHash/LSH index: {self.lsh_index_path}")
+                return None
+            if not self._lsh_index.is_fresh(self.sqlite_path):
+                print(f"MinHash/LSH index of '{self.db_name}' is older than the database; run create_lsh_index() to refresh it.")
+        return self._lsh_index
+
     def get_table_columns_dict(self):
         """
         获取数据库中所有表的列名。
@@ -312,8 +520,12 @@ class DatabaseManager:
         Returns:
             Dict[str, List[str]]: 数据库中所有表的列名。
         """
-        data_dict = self.get_data_to_embed()
-        actual_tables = set(data_dict.keys())
+        try:
+            catalog = self.get_schema_catalog()
+        except Exception as e:
+            print(f"Error loading schema catalog: {e}")
+            return {}
+        actual_tables = set(catalog.table_names())
         
         desc_tables = set(self.get_table_description_filenames())
         
@@ -321,7 +533,7 @@ class DatabaseManager:
         
         columns_dict = {}
         for table_name in valid_tables:
-            columns_dict[f'{table_name}'] = data_dict[table_name].columns.tolist()
+            columns_dict[f'{table_name}'] = catalog.column_names(table_name)
                     
         return columns_dict
     
@@ -356,56 +568,35 @@ class DatabaseManager:
             connection.commit()
             print("Database information created successfully.")
 
-    def save_info_vectordb(self):
+    def save_info_vectordb(self, rebuild: bool = False):
         """
         将数据库信息数据库保存为向量数据库的形式，使用 ChromaDB。
         """
+        manifest = self.get_index_manifest()
+        run = manifest.begin_run("save_info_vectordb")
         try:
             sqlite_path = str(self.sqlite_path).replace(".sqlite", "_info.sqlite")
             with sqlite3.connect(sqlite_path) as connection:
                 cursor = connection.cursor()
                 
-                collections = self.client.list_collections()
-                for collection in collections:
-                    if collection.name in ['table_info', 'column_info']:
-                        self.client.delete_collection(collection.name)
-                
-                cursor.execute("SELECT DISTINCT table_name FROM info;")
-                tables = cursor.fetchall()
-                tables = [i[0] for i in tables]
-                table_name = "table_info"
-                vector_store_table = manage_vector_store(self.client, table_name)
-
-                for idx, table in enumerate(tables):
-                    print(f"Embedding table '{str(table)}'...")
-                    embeddings, metadata, ids, docs = [], [], [], []
-                    embedding = self._embedding_function(str(table))
-                    embeddings.append(embedding)
-                    metadata.append({'index': idx, 'text': str(table)})
-                    ids.append(f"id{idx}")
-                    docs.append(str(table))
-                    if vector_store_table:    
-                        vector_store_table.add(embeddings=embeddings, metadatas=metadata, ids=ids, documents=docs)
-                    print(f"Table '{table}' has been embedded and stored in ChromaDB.")
-
-                column_name = "column_info"
-                vector_store_column = manage_vector_store(self.client, column_name)
-                cursor.execute("SELECT DISTINCT columns FROM info;")
-                columns = cursor.fetchall()
-                columns = [i[0] for i in columns]
-                for idx, column in enumerate(columns):
-                    print(f"Embedding column '{str(column)}'...")
-                    embeddings, metadata, ids, docs = [], [], [], []
-                    embedding = self._embedding_function(str(column))
-                    embeddings.append(embedding)
-                    metadata.append({'index': idx, 'text': str(column)})
-                    ids.append(f"id{idx}")
-                    docs.append(str(column))
-                    if vector_store_column:    
-                        vector_store_column.add(embeddings=embeddings, metadatas=metadata, ids=ids, documents=docs)
-                    print(f"Column '{column}' has been embedded and stored in ChromaDB.")
+                pipeline = self.embedding_pipeline()
+                for collection_name, info_column in [("table_info", "table_name"), ("column_info", "columns")]:
+                    cursor.execute(f"SELECT DISTINCT {info_column} FROM info;")
+                    values = [str(i[0]) for i in cursor.fetchall()]
+                    self.index_collection(
+                        manifest,
+                        pipeline,
+                        collection_name,
+                        values,
+                        [{'index': idx, 'text': value} for idx, value in enumerate(values)],
+                        [f"id{idx}" for idx in range(len(values))],
+                        rebuild=rebuild
+                    )
+            manifest.end_run(run)
         except Exception as e:
             print(f"Error saving vector database: {e}")
+            manifest.end_run(run, "failed", str(e))
+            raise
 
 
     def create_description_vectordb(self):
@@ -451,65 +642,34 @@ class DatabaseManager:
 
             connection.commit()
 
-    def save_description_vectordb(self):
+    def save_description_vectordb(self, rebuild: bool = False):
         """
         将数据库表描述数据库保存为向量数据库的形式，使用 ChromaDB。
         """
+        manifest = self.get_index_manifest()
+        run = manifest.begin_run("save_description_vectordb")
         try:
             sqlite_path = str(self.sqlite_path).replace(".sqlite", "_description.sqlite")
             with sqlite3.connect(sqlite_path) as connection:
-                cursor = connection.cursor()
-                
                 tables = self.get_table_description_filenames()
                 
-                collections = self.client.list_collections()
-                for collection in collections:
-                    if collection.name.endswith('_description'):
-                        self.client.delete_collection(collection.name)
-                
+                pipeline = self.embedding_pipeline()
                 for table in tables:
                     for column in ["original_column_name","column_name","column_description","value_description"]:
                         db_name = f"{table}_{column}_description"
-                        vector_db = manage_vector_store(self.client,db_name)
                         column_data = pd.read_sql_query(f'SELECT {column} FROM "{table}";', connection)
-                        embeddings, metadata, ids, docs = [], [], [], []
-                        for idx,row in column_data.iterrows():
-                            out_string = str(row[column])
-                            embedding = self._embedding_function(out_string)
-                            embeddings.append(embedding)
-                            metadata.append({'index': idx, 'text': out_string})
-                            ids.append(f"id{idx}")
-                            docs.append(str(row.to_list()))
-                        if vector_db:
-                            vector_db.add(embeddings=embeddings, metadatas=metadata, ids=ids, documents=docs)
-                        print(f"Column '{column}' of table '{table}' has been embedded and stored in ChromaDB.")
+                        texts = [str(value) for value in column_data[column].tolist()]
+                        metadata = [{'index': idx, 'text': text} for idx, text in enumerate(texts)]
+                        ids = [f"id{idx}" for idx in range(len(texts))]
+                        docs = [str([value]) for value in column_data[column].tolist()]
+                        self.index_collection(manifest, pipeline, db_name, texts, metadata, ids, docs, rebuild)
+            manifest.end_run(run)
         except Exception as e:
             print(f"Error saving vector database: {e}")
+            manifest.end_run(run, "failed", str(e))
+            raise
 
 
 if __name__ == '__main__':
-    db_name_list = ["battle_death", "car_1", "concert_singer", "course_teach", "cre_Doc_Template_Mgt", "dog_kennels", "employee_hire_evaluation", "flight_2", "museum_visit", "network_1", "orchestra", "pets_1", "poker_player", "real_estate_properties", "singer", "student_transcripts_tracking", "tvshow", "voter_1"]
-    # ["battle_death", "car_1", "concert_singer", "course_teach", "cre_Doc_Template_Mgt", "dog_kennels", "employee_hire_evaluation", "flight_2", "museum_visit", "network_1", "orchestra", "pets_1", "poker_player", "real_estate_properties", "singer", "student_transcripts_tracking", "tvshow", "voter_1", "world_1", "wta_1"]
-    # with open('database_progress.txt', 'a', encoding='utf-8') as f:
-    #     from datetime import datetime
-    #     f.write(f"\n=== Processing started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-        
-    #     for db_name in db_name_list:
-    #         db_manager = DatabaseManager(db_name)
-    #         key_dict = db_manager.get_table_columns_dict()
-    #         print(key_dict.keys())
-            
-            # db_manager.save_vectordb()
-            # f.write(f"Database '{db_name}' saved successfully.\n")
-            
-            # db_manager.create_info_database()
-            # db_manager.save_info_vectordb()
-            # f.write(f"Database information of '{db_name}' saved successfully.\n")
-            
-            # db_manager.create_description_vectordb()
-            # db_manager.save_description_vectordb()
-            # f.write(f"Database description of '{db_name}' saved successfully.\n")
-            
-            # f.write("-" * 50 + "\n")
-            # # 立即将内容写入文件
-            # f.flush()
\ No newline at end of file
+    # 本模块不直接执行索引任务，批量建索引请使用 python index_driver.py --help
+    print("DatabaseManager is a library module; run `python index_driver.py --help` to build indexes.")
@@ -0,0 +1,155 @@
+import os
+import re
+import difflib
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+ENCODINGS = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
+FUZZY_CUTOFF = 0.85
+
+_indexes: Dict[str, "DescriptionIndex"] = {}
+_lock = threading.Lock()
+
+
+def _normalize(name: str) -> str:
+    return str(name).strip().casefold()
+
+
+def _compact(name: str) -> str:
+    return re.sub(r'[\W_]+', '', _normalize(name))
+
+
+def _clean(value: Any) -> str:
+    return "" if value is None or pd.isna(value) else str(value)
+
+
+class TableDescription:
+    """单张表的列描述，按规范化列名建立哈希索引"""
+
+    def __init__(self, mtime: int, records: List[Dict[str, Any]]):
+        self.mtime = mtime
+        self.exact: Dict[str, Dict[str, str]] = {}
+        self.compact: Dict[str, Dict[str, str]] = {}
+        self._fuzzy_cache: Dict[str, Optional[Dict[str, str]]] = {}
+        for record in records:
+            name = record.get('original_column_name')
+            if name is None or pd.isna(name):
+                continue
+            info = {
+                "column_description": _clean(record.get('column_description')),
+                "value_description": _clean(record.get('value_description'))
+            }
+            # 同名列以文件中第一次出现为准
+            self.exact.setdefault(_normalize(name), info)
+            self.compact.setdefault(_compact(name), info)
+
+    def lookup(self, column_name: str) -> Optional[Dict[str, str]]:
+        """先精确匹配，再忽略标点/空白匹配，最后做相似度匹配"""
+        info = self.exact.get(_normalize(column_name))
+        if info is not None:
+            return info
+        key = _compact(column_name)
+        info = self.compact.get(key)
+        if info is not None:
+            return info
+        if key not in self._fuzzy_cache:
+            matches = difflib.get_close_matches(key, self.compact.keys(), n=1, cutoff=FUZZY_CUTOFF)
+            self._fuzzy_cache[key] = self.compact[matches[0]] if matches else None
+        return self._fuzzy_cache[key]
+
+
+class DescriptionIndex:
+    """
+    数据库的列描述索引，database_description/*.csv 只解析一次，
+    之后按文件 mtime 增量刷新，每列查询为 O(1)。
+    """
+
+    def __init__(self, db_name: str, description_path: Path):
+        self.db_name = db_name
+        self.description_path = Path(description_path)
+        self.tables: Dict[str, TableDescription] = {}
+        # 读取失败的文件及其 mtime：文件未变化时不再用每种编码重试
+        self._failed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _read_csv(self, file_path: Path) -> Optional[List[Dict[str, Any]]]:
+        for encoding in ENCODINGS:
+            try:
+                return pd.read_csv(file_path, encoding=encoding).to_dict(orient='records')
+            except UnicodeDecodeError:
+                continue
+            except Exception as e:
+                print(f"读取表{file_path.stem}时发生非编码错误: {str(e)}")
+                return None
+        print(f"表{file_path.stem}的描述文件无法使用任何编码读取")
+        return None
+
+    def _table(self, table_name: str) -> Optional[TableDescription]:
+        file_path = self.description_path / f"{table_name}.csv"
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            cached = self.tables.get(table_name)
+            if cached is not None and cached.mtime == mtime:
+                return cached
+            if mtime is None:
+                self.tables.pop(table_name, None)
+                self._failed.pop(table_name, None)
+                return None
+            if self._failed.get(table_name) == mtime:
+                return None
+            records = self._read_csv(file_path)
+            if records is None:
+                self.tables.pop(table_name, None)
+                self._failed[table_name] = mtime
+                return None
+            self._failed.pop(table_name, None)
+            table = TableDescription(mtime, records)
+            self.tables[table_name] = table
+            return table
+
+    def lookup(self, table_name: str, column_name: str) -> Optional[Dict[str, str]]:
+        table = self._table(table_name)
+        return table.lookup(column_name) if table is not None else None
+
+    def describe(self, tables_columns: Dict[str, List[str]]) -> Dict[str, Dict]:
+        """
+        批量查询列描述，供 TableAgent 与 SQLDesignerAgent 拼接提示词。
+
+        Args:
+            tables_columns (Dict[str, List[str]]): 表名到列名列表的映射。
+
+        Returns:
+            Dict[str, Dict]: 表名 -> 列名 -> {column_description, value_description}。
+        """
+        table_column_description = {}
+        for table_name, column_names in tables_columns.items():
+            table = self._table(table_name)
+            if table is None:
+                table_column_description[table_name] = {}
+                continue
+            column_description = {}
+            for column_name in column_names:
+                info = table.lookup(column_name)
+                column_description[column_name] = dict(info) if info else {
+                    "column_description": "",
+                    "value_description": ""
+                }
+            table_column_description[table_name] = column_description
+        return table_column_description
+
+
+def get_description_index(db_name: str, description_path: Path) -> DescriptionIndex:
+    """返回进程内共享的列描述索引"""
+    with _lock:
+        index = _indexes.get(db_name)
+        if index is None or index.description_path != Path(description_path):
+            index = DescriptionIndex(db_name, description_path)
+            _indexes[db_name] = index
+        return index
@@ -2,20 +2,21 @@ import pickle
 import chromadb
 import os
 
-def manage_vector_store(client, collection_name):
-    # 尝试删除已存在的向量库
-    try:
-        existing_collections = client.list_collections()
-        if collection_name in existing_collections:
-            client.delete_collection(name=collection_name)
-            print(f"Collection '{collection_name}' deleted.")
-    except Exception as e:
-        print(f"Error deleting collection '{collection_name}': {e}")
+def manage_vector_store(client, collection_name, reset=False):
+    # 默认增量更新已有向量库；reset=True 时删除后重建
+    if reset:
+        try:
+            existing_collections = [getattr(c, "name", c) for c in client.list_collections()]
+            if collection_name in existing_collections:
+                client.delete_collection(name=collection_name)
+                print(f"Collection '{collection_name}' deleted.")
+        except Exception as e:
+            print(f"Error deleting collection '{collection_name}': {e}")
 
-    # 创建新的向量库
+    # 获取或创建向量库
     try:
         vector_store = client.get_or_create_collection(name=collection_name)
-        print(f"Collection '{collection_name}' created.")
+        print(f"Collection '{collection_name}' ready.")
         return vector_store
     except Exception as e:
         print(f"Error creating collection '{collection_name}': {e}")
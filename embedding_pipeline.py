@@ -0,0 +1,376 @@
+import os
+import math
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Iterable, Callable
+
+import ollama
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "embedding_cache.sqlite")
+
+
+class OllamaEmbedder:
+    """通过 ollama.embed 批量请求嵌入向量"""
+
+    def __init__(self, model: str = "mxbai-embed-large"):
+        self.model = model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = ollama.embed(model=self.model, input=texts)
+        return [list(vector) for vector in response['embeddings']]
+
+
+class HashEmbedder:
+    """
+    确定性的本地替身嵌入器，不依赖任何服务，用于测试和基准。
+    相同文本永远得到相同的单位向量。
+    """
+
+    def __init__(self, dim: int = 64, model: str = "hash-embedder", latency: float = 0.0):
+        self.dim = dim
+        self.model = f"{model}-{dim}"
+        self.latency = latency
+        self.calls = 0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text: str) -> List[float]:
+        values = []
+        counter = 0
+        while len(values) < self.dim:
+            digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            values.extend(byte / 127.5 - 1.0 for byte in digest)
+            counter += 1
+        values = values[:self.dim]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+
+class EmbeddingCache:
+    """
+    按 (model, 文本哈希) 寻址的嵌入缓存，SQLite 持久化。
+    同一个值在任何列、任何数据库中只需嵌入一次。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as connection:
+            connection.execute('''CREATE TABLE IF NOT EXISTS embeddings (
+                                key TEXT PRIMARY KEY,
+                                model TEXT,
+                                dim INTEGER,
+                                vector BLOB
+                                )''')
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程一个连接；WAL 允许多个进程同时读写
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Iterable[str]) -> Dict[str, List[float]]:
+        keys = {self.key(model, text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        connection = self._conn()
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[keys[key]] = array('f', blob).tolist()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        rows = [
+            (self.key(model, text), model, len(vector), array('f', vector).tobytes())
+            for text, vector in vectors.items()
+        ]
+        with self._conn() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?,?,?,?)", rows
+            )
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(path: Optional[str] = None) -> EmbeddingCache:
+    """返回进程内共享的嵌入缓存（默认 data/embedding_cache.sqlite）"""
+    global _default_cache
+    if path is not None:
+        return EmbeddingCache(path)
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+class CachedEmbedder:
+    """
+    包装任意嵌入器：批内去重，先查内存中最近使用的向量，再查持久化缓存，
+    只把从未见过的文本发送给后端。
+    """
+
+    def __init__(self, embedder, cache: Optional[EmbeddingCache] = None, memo_size: int = 10000):
+        self.embedder = embedder
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.backend_calls = 0
+
+    @property
+    def model(self) -> str:
+        return self.embedder.model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        unique = list(dict.fromkeys(texts))
+        found = {}
+        with self._lock:
+            for text in unique:
+                vector = self._memo.get(text)
+                if vector is not None:
+                    self._memo.move_to_end(text)
+                    found[text] = vector
+
+        missing = []
+        pending = [text for text in unique if text not in found]
+        if pending:
+            found.update(self.cache.get_many(self.model, pending))
+            missing = [text for text in pending if text not in found]
+        if missing:
+            new_vectors = dict(zip(missing, self.embedder.embed(missing)))
+            self.cache.put_many(self.model, new_vectors)
+            found.update(new_vectors)
+
+        with self._lock:
+            self.backend_calls += 1 if missing else 0
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+            for text in unique:
+                self._memo[text] = found[text]
+                self._memo.move_to_end(text)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return [found[text] for text in texts]
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return (f"{self.misses} values embedded in {self.backend_calls} backend calls, "
+                f"{self.hits} reused ({rate:.1f}% hit rate)")
+
+
+class RateLimiter:
+    """
+    全局请求速率限制：相邻两次请求至少间隔 1/rate 秒，并限制同时在途的请求数。
+    传入 multiprocessing 的共享对象即可跨进程生效。
+    """
+
+    def __init__(self, rate: Optional[float] = None, max_inflight: Optional[int] = None,
+                 next_slot=None, lock=None, inflight=None):
+        self.rate = rate
+        self.next_slot = next_slot
+        self.lock = lock if lock is not None else threading.Lock()
+        self._local_next = 0.0
+        if inflight is None and max_inflight:
+            inflight = threading.BoundedSemaphore(max_inflight)
+        self.inflight = inflight
+
+    def _reserve(self) -> float:
+        with self.lock:
+            now = time.time()
+            current = self.next_slot.value if self.next_slot is not None else self._local_next
+            slot = max(now, current)
+            following = slot + 1.0 / self.rate
+            if self.next_slot is not None:
+                self.next_slot.value = following
+            else:
+                self._local_next = following
+            return slot - now
+
+    def __enter__(self):
+        if self.rate:
+            delay = self._reserve()
+            if delay > 0:
+                time.sleep(delay)
+        if self.inflight is not None:
+            self.inflight.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        if self.inflight is not None:
+            self.inflight.release()
+        return False
+
+
+class RateLimitedEmbedder:
+    """对后端嵌入请求施加全局速率限制"""
+
+    def __init__(self, embedder, limiter: RateLimiter):
+        self.embedder = embedder
+        self.limiter = limiter
+
+    @property
+    def model(self) -> str:
+        return self.embedder.model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        with self.limiter:
+            return self.embedder.embed(texts)
+
+
+@dataclass
+class EmbeddingStats:
+    texts: int = 0
+    batches: int = 0
+    embed_seconds: float = 0.0
+    add_seconds: float = 0.0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.texts / self.elapsed if self.elapsed else 0.0
+
+    def merge(self, other: "EmbeddingStats") -> None:
+        self.texts += other.texts
+        self.batches += other.batches
+        self.embed_seconds += other.embed_seconds
+        self.add_seconds += other.add_seconds
+        self.elapsed += other.elapsed
+
+    def __str__(self) -> str:
+        return (f"{self.texts} texts in {self.batches} batches, {self.elapsed:.2f}s "
+                f"(embed {self.embed_seconds:.2f}s, store {self.add_seconds:.2f}s, "
+                f"{self.throughput:.1f} texts/s)")
+
+
+class EmbeddingPipeline:
+    """
+    批量嵌入流水线：文本按 batch_size 分批发送给嵌入后端，最多 concurrency 批同时在途；
+    写入向量库在后台线程中按原顺序进行，与后续批次的嵌入请求重叠。
+    """
+
+    def __init__(self, embedder, batch_size: int = 64, queue_depth: int = 2, concurrency: int = 1):
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+        self.concurrency = max(1, concurrency)
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self.embedder.embed(texts[start:start + self.batch_size]))
+        return embeddings
+
+    def run(self, vector_store, texts: List[str], metadatas: List[Dict[str, Any]],
+            ids: List[str], documents: Optional[List[str]] = None,
+            on_chunk: Optional[Callable[[int], None]] = None) -> EmbeddingStats:
+        """
+        嵌入 texts 并分块 upsert 到 vector_store。
+
+        Args:
+            vector_store: ChromaDB collection，为 None 时只做嵌入。
+            texts (List[str]): 待嵌入文本。
+            metadatas (List[Dict[str, Any]]): 与 texts 一一对应的元数据。
+            ids (List[str]): 与 texts 一一对应的 id。
+            documents (Optional[List[str]]): 与 texts 一一对应的文档，默认使用 texts。
+            on_chunk (Optional[Callable[[int], None]]): 每块写入成功后回调，参数为已写入的文本数。
+
+        Returns:
+            EmbeddingStats: 吞吐统计。
+        """
+        if documents is None:
+            documents = texts
+        stats = EmbeddingStats()
+        start_time = time.perf_counter()
+        chunks: "queue.Queue" = queue.Queue(maxsize=self.queue_depth)
+        errors = []
+
+        def writer():
+            while True:
+                item = chunks.get()
+                if item is None:
+                    return
+                if errors:
+                    continue
+                end, chunk = item
+                add_start = time.perf_counter()
+                try:
+                    vector_store.upsert(**chunk)
+                    if on_chunk is not None:
+                        on_chunk(end)
+                except Exception as e:
+                    errors.append(e)
+                stats.add_seconds += time.perf_counter() - add_start
+
+        def embed_batch(batch: List[str]):
+            embed_start = time.perf_counter()
+            embeddings = self.embedder.embed(batch)
+            return embeddings, time.perf_counter() - embed_start
+
+        def hand_off(start: int, end: int, future) -> None:
+            embeddings, seconds = future.result()
+            stats.embed_seconds += seconds
+            stats.batches += 1
+            stats.texts += len(embeddings)
+            if vector_store is not None:
+                chunks.put((end, {
+                    "embeddings": embeddings,
+                    "metadatas": metadatas[start:end],
+                    "ids": ids[start:end],
+                    "documents": documents[start:end],
+                }))
+
+        writer_thread = threading.Thread(target=writer, name="vector-store-writer", daemon=True)
+        writer_thread.start()
+        embed_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed")
+        in_flight = deque()
+        try:
+            for start in range(0, len(texts), self.batch_size):
+                if errors:
+                    break
+                end = min(start + self.batch_size, len(texts))
+                in_flight.append((start, end, embed_pool.submit(embed_batch, texts[start:end])))
+                # 按提交顺序交给写入线程，保证水位线单调递增
+                if len(in_flight) >= self.concurrency:
+                    hand_off(*in_flight.popleft())
+            while in_flight and not errors:
+                hand_off(*in_flight.popleft())
+        finally:
+            for _, _, future in in_flight:
+                future.cancel()
+            embed_pool.shutdown(wait=True)
+            chunks.put(None)
+            writer_thread.join()
+        stats.elapsed = time.perf_counter() - start_time
+        if errors:
+            raise errors[0]
+        return stats
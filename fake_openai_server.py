@@ -0,0 +1,132 @@
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+FINAL_ANSWER_MARKER = "Please provide the final answer"
+SINGLE_CALL_MARKER = "COMPLETE reasoning in a single response"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    本地假 OpenAI 兼容接口，用于基准测试。
+    按请求中已有的 assistant 消息数逐步返回 ReasoningStep JSON，
+    第 `steps` 步返回 final_answer 与 final_sql。
+    """
+    latency = 0.1
+    steps = 3
+    final_sql = "SELECT COUNT(*) FROM Patient WHERE SEX = 'M';"
+    # HTTP/1.1 才能复用长连接
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            body = self._chat_completion(payload)
+        else:
+            self.send_error(404)
+            return
+
+        time.sleep(self.latency)
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chat_completion(self, payload: dict) -> dict:
+        messages = payload.get("messages", [])
+        # 由历史中出现过的 "Step N" 标题推断当前步数，较早的步骤可能已被压缩成摘要
+        previous = [int(n) for m in messages if m.get("role") == "assistant"
+                    for n in re.findall(r"Step (\d+)", str(m.get("content", "")))]
+        step = max(previous, default=0) + 1
+        last = messages[-1].get("content", "") if messages else ""
+
+        system = messages[0].get("content", "") if messages else ""
+
+        if SINGLE_CALL_MARKER in str(system):
+            steps = [{"title": f"Step {i}", "content": "Examining the schema and the hint.", "next_action": "continue"}
+                     for i in range(1, self.steps)]
+            steps.append({"title": f"Step {self.steps}", "content": "Finalizing the SQL query.",
+                          "next_action": "final_answer", "final_sql": self.final_sql})
+            content = {"steps": steps, "final_sql": self.final_sql}
+        elif FINAL_ANSWER_MARKER in str(last):
+            content = {"title": "Final Answer", "content": f"FINAL SQL: {self.final_sql}"}
+        elif step >= self.steps:
+            content = {
+                "title": f"Step {step}",
+                "content": "Finalizing the SQL query.",
+                "next_action": "final_answer",
+                "final_sql": self.final_sql,
+            }
+        else:
+            content = {
+                "title": f"Step {step}",
+                "content": "Examining the schema and the hint.",
+                "next_action": "continue",
+            }
+
+        text = json.dumps(content)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens = len(text) // 4
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+
+def start_fake_server(latency: float = 0.1, steps: int = 3, final_sql: Optional[str] = None,
+                      host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    在后台线程启动假服务器。
+
+    Returns:
+        Tuple[ThreadingHTTPServer, str]: 服务器对象和可用作 OPENAI_API_BASE 的地址。
+    """
+    attrs = {"latency": latency, "steps": steps}
+    if final_sql:
+        attrs["final_sql"] = final_sql
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), attrs)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地假 OpenAI 兼容接口")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--steps", type=int, default=3)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(args.latency, args.steps, port=args.port)
+    print(f"Fake OpenAI endpoint listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,371 @@
+import os
+import re
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+from contextlib import closing
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from connection_pool import get_connection_pool
+from query_plan import explain_query_plan, analyze_plan
+from schema_catalog import get_schema_catalog
+from sql_executor import SandboxedExecutor
+
+DATA_DIR = Path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+_IDENTIFIER = r'"(?:[^"]|"")+"|`[^`]+`|\[[^\]]+\]|[A-Za-z_][\w]*'
+_OPERAND = rf"(?:{_IDENTIFIER})(?:\.(?:{_IDENTIFIER}))?|'(?:[^']|'')*'|-?\d+(?:\.\d+)?|\?"
+_COMPARISON = re.compile(
+    rf"({_OPERAND})\s*(<=|>=|<>|!=|==|=|<|>|\bNOT\s+IN\b|\bIN\b|\bBETWEEN\b|\bNOT\s+LIKE\b|\bLIKE\b|\bIS\b)\s*({_OPERAND}|\()",
+    re.IGNORECASE
+)
+# 用零宽前瞻逐个位置匹配，避免 "FROM Patient" 先被吃掉而漏掉 "Patient AS T1"
+_TABLE_ALIAS = re.compile(rf'(?<![\w"`\]])(?=({_IDENTIFIER}|[A-Za-z_][\w-]*)(?:\s+AS)?\s+([A-Za-z_]\w*))', re.IGNORECASE)
+_KEYWORDS = {
+    "on", "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "group", "order", "limit",
+    "union", "as", "using", "and", "or", "having", "select", "from", "except", "intersect", "window", "offset",
+}
+_EQUALITY_OPERATORS = {"=", "==", "in", "is"}
+_RANGE_OPERATORS = {"<", ">", "<=", ">=", "between", "like"}
+_USED_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\S+)")
+# 通过非覆盖索引查找的表，例如 SEARCH T2 USING INDEX sqlite_autoindex_Laboratory_1 (ID=?)
+_INDEX_LOOKUP = re.compile(r"^SEARCH (?:TABLE )?(\S+)(?: AS (\S+))? USING INDEX ")
+_BIRD_SEPARATOR = "\t----- bird -----\t"
+
+
+def _unquote(identifier: str) -> str:
+    if identifier[:1] in ('"', "`", "["):
+        return identifier[1:-1].replace('""', '"')
+    return identifier
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def load_sql_log(path: Path) -> List[str]:
+    """
+    读取生成 SQL 的日志，去重后按首次出现的顺序返回。
+
+    支持三种格式：JSONL（每行一个对象，取 sql 或 final_sql 字段）；
+    JSON 对象或数组（BIRD 的 predict.json，值形如 "SQL\\t----- bird -----\\tdb_name"）；
+    其他文本按完整语句切分（以分号结尾），没有分号时每个非空行是一条 SQL。
+    """
+    text = Path(path).read_text(encoding="utf-8")
+    sqls = []
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+
+    if isinstance(data, (dict, list)):
+        values = data.values() if isinstance(data, dict) else data
+        for value in values:
+            if isinstance(value, dict):
+                value = value.get("sql") or value.get("final_sql") or ""
+            sqls.append(str(value).split(_BIRD_SEPARATOR)[0])
+    elif str(path).endswith(".jsonl"):
+        for line in text.splitlines():
+            if line.strip():
+                record = json.loads(line)
+                sqls.append(record.get("sql") or record.get("final_sql") or "")
+    elif ";" not in text:
+        sqls = text.splitlines()
+    else:
+        buffer = ""
+        for line in text.splitlines(keepends=True):
+            buffer += line
+            if sqlite3.complete_statement(buffer):
+                sqls.append(buffer)
+                buffer = ""
+        sqls.append(buffer)
+
+    unique = []
+    for sql in sqls:
+        sql = sql.strip().rstrip(";").strip()
+        if sql and "REJECTED" not in sql and sql not in unique:
+            unique.append(sql)
+    return unique
+
+
+class IndexAdvisor:
+    """
+    离线索引顾问：对一组 SQL 执行 EXPLAIN QUERY PLAN，为被全表扫描或在连接内层逐行扫描的表
+    提出索引（等值列在前，最多一个范围列，列数允许时补齐查询读取的其他列成为覆盖索引），
+    可选地在数据库副本中创建这些索引，丢弃查询计划没有用到的索引，并测量每个查询的加速比。
+    """
+
+    def __init__(self, db_name: str, sqlite_path: Optional[Path] = None, max_index_columns: int = 6,
+                 timeout: float = 30.0, timing_runs: int = 3):
+        """
+        Args:
+            db_name (str): 数据库名称。
+            sqlite_path (Optional[Path]): 源数据库路径，默认 data/<db>/<db>.sqlite。
+            max_index_columns (int): 覆盖索引最多包含的列数，超出时只保留键列。
+            timeout (float): 测量时单次查询的时间预算（秒）。
+            timing_runs (int): 测量热缓存耗时的重复次数。
+        """
+        self.db_name = db_name
+        self.sqlite_path = Path(sqlite_path or DATA_DIR / db_name / f"{db_name}.sqlite")
+        self.max_index_columns = max_index_columns
+        self.timing_runs = timing_runs
+        self.executor = SandboxedExecutor(timeout=timeout, max_rows=0)
+        catalog = get_schema_catalog(db_name, self.sqlite_path)
+        self.columns = {
+            table: [column["name"] for column in info["columns"]]
+            for table, info in catalog.tables.items()
+        }
+        self._tables = {table.lower(): table for table in self.columns}
+
+    def _column(self, table: str, name: str) -> Optional[str]:
+        """按 SQLite 的规则不区分大小写地解析列名"""
+        for column in self.columns.get(table, []):
+            if column.lower() == name.lower():
+                return column
+        return None
+
+    def _aliases(self, sql: str) -> Dict[str, str]:
+        aliases = {lower: table for lower, table in self._tables.items()}
+        for match in _TABLE_ALIAS.finditer(sql):
+            table = self._tables.get(_unquote(match.group(1)).lower())
+            alias = match.group(2)
+            if table and alias.lower() not in _KEYWORDS:
+                aliases[alias.lower()] = table
+        return aliases
+
+    def _read_columns(self, connection: sqlite3.Connection, sql: str) -> Dict[str, Set[str]]:
+        """借助 authorizer 收集编译语句时读取的每个表的列，不需要解析 SQL"""
+        reads = defaultdict(set)
+
+        def authorizer(action, table, column, *args):
+            if action == sqlite3.SQLITE_READ and table in self.columns and column:
+                reads[table].add(column)
+            return sqlite3.SQLITE_OK
+
+        connection.set_authorizer(authorizer)
+        try:
+            connection.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        finally:
+            connection.set_authorizer(None)
+        return reads
+
+    def _resolve(self, operand: str, aliases: Dict[str, str], tables: List[str]) -> Optional[Tuple[str, str]]:
+        """把比较中的一侧解析成 (表, 列)；字面量、无法确定归属的列返回 None"""
+        match = re.fullmatch(rf"(?:({_IDENTIFIER})\.)?({_IDENTIFIER})", operand)
+        if not match or operand[0] == "'":
+            return None
+        qualifier, name = match.group(1), _unquote(match.group(2))
+        if qualifier:
+            table = aliases.get(_unquote(qualifier).lower())
+            column = self._column(table, name) if table else None
+            return (table, column) if column else None
+        owners = [(table, self._column(table, name)) for table in tables if self._column(table, name)]
+        return owners[0] if len(owners) == 1 else None
+
+    def _predicates(self, sql: str, tables: List[str]) -> Dict[str, Dict[str, List[str]]]:
+        """按表整理 WHERE / ON 中的等值过滤列、范围过滤列和连接列"""
+        aliases = self._aliases(sql)
+        predicates = defaultdict(lambda: {"equality": [], "range": [], "join": []})
+        for left, operator, right in _COMPARISON.findall(sql):
+            operator = " ".join(operator.lower().split())
+            left_ref = self._resolve(left, aliases, tables)
+            right_ref = self._resolve(right, aliases, tables) if right != "(" else None
+            if left_ref and right_ref:
+                if operator in _EQUALITY_OPERATORS and left_ref[0] != right_ref[0]:
+                    for table, column in (left_ref, right_ref):
+                        if column not in predicates[table]["join"]:
+                            predicates[table]["join"].append(column)
+                continue
+            ref = left_ref or right_ref
+            if ref is None:
+                continue
+            kind = "equality" if operator in _EQUALITY_OPERATORS else "range" if operator in _RANGE_OPERATORS else None
+            if kind and ref[1] not in predicates[ref[0]][kind]:
+                predicates[ref[0]][kind].append(ref[1])
+        return predicates
+
+    def _index_columns(self, keys: List[str], reads: Set[str]) -> List[str]:
+        columns = list(dict.fromkeys(keys))
+        extra = [column for column in sorted(reads) if column not in columns]
+        if len(columns) + len(extra) <= self.max_index_columns:
+            columns += extra
+        return columns
+
+    def analyze(self, sql: str) -> Dict[str, Any]:
+        """
+        分析一条 SQL：查询计划、被扫描的表和建议的索引。
+
+        Returns:
+            Dict[str, Any]: sql、plan、full_scans、missing_index_joins、proposals（表和列列表），出错时带 error。
+        """
+        with get_connection_pool(self.sqlite_path, self.db_name).connection() as connection:
+            try:
+                plan = analyze_plan(explain_query_plan(connection, sql))
+                reads = self._read_columns(connection, sql)
+            except sqlite3.Error as e:
+                return {"sql": sql, "error": str(e), "proposals": []}
+
+        aliases = self._aliases(sql)
+        scanned = {aliases.get(name.lower(), name) for name in plan["full_scans"] + plan["missing_index_joins"]}
+        # 已经按索引查找、但每行还要回表检查其他过滤条件的表，也值得一个包含过滤列的索引
+        lookups = set()
+        for detail in plan["plan"]:
+            match = _INDEX_LOOKUP.match(detail)
+            if match:
+                name = match.group(2) or match.group(1)
+                lookups.add(aliases.get(name.lower(), name))
+        predicates = self._predicates(sql, list(reads))
+        proposals = []
+        for table in sorted(scanned | lookups):
+            if table not in self.columns:
+                continue
+            found = predicates.get(table, {"equality": [], "range": [], "join": []})
+            filters = found["equality"] + found["range"][:1]
+            if table not in scanned and not filters:
+                continue
+            # 过滤索引服务于外层扫描，连接索引服务于连接内层的逐行查找；最终以查询计划是否使用为准
+            for keys in (filters, found["join"] + filters):
+                if keys:
+                    columns = self._index_columns(keys, reads.get(table, set()))
+                    if {"table": table, "columns": columns} not in proposals:
+                        proposals.append({"table": table, "columns": columns})
+        return {"sql": sql, **plan, "proposals": proposals, "error": None}
+
+    @staticmethod
+    def _merge(proposals: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """去掉列序列是其他建议前缀的索引"""
+        merged = []
+        for proposal in sorted(proposals, key=lambda item: -len(item["columns"])):
+            if not any(other["table"] == proposal["table"] and other["columns"][:len(proposal["columns"])] == proposal["columns"]
+                       for other in merged):
+                merged.append(proposal)
+        for proposal in merged:
+            digest = hashlib.sha1("\0".join([proposal["table"], *proposal["columns"]]).encode("utf-8")).hexdigest()[:8]
+            name = re.sub(r"\W+", "_", f"{proposal['table']}_{'_'.join(proposal['columns'][:3])}")
+            proposal["name"] = f"idx_advisor_{name}_{digest}"
+            proposal["ddl"] = (f"CREATE INDEX IF NOT EXISTS {_quote(proposal['name'])} ON {_quote(proposal['table'])} "
+                               f"({', '.join(_quote(column) for column in proposal['columns'])})")
+        return merged
+
+    def _timing(self, sqlite_path: Path, sql: str) -> Dict[str, Any]:
+        first = self.executor.execute(sqlite_path, sql)
+        if first["status"] != "ok":
+            return {"status": first["status"], "time": first["execution_time"], "fingerprint": None}
+        measured = self.executor.measure(sqlite_path, sql, self.timing_runs)
+        return {"status": "ok", "time": measured["warm_time"] or first["execution_time"],
+                "fingerprint": first["fingerprint"]}
+
+    def run(self, sqls: List[str], apply: bool = False, output_path: Optional[Path] = None) -> Dict[str, Any]:
+        """
+        分析全部 SQL 并汇总索引建议；apply 时在副本中建索引并测量每个查询的加速比。
+
+        Args:
+            sqls (List[str]): 要回放的 SQL。
+            apply (bool): 是否在副本中创建索引并测量。
+            output_path (Optional[Path]): 副本路径，默认 data/<db>/<db>_indexed.sqlite。
+
+        Returns:
+            Dict[str, Any]: queries（每条 SQL 的计划、建议和测量结果）、indexes（合并后的索引及使用次数）、output_path。
+        """
+        queries = [self.analyze(sql) for sql in sqls]
+        indexes = self._merge([proposal for query in queries for proposal in query["proposals"]])
+        report = {"db_name": self.db_name, "queries": queries, "indexes": indexes, "output_path": None}
+        if not apply or not indexes:
+            return report
+
+        output_path = Path(output_path or self.sqlite_path.with_name(f"{self.db_name}_indexed.sqlite"))
+        start = time.perf_counter()
+        tmp_path = f"{output_path}.tmp"
+        shutil.copyfile(self.sqlite_path, tmp_path)
+        # sqlite3 连接的 with 只负责提交，不会关闭连接；Windows 上未关闭的文件不能被 os.replace 覆盖
+        with closing(sqlite3.connect(tmp_path)) as connection:
+            for index in indexes:
+                connection.execute(index["ddl"])
+            connection.execute("ANALYZE")
+            # 只保留新查询计划实际用到的索引
+            used = defaultdict(int)
+            for query in queries:
+                if query["error"]:
+                    continue
+                plan = [step["detail"] for step in explain_query_plan(connection, query["sql"])]
+                query["indexed_plan"] = plan
+                query["indexes_used"] = sorted({match for detail in plan for match in _USED_INDEX.findall(detail)
+                                                if match.startswith("idx_advisor_")})
+                for name in query["indexes_used"]:
+                    used[name] += 1
+            for index in indexes:
+                index["queries"] = used.get(index["name"], 0)
+                if not index["queries"]:
+                    connection.execute(f"DROP INDEX {_quote(index['name'])}")
+            connection.commit()
+        os.replace(tmp_path, output_path)
+        print(f"Created {sum(1 for index in indexes if index['queries'])}/{len(indexes)} indexes in "
+              f"{output_path} ({time.perf_counter() - start:.1f}s)")
+
+        for query in queries:
+            if query["error"] or not query.get("indexes_used"):
+                continue
+            before = self._timing(self.sqlite_path, query["sql"])
+            after = self._timing(output_path, query["sql"])
+            query["before"] = before
+            query["after"] = after
+            query["same_result"] = before["fingerprint"] == after["fingerprint"]
+            if before["time"] and after["time"]:
+                query["speedup"] = before["time"] / after["time"]
+        report["output_path"] = str(output_path)
+        return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    for i, query in enumerate(report["queries"], 1):
+        print(f"\n#{i} {query['sql'][:120]}")
+        if query["error"]:
+            print(f"  error: {query['error']}")
+            continue
+        print(f"  plan: {' | '.join(query['plan'])}")
+        if query.get("indexes_used"):
+            print(f"  indexed plan: {' | '.join(query['indexed_plan'])}")
+        if "before" in query:
+            before, after = query["before"], query["after"]
+            speedup = f"x{query['speedup']:.1f}" if "speedup" in query else "n/a"
+            before_time = f"{before['time'] * 1000:.2f}ms" if before["time"] is not None else "n/a"
+            after_time = f"{after['time'] * 1000:.2f}ms" if after["time"] is not None else "n/a"
+            print(f"  {before_time} ({before['status']}) -> {after_time} ({after['status']})  {speedup}"
+                  f"{'' if query['same_result'] else '  RESULT MISMATCH'}")
+
+    print("\nProposed indexes:")
+    for index in report["indexes"]:
+        usage = f"  -- used by {index['queries']} queries" if "queries" in index else ""
+        print(f"  {index['ddl']};{usage}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="回放生成的 SQL，根据 EXPLAIN QUERY PLAN 建议（并可在副本中创建）覆盖索引")
+    parser.add_argument("db_name", help="data/ 下的数据库名称")
+    parser.add_argument("log", help="SQL 日志：JSONL（sql / final_sql 字段）、BIRD predict.json 或 .sql 文本")
+    parser.add_argument("--sqlite", default=None, help="源数据库路径，默认 data/<db>/<db>.sqlite")
+    parser.add_argument("--apply", action="store_true", help="在数据库副本中创建索引并测量加速比")
+    parser.add_argument("--output", default=None, help="副本路径，默认 data/<db>/<db>_indexed.sqlite")
+    parser.add_argument("--max-index-columns", type=int, default=6, help="覆盖索引最多包含的列数")
+    parser.add_argument("--timeout", type=float, default=30.0, help="测量时单次查询的时间预算（秒）")
+    parser.add_argument("--runs", type=int, default=3, help="测量热缓存耗时的重复次数")
+    parser.add_argument("--report", default=None, help="把完整报告写成 JSON")
+    args = parser.parse_args(argv)
+
+    advisor = IndexAdvisor(args.db_name, args.sqlite, args.max_index_columns, args.timeout, args.runs)
+    sqls = load_sql_log(args.log)
+    print(f"Replaying {len(sqls)} distinct SQL statements against {advisor.sqlite_path}")
+    report = advisor.run(sqls, apply=args.apply, output_path=args.output)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Sequence
+
+from embedding_pipeline import OllamaEmbedder, HashEmbedder, CachedEmbedder, RateLimiter, RateLimitedEmbedder
+
+STAGES = ("lexical", "lsh", "values", "info", "description")
+
+# 每个工作进程内的全局限速器，由 _init_worker 注入共享状态
+_limiter: Optional[RateLimiter] = None
+
+
+def _init_worker(rate_limit, next_slot, lock, inflight) -> None:
+    global _limiter
+    if rate_limit or inflight is not None:
+        _limiter = RateLimiter(rate_limit, next_slot=next_slot, lock=lock, inflight=inflight)
+
+
+def _make_embedder(embedder: str, model: str):
+    if embedder == "hash":
+        return HashEmbedder()
+    return OllamaEmbedder(model)
+
+
+def index_database(db_name: str,
+                   stages: Sequence[str] = STAGES,
+                   embedder: str = "ollama",
+                   model: str = "mxbai-embed-large",
+                   batch_size: int = 64,
+                   concurrency: int = 4,
+                   rebuild: bool = False) -> Dict[str, Any]:
+    """
+    在当前进程中为单个数据库构建向量索引。
+
+    Args:
+        db_name (str): 数据库名称。
+        stages (Sequence[str]): 要构建的索引：lexical / lsh / values / info / description。
+        embedder (str): 嵌入后端，ollama 或 hash（确定性替身）。
+        model (str): 嵌入模型名称。
+        batch_size (int): 每次嵌入请求的文本数。
+        concurrency (int): 单个数据库内同时在途的嵌入请求数。
+        rebuild (bool): 是否删除已有集合后完整重建。
+
+    Returns:
+        Dict[str, Any]: 耗时、嵌入缓存统计和 failed_stages（失败的阶段及错误信息，一个阶段失败不影响其他阶段）。
+    """
+    from databasemanager import DatabaseManager
+
+    start = time.perf_counter()
+    manager = DatabaseManager(db_name)
+    backend = _make_embedder(embedder, model)
+    if _limiter is not None:
+        backend = RateLimitedEmbedder(backend, _limiter)
+    manager.embedder = CachedEmbedder(backend)
+    manager.embedding_batch_size = batch_size
+    manager.embedding_concurrency = concurrency
+
+    steps = {
+        "lexical": lambda: manager.create_value_index(),
+        "lsh": lambda: manager.create_lsh_index(),
+        "values": lambda: manager.save_vectordb(rebuild=rebuild),
+        "info": lambda: (manager.create_info_database(), manager.save_info_vectordb(rebuild=rebuild)),
+        "description": lambda: (manager.create_description_vectordb(), manager.save_description_vectordb(rebuild=rebuild)),
+    }
+    failed_stages = {}
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        try:
+            steps[stage]()
+        except Exception as e:
+            print(f"Stage '{stage}' of '{db_name}' failed: {e}")
+            failed_stages[stage] = str(e)
+
+    return {
+        "db_name": db_name,
+        "elapsed": time.perf_counter() - start,
+        "embedding": str(manager.embedder),
+        "failed_stages": failed_stages,
+    }
+
+
+def index_databases(db_names: List[str],
+                    stages: Sequence[str] = STAGES,
+                    processes: Optional[int] = None,
+                    concurrency: int = 4,
+                    batch_size: int = 64,
+                    rate_limit: Optional[float] = None,
+                    max_inflight: Optional[int] = None,
+                    embedder: str = "ollama",
+                    model: str = "mxbai-embed-large",
+                    rebuild: bool = False) -> List[Dict[str, Any]]:
+    """
+    用进程池并行索引多个数据库。所有进程共享一个嵌入请求限速器：
+    rate_limit 限制每秒请求数，max_inflight 限制全局同时在途的请求数。
+
+    Returns:
+        List[Dict[str, Any]]: 每个已处理数据库的统计；failed_stages 非空的数据库计为失败。
+    """
+    if not db_names:
+        return []
+    # chromadb 和线程池都不是 fork 安全的，使用 spawn
+    ctx = multiprocessing.get_context("spawn")
+    next_slot = ctx.Value('d', 0.0, lock=False)
+    lock = ctx.Lock()
+    inflight = ctx.BoundedSemaphore(max_inflight) if max_inflight else None
+    processes = processes or min(len(db_names), os.cpu_count() or 1)
+
+    summaries = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_init_worker,
+                             initargs=(rate_limit, next_slot, lock, inflight)) as pool:
+        futures = {
+            pool.submit(index_database, db_name, tuple(stages), embedder, model, batch_size, concurrency, rebuild): db_name
+            for db_name in db_names
+        }
+        for future in as_completed(futures):
+            db_name = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"Error indexing database '{db_name}': {e}")
+                continue
+            summaries.append(summary)
+            if summary["failed_stages"]:
+                print(f"Database '{db_name}' failed stages {', '.join(summary['failed_stages'])} "
+                      f"in {summary['elapsed']:.1f}s: {summary['embedding']}")
+            else:
+                print(f"Database '{db_name}' indexed in {summary['elapsed']:.1f}s: {summary['embedding']}")
+
+    indexed = sum(1 for summary in summaries if not summary["failed_stages"])
+    print(f"Indexed {indexed}/{len(db_names)} databases in {time.perf_counter() - start:.1f}s")
+    return summaries
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="并行为多个数据库构建字面值索引、MinHash/LSH 列路由索引和 info / description / value 向量索引")
+    parser.add_argument("db_names", nargs="+", help="data/ 下的数据库名称")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--processes", type=int, default=None, help="并行处理的数据库数，默认 min(数据库数, CPU 数)")
+    parser.add_argument("--concurrency", type=int, default=4, help="单个数据库内同时在途的嵌入请求数")
+    parser.add_argument("--batch-size", type=int, default=64, help="每次嵌入请求的文本数")
+    parser.add_argument("--rate-limit", type=float, default=None, help="全局每秒嵌入请求数上限")
+    parser.add_argument("--max-inflight", type=int, default=None, help="全局同时在途的嵌入请求数上限")
+    parser.add_argument("--embedder", choices=["ollama", "hash"], default="ollama")
+    parser.add_argument("--model", default="mxbai-embed-large")
+    parser.add_argument("--rebuild", action="store_true", help="删除已有集合后完整重建")
+    args = parser.parse_args(argv)
+
+    summaries = index_databases(
+        args.db_names,
+        stages=args.stages,
+        processes=args.processes,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        rate_limit=args.rate_limit,
+        max_inflight=args.max_inflight,
+        embedder=args.embedder,
+        model=args.model,
+        rebuild=args.rebuild,
+    )
+    if sum(1 for summary in summaries if not summary["failed_stages"]) < len(args.db_names):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
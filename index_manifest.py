@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+MANIFEST_VERSION = 1
+MAX_RUN_HISTORY = 20
+
+
+def row_hash(text: str, doc: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """单行内容哈希（覆盖写入向量库的文本、文档和元数据），写入元数据，用于判断该行是否需要重新写入"""
+    payload = f"{text}\0{doc}"
+    if metadata is not None:
+        payload += "\0" + json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def content_fingerprint(row_hashes: List[str]) -> str:
+    """整个集合的内容指纹（按行顺序）"""
+    digest = hashlib.sha256()
+    for value in row_hashes:
+        digest.update(value.encode("ascii"))
+    return digest.hexdigest()
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class IndexManifest:
+    """
+    向量索引的结构化进度清单，替代原来的 database_progress.txt。
+    记录每个集合的内容指纹、行水位线和状态，中断后可从水位线继续。
+    """
+
+    def __init__(self, path: str, db_name: str, save_interval: float = 2.0):
+        self.path = str(path)
+        self.db_name = db_name
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self.data = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                return data
+        except (OSError, ValueError):
+            pass
+        return {"version": MANIFEST_VERSION, "db_name": self.db_name, "collections": {}, "runs": []}
+
+    def save(self, force: bool = True) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_save < self.save_interval:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._last_save = now
+
+    def entry(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        return self.data["collections"].get(collection_name)
+
+    def is_complete(self, collection_name: str, fingerprint: str) -> bool:
+        entry = self.entry(collection_name)
+        return entry is not None and entry["status"] == "complete" and entry["fingerprint"] == fingerprint
+
+    def resume_watermark(self, collection_name: str, fingerprint: str) -> int:
+        """相同内容的未完成任务从水位线继续，否则从 0 开始"""
+        entry = self.entry(collection_name)
+        if entry is not None and entry["status"] == "in_progress" and entry["fingerprint"] == fingerprint:
+            return entry["watermark"]
+        return 0
+
+    def start(self, collection_name: str, fingerprint: str, rows: int, watermark: int = 0) -> None:
+        with self._lock:
+            self.data["collections"][collection_name] = {
+                "fingerprint": fingerprint,
+                "rows": rows,
+                "watermark": watermark,
+                "status": "in_progress",
+                "updated_at": _now(),
+            }
+        self.save()
+
+    def advance(self, collection_name: str, watermark: int) -> None:
+        with self._lock:
+            entry = self.data["collections"][collection_name]
+            entry["watermark"] = max(entry["watermark"], watermark)
+            entry["updated_at"] = _now()
+        self.save(force=False)
+
+    def complete(self, collection_name: str) -> None:
+        with self._lock:
+            entry = self.data["collections"][collection_name]
+            entry["watermark"] = entry["rows"]
+            entry["status"] = "complete"
+            entry["updated_at"] = _now()
+        self.save()
+
+    def begin_run(self, task: str) -> Dict[str, Any]:
+        run = {"task": task, "started_at": _now(), "finished_at": None, "status": "running"}
+        with self._lock:
+            self.data["runs"] = (self.data["runs"] + [run])[-MAX_RUN_HISTORY:]
+        self.save()
+        return run
+
+    def end_run(self, run: Dict[str, Any], status: str = "complete", summary: str = "") -> None:
+        with self._lock:
+            run["finished_at"] = _now()
+            run["status"] = status
+            run["summary"] = summary
+        self.save()
@@ -0,0 +1,247 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, BaseMessage
+
+from result_cache import SQLiteLRUCache, DATA_DIR
+
+DEFAULT_LLM_CACHE_PATH = os.path.join(DATA_DIR, "llm_cache.sqlite")
+
+# 连接池参数，可通过环境变量或 configure_client_pool 修改
+_pool_config = {
+    "max_connections": int(os.getenv("NL2SQL_MAX_CONNECTIONS", "100")),
+    "max_keepalive_connections": int(os.getenv("NL2SQL_MAX_KEEPALIVE_CONNECTIONS", "20")),
+    "keepalive_expiry": float(os.getenv("NL2SQL_KEEPALIVE_EXPIRY", "60")),
+}
+
+_lock = threading.Lock()
+_sync_http_clients: Dict[Optional[str], httpx.Client] = {}
+_chat_models: Dict[Tuple, ChatOpenAI] = {}
+# 异步连接绑定在创建它的事件循环上，因此异步客户端和模型按事件循环分别缓存：id(loop) -> (loop, 异步客户端, 模型)。
+# 缓存的客户端本身会引用事件循环，弱引用键永远不会被回收，所以改为在每次获取时清理已关闭的事件循环
+_loop_caches: Dict[int, Tuple[asyncio.AbstractEventLoop, Dict[Optional[str], httpx.AsyncClient], Dict[Tuple, ChatOpenAI]]] = {}
+_closing_tasks = set()
+
+# 模型响应缓存默认关闭，可通过 NL2SQL_LLM_CACHE=1 或 configure_response_cache 打开
+_response_cache_config = {
+    "enabled": os.getenv("NL2SQL_LLM_CACHE", "0").lower() in ("1", "true", "yes"),
+    "cache_sampled": os.getenv("NL2SQL_LLM_CACHE_SAMPLED", "0").lower() in ("1", "true", "yes"),
+    "path": os.getenv("NL2SQL_LLM_CACHE_PATH", DEFAULT_LLM_CACHE_PATH),
+    "max_entries": int(os.getenv("NL2SQL_LLM_CACHE_MAX_ENTRIES", "50000")),
+    "max_bytes": int(os.getenv("NL2SQL_LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+}
+_response_cache: Optional[SQLiteLRUCache] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_pool_config["max_connections"],
+        max_keepalive_connections=_pool_config["max_keepalive_connections"],
+        keepalive_expiry=_pool_config["keepalive_expiry"],
+    )
+
+
+def configure_client_pool(max_connections: Optional[int] = None,
+                          max_keepalive_connections: Optional[int] = None,
+                          keepalive_expiry: Optional[float] = None) -> None:
+    """
+    修改连接池参数。已创建的客户端会被关闭，下次获取时按新参数重建。
+
+    Args:
+        max_connections (Optional[int]): 每个 base_url 的最大并发连接数。
+        max_keepalive_connections (Optional[int]): 保持长连接的最大数量。
+        keepalive_expiry (Optional[float]): 空闲长连接的保留时间（秒）。
+    """
+    if max_connections is not None:
+        _pool_config["max_connections"] = max_connections
+    if max_keepalive_connections is not None:
+        _pool_config["max_keepalive_connections"] = max_keepalive_connections
+    if keepalive_expiry is not None:
+        _pool_config["keepalive_expiry"] = keepalive_expiry
+    close_clients()
+
+
+def _evict_closed_loops() -> None:
+    """丢弃已关闭的事件循环对应的客户端和模型（它们的连接已无法使用），调用方需持有 _lock"""
+    for key in [key for key, (loop, _, _) in _loop_caches.items() if loop.is_closed()]:
+        del _loop_caches[key]
+
+
+def _aclose_on_loop(loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient) -> None:
+    """在客户端所属的事件循环上调用 aclose"""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if loop is running:
+        task = loop.create_task(client.aclose())
+        _closing_tasks.add(task)
+        task.add_done_callback(_closing_tasks.discard)
+    elif loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    else:
+        loop.run_until_complete(client.aclose())
+
+
+def close_clients() -> None:
+    """关闭并清空所有共享客户端；异步客户端在各自的事件循环上 aclose，已关闭的事件循环直接丢弃"""
+    with _lock:
+        sync_clients = list(_sync_http_clients.values())
+        loop_caches = list(_loop_caches.values())
+        _sync_http_clients.clear()
+        _chat_models.clear()
+        _loop_caches.clear()
+    for client in sync_clients:
+        client.close()
+    for loop, async_clients, _ in loop_caches:
+        if loop.is_closed():
+            continue
+        for client in async_clients.values():
+            _aclose_on_loop(loop, client)
+
+
+def get_chat_model(model: str = 'gpt-4o', temperature: float = 0.6, base_url: Optional[str] = None) -> ChatOpenAI:
+    """
+    返回进程内共享的 ChatOpenAI，按 (base_url, model, temperature) 复用，
+    同一 base_url 的所有模型共用一个带长连接的 HTTP 连接池。
+
+    Args:
+        model (str): 模型名称。
+        temperature (float): 采样温度。
+        base_url (Optional[str]): 接口地址，默认读取 OPENAI_API_BASE。
+
+    Returns:
+        ChatOpenAI: 共享的聊天模型客户端。
+    """
+    if base_url is None:
+        base_url = os.getenv("OPENAI_API_BASE")
+    key = (base_url, model, temperature)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    with _lock:
+        _evict_closed_loops()
+        if loop is None:
+            async_clients, models = {}, _chat_models
+        else:
+            _, async_clients, models = _loop_caches.setdefault(id(loop), (loop, {}, {}))
+        chat_model = models.get(key)
+        if chat_model is None:
+            sync_client = _sync_http_clients.get(base_url)
+            if sync_client is None:
+                sync_client = httpx.Client(limits=_limits())
+                _sync_http_clients[base_url] = sync_client
+
+            async_client = async_clients.get(base_url)
+            if async_client is None:
+                async_client = httpx.AsyncClient(limits=_limits())
+                async_clients[base_url] = async_client
+
+            chat_model = ChatOpenAI(
+                openai_api_base=base_url,
+                model=model,
+                temperature=temperature,
+                http_client=sync_client,
+                http_async_client=async_client,
+            )
+            models[key] = chat_model
+        return chat_model
+
+
+def configure_response_cache(enabled: bool = True,
+                             cache_sampled: Optional[bool] = None,
+                             path: Optional[str] = None,
+                             max_entries: Optional[int] = None,
+                             max_bytes: Optional[int] = None) -> None:
+    """
+    打开或关闭模型响应缓存。键为 (base_url, model, temperature, messages, sample) 的哈希。
+
+    Args:
+        enabled (bool): 是否启用缓存。
+        cache_sampled (Optional[bool]): 是否同时缓存 temperature > 0 的调用（例如 make_api_call）。
+            这些调用按 sample 编号分别缓存，重跑时每条候选链各自复现，候选之间的差异保持不变。
+        path (Optional[str]): 缓存文件路径，默认 data/llm_cache.sqlite。
+        max_entries (Optional[int]): 最大条目数。
+        max_bytes (Optional[int]): 响应内容总字节数上限。
+    """
+    global _response_cache
+    _response_cache_config["enabled"] = enabled
+    if cache_sampled is not None:
+        _response_cache_config["cache_sampled"] = cache_sampled
+    if path is not None:
+        _response_cache_config["path"] = path
+    if max_entries is not None:
+        _response_cache_config["max_entries"] = max_entries
+    if max_bytes is not None:
+        _response_cache_config["max_bytes"] = max_bytes
+    with _lock:
+        _response_cache = None
+
+
+def get_response_cache() -> Optional[SQLiteLRUCache]:
+    """返回共享的模型响应缓存，未启用时返回 None"""
+    global _response_cache
+    if not _response_cache_config["enabled"]:
+        return None
+    with _lock:
+        if _response_cache is None:
+            _response_cache = SQLiteLRUCache(
+                _response_cache_config["path"],
+                table="llm_responses",
+                max_entries=_response_cache_config["max_entries"],
+                max_bytes=_response_cache_config["max_bytes"],
+            )
+        return _response_cache
+
+
+def response_cache_key(model: str, temperature: float, messages: List[BaseMessage], sample: Optional[int] = None,
+                       options: Optional[Dict[str, Any]] = None, base_url: Optional[str] = None) -> str:
+    # 不同接口（例如本地替身和线上服务）可能使用同一个模型名，接口地址也计入键中
+    payload = json.dumps({
+        "base_url": base_url,
+        "model": model,
+        "temperature": temperature,
+        "messages": [[message.type, message.content] for message in messages],
+        "sample": sample,
+        "options": options or {},
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def acached_invoke(chat_model: ChatOpenAI, messages: List[BaseMessage], sample: Optional[int] = None,
+                         **options: Any) -> AIMessage:
+    """
+    带响应缓存的 chat_model.ainvoke。缓存未启用、或 temperature > 0 且未允许缓存采样调用时直接请求模型。
+
+    Args:
+        chat_model (ChatOpenAI): 聊天模型。
+        messages (List[BaseMessage]): 消息列表。
+        sample (Optional[int]): 同一提示的第几次采样，区分并行候选链。
+        **options: 透传给 ainvoke 的请求参数（例如 response_format），同时计入缓存键。
+
+    Returns:
+        AIMessage: 模型响应。
+    """
+    cache = get_response_cache()
+    temperature = chat_model.temperature or 0
+    if cache is None or (temperature > 0 and not _response_cache_config["cache_sampled"]):
+        return await chat_model.ainvoke(messages, **options)
+
+    key = response_cache_key(chat_model.model_name, temperature, messages, sample, options,
+                             chat_model.openai_api_base)
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return AIMessage(content=cached["content"], response_metadata={"cache": "hit"})
+
+    response = await chat_model.ainvoke(messages, **options)
+    await asyncio.to_thread(cache.put, key, {"content": response.content}, chat_model.model_name)
+    return response
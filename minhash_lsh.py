@@ -0,0 +1,221 @@
+import os
+import time
+import pickle
+import sqlite3
+import zlib
+from collections import defaultdict
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+INDEX_VERSION = 2
+MERSENNE_PRIME = (1 << 31) - 1
+# 分批计算签名，中间的 (shingle 数, num_perm) uint64 矩阵不随列的大小增长
+_SIGNATURE_BATCH = 1000
+# 把一个 band 的若干行签名折叠成 64 位桶键（FNV-1a 风格的乘法混合，uint64 运算自然按 2^64 回绕）
+_KEY_MULTIPLIER = np.uint64(0x100000001B3)
+_KEY_OFFSET = np.uint64(0xCBF29CE484222325)
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def shingles(value: str, k: int = 3) -> List[str]:
+    """字符 k-gram，两端补空格，保证短值（例如 'M'）也至少有一个 shingle"""
+    text = f" {str(value).strip().casefold()} "
+    if len(text) <= k:
+        return [text]
+    return [text[i:i + k] for i in range(len(text) - k + 1)]
+
+
+class MinHasher:
+    """向量化的 MinHash：h_i(x) = (a_i * x + b_i) mod p"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def _hash_values(self, items: List[str]) -> np.ndarray:
+        return np.array([zlib.crc32(item.encode("utf-8")) for item in items], dtype=np.uint64)
+
+    def signature(self, value: str) -> np.ndarray:
+        return self.signatures([value])[0]
+
+    def signatures(self, values: List[str]) -> np.ndarray:
+        """一次计算多个值的签名，返回 (len(values), num_perm) 矩阵"""
+        all_shingles, offsets = [], []
+        for value in values:
+            offsets.append(len(all_shingles))
+            all_shingles.extend(shingles(value))
+        hashes = self._hash_values(all_shingles) & np.uint64(0xFFFFFFFF)
+        permuted = (np.outer(hashes, self.a) + self.b) % np.uint64(MERSENNE_PRIME)
+        return np.minimum.reduceat(permuted, offsets, axis=0).astype(np.uint32)
+
+
+def band_keys(signatures: np.ndarray, bands: int) -> np.ndarray:
+    """把 (n, num_perm) 签名矩阵按 band 折叠成 (n, bands) 的 64 位桶键，band 编号计入键中"""
+    rows = signatures.shape[1] // bands
+    banded = signatures.reshape(len(signatures), bands, rows).astype(np.uint64)
+    keys = np.broadcast_to(_KEY_OFFSET ^ np.arange(bands, dtype=np.uint64), banded.shape[:2]).copy()
+    for row in range(rows):
+        keys = (keys ^ banded[:, :, row]) * _KEY_MULTIPLIER
+    return keys
+
+
+class ColumnLSHIndex:
+    """
+    列值的 MinHash/LSH 索引：每个去重值按 band 分桶，桶里记录包含该值的列；
+    另外为每列保存一个并集签名，用于估计列与列之间的值重合度。
+    关键词查询只需计算一次签名并查 bands 个桶，与列数无关。
+
+    桶以两个按键排序的数组保存：band_keys（uint64 桶键）和 band_columns（uint32 列号），
+    每个不同的 (桶键, 列) 占 12 字节，查询时二分查找。
+    """
+
+    def __init__(self, columns: List[Tuple[str, str]], column_signatures: np.ndarray,
+                 band_keys: np.ndarray, band_columns: np.ndarray, num_perm: int, bands: int,
+                 source_mtime: int = 0, source_size: int = 0):
+        self.columns = columns
+        self.column_signatures = column_signatures
+        self.band_keys = band_keys
+        self.band_columns = band_columns
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.source_mtime = source_mtime
+        self.source_size = source_size
+        self.hasher = MinHasher(num_perm)
+        self._column_ids = {column: idx for idx, column in enumerate(columns)}
+
+    @classmethod
+    def build(cls, sqlite_path: Path, tables_columns: Dict[str, List[str]], num_perm: int = 64,
+              bands: int = 16, max_values_per_column: int = 5000) -> "ColumnLSHIndex":
+        """
+        从源数据库构建索引，每列最多取 max_values_per_column 个去重值。
+
+        内存开销：每列最多 max_values_per_column * bands 个桶条目，每个 12 字节，
+        默认参数下每列不超过约 0.9 MB（同一列内重复的桶键只存一次，通常远小于上限）；并集签名每列 num_perm * 4 字节。
+
+        Args:
+            sqlite_path (Path): 源数据库路径。
+            tables_columns (Dict[str, List[str]]): 需要索引的表和列。
+            num_perm (int): MinHash 排列数。
+            bands (int): LSH band 数，num_perm 必须能被整除。
+            max_values_per_column (int): 每列参与索引的去重值上限。
+
+        Returns:
+            ColumnLSHIndex: 构建好的索引。
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        start = time.perf_counter()
+        stat = os.stat(sqlite_path)
+        hasher = MinHasher(num_perm)
+        columns, column_signatures = [], []
+        key_chunks, column_chunks = [], []
+
+        with closing(sqlite3.connect(f"{Path(sqlite_path).resolve().as_uri()}?mode=ro", uri=True)) as connection:
+            for table_name, column_names in tables_columns.items():
+                for column_name in column_names:
+                    column = _quote(column_name)
+                    values = [row[0] for row in connection.execute(
+                        f"SELECT DISTINCT CAST({column} AS TEXT) FROM {_quote(table_name)} "
+                        f"WHERE {column} IS NOT NULL LIMIT ?", (max_values_per_column,)
+                    )]
+                    values = [value for value in values if value is not None and value.strip()]
+                    col_id = len(columns)
+                    columns.append((table_name, column_name))
+                    if not values:
+                        column_signatures.append(np.full(num_perm, np.iinfo(np.uint32).max, dtype=np.uint32))
+                        continue
+                    signatures = np.vstack([hasher.signatures(values[i:i + _SIGNATURE_BATCH])
+                                            for i in range(0, len(values), _SIGNATURE_BATCH)])
+                    # 并集的 MinHash 等于各值签名逐位取最小
+                    column_signatures.append(signatures.min(axis=0))
+                    # 同一列内重复的桶键只保留一个
+                    keys = np.unique(band_keys(signatures, bands))
+                    key_chunks.append(keys)
+                    column_chunks.append(np.full(len(keys), col_id, dtype=np.uint32))
+
+        all_keys = np.concatenate(key_chunks) if key_chunks else np.empty(0, dtype=np.uint64)
+        all_columns = np.concatenate(column_chunks) if column_chunks else np.empty(0, dtype=np.uint32)
+        order = np.argsort(all_keys, kind="stable")
+        index = cls(columns, np.array(column_signatures, dtype=np.uint32).reshape(len(columns), num_perm),
+                    all_keys[order], all_columns[order], num_perm, bands, stat.st_mtime_ns, stat.st_size)
+        size_mb = (index.band_keys.nbytes + index.band_columns.nbytes) / (1024 * 1024)
+        print(f"MinHash/LSH index built: {len(columns)} columns, {len(all_keys)} bucket entries "
+              f"({size_mb:.1f} MB) in {time.perf_counter() - start:.2f}s")
+        return index
+
+    def save(self, path: Path) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "version": INDEX_VERSION,
+                "columns": self.columns,
+                "column_signatures": self.column_signatures,
+                "band_keys": self.band_keys,
+                "band_columns": self.band_columns,
+                "num_perm": self.num_perm,
+                "bands": self.bands,
+                "source_mtime": self.source_mtime,
+                "source_size": self.source_size,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["ColumnLSHIndex"]:
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if data.get("version") != INDEX_VERSION:
+            return None
+        return cls(data["columns"], data["column_signatures"], data["band_keys"], data["band_columns"],
+                   data["num_perm"], data["bands"], data["source_mtime"], data["source_size"])
+
+    def is_fresh(self, sqlite_path: Path) -> bool:
+        try:
+            stat = os.stat(sqlite_path)
+        except OSError:
+            return False
+        return stat.st_mtime_ns == self.source_mtime and stat.st_size == self.source_size
+
+    def route(self, keyword: str, columns: Optional[List[Tuple[str, str]]] = None,
+              top_n: int = 5) -> List[Tuple[Tuple[str, str], float]]:
+        """
+        把关键词路由到最可能包含相似值的列。
+
+        Args:
+            keyword (str): 关键词。
+            columns (Optional[List[Tuple[str, str]]]): 限定的 (表, 列)，默认全部列。
+            top_n (int): 最多返回的候选列数。
+
+        Returns:
+            List[Tuple[Tuple[str, str], float]]: (表, 列) 及命中 band 的比例，按比例降序。
+        """
+        allowed = None
+        if columns is not None:
+            allowed = {self._column_ids[c] for c in columns if c in self._column_ids}
+        hits = defaultdict(int)
+        keys = band_keys(self.hasher.signatures([keyword]), self.bands)[0]
+        starts = np.searchsorted(self.band_keys, keys, side="left")
+        ends = np.searchsorted(self.band_keys, keys, side="right")
+        for start, end in zip(starts, ends):
+            for col_id in self.band_columns[start:end].tolist():
+                if allowed is None or col_id in allowed:
+                    hits[col_id] += 1
+        ranked = sorted(hits.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        return [(self.columns[col_id], count / self.bands) for col_id, count in ranked]
+
+    def column_similarity(self, a: Tuple[str, str], b: Tuple[str, str]) -> float:
+        """由并集签名估计两列值 shingle 集合的 Jaccard 相似度"""
+        sig_a = self.column_signatures[self._column_ids[a]]
+        sig_b = self.column_signatures[self._column_ids[b]]
+        return float(np.mean(sig_a == sig_b))
@@ -1,31 +1,84 @@
 import json
 import os
+import asyncio
 import dotenv
-from typing import Dict, Any, List, Optional
-from simplified_nl2sql import TableAgent, SQLDesignerAgent, RefinerAgent, AgentContext, AgentExecutor
+from typing import Dict, Any, List, Optional, AsyncIterator, Iterator
+from simplified_nl2sql import TableAgent, ValueRetrieverAgent, SQLDesignerAgent, RefinerAgent, AgentContext, AgentExecutor, ProgressEvent, run_sync
+from databasemanager import DatabaseManager
+from result_cache import QuestionCache
+from semantic_cache import SemanticQuestionCache
+from connection_pool import pool_stats
+from sql_executor import SandboxedExecutor
 
 class NL2SQLGenerator:
     
-    def __init__(self, load_env: bool = True):
+    def __init__(self, load_env: bool = True, result_cache: Optional[QuestionCache] = None, use_result_cache: bool = True,
+                 semantic_cache: Optional[SemanticQuestionCache] = None, use_semantic_cache: bool = False,
+                 sql_executor: Optional[SandboxedExecutor] = None):
+        """
+        Args:
+            load_env (bool): 是否加载 .env。
+            result_cache (Optional[QuestionCache]): 整题结果缓存，默认使用 data/result_cache.sqlite。
+            use_result_cache (bool): 是否启用整题结果缓存。
+            semantic_cache (Optional[SemanticQuestionCache]): 语义问题缓存，复用近义问题的已验证 SQL。
+            use_semantic_cache (bool): 是否启用语义问题缓存，默认关闭（需要显式开启）。
+            sql_executor (Optional[SandboxedExecutor]): 候选 SQL 的受限执行器，设计器、精炼器和默认的语义缓存共用这一个。
+        """
         if load_env:
             dotenv.load_dotenv()
         
+        self.result_cache = (result_cache or QuestionCache()) if use_result_cache else None
+        
         # 创建执行器和添加核心Agent
-        self.executor = AgentExecutor()
+        self.sql_executor = sql_executor or SandboxedExecutor()
+        self.semantic_cache = (
+            (semantic_cache or SemanticQuestionCache(executor=self.sql_executor)) if use_semantic_cache else None
+        )
+        self.executor = AgentExecutor(semantic_cache=self.semantic_cache)
         self.executor.add_node(TableAgent())
-        self.executor.add_node(SQLDesignerAgent())
-        self.executor.add_node(RefinerAgent())
+        self.executor.add_node(ValueRetrieverAgent())
+        self.executor.add_node(SQLDesignerAgent(executor=self.sql_executor))
+        self.executor.add_node(RefinerAgent(executor=self.sql_executor))
     
     def generate_sql(self, 
                     question: str, 
                     hint: str, 
                     db_name: str,
                     db_schema: Optional[Dict[str, List[str]]] = None,
-                    verbose: bool = False) -> Dict[str, Any]:
+                    verbose: bool = False,
+                    use_cache: bool = True,
+                    reasoning_mode: Optional[str] = None) -> Dict[str, Any]:
+        return run_sync(self.agenerate_sql(question, hint, db_name, db_schema, verbose, use_cache, reasoning_mode))
+    
+    async def agenerate_sql(self, 
+                           question: str, 
+                           hint: str, 
+                           db_name: str,
+                           db_schema: Optional[Dict[str, List[str]]] = None,
+                           verbose: bool = False,
+                           use_cache: bool = True,
+                           reasoning_mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Args:
+            reasoning_mode (Optional[str]): 本次请求的推理方式：stepwise（逐步调用）或
+                single_call（一次调用返回全部步骤，往返次数少但推理深度较浅）；默认沿用 SQLDesignerAgent 的设置。
+        """
         try:
             self._set_verbose(verbose)
             
-            results = self.executor.execute(question, hint, db_name)
+            cache = self.result_cache if use_cache else None
+            if cache is not None:
+                fingerprint = await asyncio.to_thread(self._schema_fingerprint, db_name)
+                cached = await asyncio.to_thread(cache.lookup, db_name, question, hint, fingerprint, db_schema)
+                if cached is not None:
+                    return {
+                        "sql": cached["sql"],
+                        "status": "success",
+                        "message": "成功生成SQL查询（缓存）",
+                        "details": {"cache": "hit", "cache_stats": cache.stats()} if verbose else {}
+                    }
+            
+            results = await self.executor.aexecute(question, hint, db_name, db_schema, reasoning_mode)
             
             final_sql = results.get("final_sql", "")
             
@@ -36,6 +89,9 @@ class NL2SQLGenerator:
                     "message": "无法生成有效的SQL查询"
                 }
             
+            if cache is not None and final_sql:
+                await asyncio.to_thread(cache.store, db_name, question, hint, fingerprint, {"sql": final_sql}, db_schema)
+            
             return {
                 "sql": final_sql,
                 "status": "success",
@@ -50,6 +106,39 @@ class NL2SQLGenerator:
                 "message": f"生成SQL时发生错误: {str(e)}"
             }
     
+    def stream_sql(self,
+                   question: str,
+                   hint: str,
+                   db_name: str,
+                   db_schema: Optional[Dict[str, List[str]]] = None,
+                   reasoning_mode: Optional[str] = None) -> Iterator[ProgressEvent]:
+        """
+        逐个返回生成过程中的进度事件（节点开始/结束、推理步骤、候选 SQL、执行结果、最终 SQL），
+        最后一个事件为 done 或 error。不经过整题结果缓存；提前停止迭代会取消剩余的工作。
+        """
+        return self.executor.stream(question, hint, db_name, db_schema, reasoning_mode)
+    
+    def astream_sql(self,
+                    question: str,
+                    hint: str,
+                    db_name: str,
+                    db_schema: Optional[Dict[str, List[str]]] = None,
+                    reasoning_mode: Optional[str] = None) -> AsyncIterator[ProgressEvent]:
+        return self.executor.astream(question, hint, db_name, db_schema, reasoning_mode)
+    
+    def _schema_fingerprint(self, db_name: str) -> str:
+        return DatabaseManager(db_name).get_schema_catalog().fingerprint
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """整题结果缓存和语义缓存的命中/未命中计数，以及各数据库只读连接池的使用情况"""
+        stats = {}
+        if self.result_cache is not None:
+            stats["result_cache"] = self.result_cache.stats()
+        if self.semantic_cache is not None:
+            stats["semantic_cache"] = self.semantic_cache.stats()
+        stats["connection_pools"] = pool_stats()
+        return stats
+    
     def _set_verbose(self, verbose: bool):
         import builtins
         
@@ -553,3 +553,31 @@ Corrected SQL: SELECT department, AVG(salary) FROM employees GROUP BY department
 
 SELECT_SQL_PROMPT = '''You are a SQL expert that selects the best query based on performance and correctness.
 '''
+
+SINGLE_CALL_REASONING_PROMPT = '''You are an expert SQL designer that explains your reasoning step by step. Produce your COMPLETE reasoning in a single response: a list of reasoning steps followed by the final SQL query.
+
+Each step has a 'title' that describes what you're doing in that step and a 'content' with the reasoning itself. Every step except the last one has "next_action": "continue"; the last step has "next_action": "final_answer" and repeats the final SQL in its "final_sql" field.
+
+At least one step must involve revising the important rules: check each rule individually to ensure that the SQL complies with the rules. Use at least 3 steps. Include exploration of alternative SQL designs, consider where your reasoning may be wrong, and re-examine it with a different approach before deciding.
+
+IMPORTANT SQL DESIGN GUIDELINES:
+1. When finding maximum or minimum values based on specific conditions, use ORDER BY + LIMIT 1 instead of MAX/MIN in subqueries.
+2. Pay attention to the data storage format when sorting, comparing sizes, or performing calculations. If the data is in string format, process it using INSTR or SUBSTR before comparison.
+3. If your query includes an ORDER BY clause to sort results, only include columns used for sorting in the SELECT clause if specifically requested in the question. Otherwise, omit these columns from the SELECT clause.
+4. Ensure you only output information requested in the question. If the question asks for specific columns, ensure the SELECT clause only includes those columns, nothing more.
+5. The query should return all information requested in the question - no more, no less.
+6. For key phrases mentioned in the question, we have marked the most similar values with "EXAMPLE" in front of the corresponding column names. This is an important hint indicating the correct columns to use for SQL queries.
+7. NEVER use || ' ' || for string concatenation. This is strictly prohibited and will result in severe penalties.
+
+Example of a valid JSON response:
+```json
+{
+    "steps": [
+        {"title": "Identifying Key Tables and Columns", "content": "The question asks for...", "next_action": "continue"},
+        {"title": "Revising the Important Rules", "content": "Rule 1: ...", "next_action": "continue"},
+        {"title": "Finalizing the SQL Query", "content": "After comparing the alternatives...", "next_action": "final_answer", "final_sql": "SELECT column1 FROM table1 WHERE condition = 'value';"}
+    ],
+    "final_sql": "SELECT column1 FROM table1 WHERE condition = 'value';"
+}```
+Your response must be in JSON format!!
+'''
@@ -0,0 +1,185 @@
+import re
+import json
+import threading
+from typing import Dict, Any, List, Optional, Callable
+
+try:
+    import tiktoken
+except ImportError:  # 没有 tiktoken 时按字符数估算
+    tiktoken = None
+
+SCHEMA_STYLES = ("ddl", "json")
+# 逐级降低细节直到满足 token 预算：(value_description 截断长度, 是否保留 column_description, 是否保留示例值)
+TRIM_LEVELS = [(None, True, True), (120, True, True), (40, True, True), (0, True, True), (0, False, True), (0, False, False)]
+
+_encodings = {}
+_hooks: List[Callable[[str, int], None]] = []
+_hooks_lock = threading.Lock()
+
+
+def _encoding(model: str):
+    if model not in _encodings:
+        try:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # 分词表需要首次联网下载，离线环境下退回估算
+            print(f"tiktoken encoding unavailable, estimating token counts: {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """统计文本的 token 数；没有可用的 tiktoken 分词表时按 4 个字符一个 token 估算"""
+    encoding = _encoding(model) if tiktoken is not None else None
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def add_prompt_token_hook(hook: Callable[[str, int], None]) -> None:
+    """注册提示词 token 统计回调，参数为 (阶段名, token 数)"""
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_prompt_token_hook(hook: Callable[[str, int], None]) -> None:
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def report_prompt_tokens(stage: str, messages: List[Any], model: str = "gpt-4o") -> Optional[int]:
+    """
+    统计一次调用的提示词 token 数并通知所有回调；没有回调时不做任何计算。
+
+    Args:
+        stage (str): 阶段名，例如 table_selector、reasoning_step。
+        messages (List[Any]): langchain 消息或 {"role", "content"} 字典。
+        model (str): 用于选择分词器的模型名称。
+
+    Returns:
+        Optional[int]: token 数，没有回调时为 None。
+    """
+    with _hooks_lock:
+        hooks = list(_hooks)
+    if not hooks:
+        return None
+    text = "\n".join(
+        message["content"] if isinstance(message, dict) else str(message.content)
+        for message in messages
+    )
+    tokens = count_tokens(text, model)
+    for hook in hooks:
+        hook(stage, tokens)
+    return tokens
+
+
+class PromptTokenCounter:
+    """累计每个阶段的调用次数和 token 数，可直接作为回调注册"""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage: str, tokens: int) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"calls": 0, "tokens": 0, "max_tokens": 0})
+            entry["calls"] += 1
+            entry["tokens"] += tokens
+            entry["max_tokens"] = max(entry["max_tokens"], tokens)
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{stage}: {entry['tokens']} tokens / {entry['calls']} calls (max {entry['max_tokens']})"
+            for stage, entry in self.stages.items()
+        )
+
+
+def _one_line(text: Any, limit: Optional[int] = None) -> str:
+    text = re.sub(r"\s+", " ", str(text or "")).strip()
+    if limit is not None and len(text) > limit:
+        text = text[:limit].rstrip() + "…"
+    return text
+
+
+def _quote_identifier(name: str) -> str:
+    return name if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name) else '"' + name.replace('"', '""') + '"'
+
+
+def _column_note(info: Dict[str, Any], value_limit: Optional[int], keep_description: bool, keep_examples: bool) -> str:
+    parts = []
+    if keep_description and info.get("column_description"):
+        parts.append(_one_line(info["column_description"]))
+    if value_limit != 0 and info.get("value_description"):
+        parts.append("values: " + _one_line(info["value_description"], value_limit))
+    if keep_examples and info.get("EXAMPLE"):
+        parts.append("EXAMPLE: " + ", ".join(repr(value) for value in info["EXAMPLE"]))
+    return " | ".join(parts)
+
+
+def _render(tables_columns: Dict[str, List[str]],
+            descriptions: Dict[str, Dict[str, Any]],
+            style: str,
+            column_types: Dict[str, Dict[str, str]],
+            level: int) -> str:
+    value_limit, keep_description, keep_examples = TRIM_LEVELS[level]
+    if style == "json":
+        schema = {}
+        for table, columns in tables_columns.items():
+            table_descriptions = descriptions.get(table, {})
+            schema[table] = {
+                column: _column_note(table_descriptions.get(column, {}), value_limit, keep_description, keep_examples)
+                for column in columns
+            }
+        return json.dumps(schema, ensure_ascii=False, separators=(",", ":"))
+
+    lines = []
+    for table, columns in tables_columns.items():
+        table_descriptions = descriptions.get(table, {})
+        types = column_types.get(table, {})
+        lines.append(f"CREATE TABLE {_quote_identifier(table)} (")
+        for column in columns:
+            line = f"  {_quote_identifier(column)}"
+            if types.get(column):
+                line += f" {types[column]}"
+            note = _column_note(table_descriptions.get(column, {}), value_limit, keep_description, keep_examples)
+            lines.append(f"{line}, -- {note}" if note else f"{line},")
+        lines.append(");")
+    return "\n".join(lines)
+
+
+def render_schema(tables_columns: Dict[str, List[str]],
+                  descriptions: Optional[Dict[str, Dict[str, Any]]] = None,
+                  style: str = "ddl",
+                  column_types: Optional[Dict[str, Dict[str, str]]] = None,
+                  token_budget: Optional[int] = None,
+                  model: str = "gpt-4o") -> str:
+    """
+    把表、列和列描述渲染成紧凑的提示词片段。
+
+    Args:
+        tables_columns (Dict[str, List[str]]): 表名到列名列表的映射。
+        descriptions (Optional[Dict[str, Dict[str, Any]]]): DescriptionIndex.describe 的结果，可带 EXAMPLE。
+        style (str): ddl（CREATE TABLE + 行尾注释）或 json（最小化 JSON）。
+        column_types (Optional[Dict[str, Dict[str, str]]]): 表名 -> 列名 -> 声明类型，仅 ddl 使用。
+        token_budget (Optional[int]): token 预算；超出时依次截断、去掉值说明、列说明和示例值。
+        model (str): 用于统计 token 的模型名称。
+
+    Returns:
+        str: 渲染结果。
+    """
+    if style not in SCHEMA_STYLES:
+        raise ValueError(f"Unknown schema style '{style}', expected one of {SCHEMA_STYLES}")
+    descriptions = descriptions or {}
+    column_types = column_types or {}
+    rendered = _render(tables_columns, descriptions, style, column_types, 0)
+    if token_budget is None:
+        return rendered
+    for level in range(1, len(TRIM_LEVELS)):
+        if count_tokens(rendered, model) <= token_budget:
+            break
+        rendered = _render(tables_columns, descriptions, style, column_types, level)
+    return rendered
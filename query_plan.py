@@ -0,0 +1,62 @@
+import re
+import sqlite3
+from typing import Dict, Any, List
+
+# EXPLAIN QUERY PLAN 明细（3.36 之前的版本带 TABLE 前缀），例如
+#   SCAN Patient
+#   SCAN T1 USING COVERING INDEX idx_lab_id
+#   SEARCH T2 USING INDEX sqlite_autoindex_Patient_1 (ID=?)
+#   SEARCH T2 USING AUTOMATIC COVERING INDEX (ID=?)
+#   USE TEMP B-TREE FOR ORDER BY
+_ACCESS_PATTERN = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(?!CONSTANT ROW)(\S+)(?: AS (\S+))?(?: USING (.*))?$")
+
+
+def explain_query_plan(connection: sqlite3.Connection, sql: str) -> List[Dict[str, Any]]:
+    """执行 EXPLAIN QUERY PLAN，返回 id、parent、detail 列表（不执行查询本身）"""
+    return [
+        {"id": row[0], "parent": row[1], "detail": row[-1]}
+        for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    ]
+
+
+def analyze_plan(plan: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    从查询计划中找出代价高的访问方式。
+
+    Args:
+        plan (List[Dict[str, Any]]): explain_query_plan 的结果。
+
+    Returns:
+        Dict[str, Any]: plan（明细文本）、full_scans（不走索引的全表扫描）、
+            missing_index_joins（连接中的内层表没有可用索引：逐行全表扫描或 SQLite 临时建的自动索引）、
+            temp_btrees（排序 / 分组 / 去重用的临时 B 树）、penalty（按上述问题加权的代价分）。
+    """
+    full_scans, missing_index_joins, temp_btrees = [], [], []
+    # 同一个 parent 下的第一个表访问是外层循环，之后的都是连接的内层
+    seen_parents = set()
+    for step in plan:
+        detail = step["detail"]
+        if detail.startswith("USE TEMP B-TREE"):
+            temp_btrees.append(detail)
+            continue
+        match = _ACCESS_PATTERN.match(detail)
+        if not match or match.group(2).startswith("("):
+            # 子查询、CTE 物化结果等不是实际的表
+            continue
+        table = match.group(3) or match.group(2)
+        using = match.group(4) or ""
+        inner = step["parent"] in seen_parents
+        seen_parents.add(step["parent"])
+        if match.group(1) == "SCAN" and not using:
+            full_scans.append(table)
+            if inner:
+                missing_index_joins.append(table)
+        elif "AUTOMATIC" in using:
+            missing_index_joins.append(table)
+    return {
+        "plan": [step["detail"] for step in plan],
+        "full_scans": full_scans,
+        "missing_index_joins": missing_index_joins,
+        "temp_btrees": temp_btrees,
+        "penalty": len(full_scans) + 2 * len(missing_index_joins) + len(temp_btrees),
+    }
@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, Any, List, Optional
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_RESULT_CACHE_PATH = os.path.join(DATA_DIR, "result_cache.sqlite")
+
+
+class SQLiteLRUCache:
+    """
+    SQLite 持久化的键值缓存，带 TTL 和按最近访问时间淘汰的条目数 / 总字节数上限。
+    值以 JSON 保存；每条记录可附带一个 tag，用于整体失效。
+    条目数和值的总长度由触发器维护在 {table}_meta 的一行中，与写入在同一个事务里更新，
+    写入时检查上限不需要扫描整张表，多个进程共用一个缓存文件时也保持一致。
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_entries: int = 10000, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.path = str(path)
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._conn() as connection:
+            # 建表、统计已有记录和创建触发器放在一个写事务里，避免其他进程在中间写入
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(f'''CREATE TABLE IF NOT EXISTS {self.table} (
+                                key TEXT PRIMARY KEY,
+                                value TEXT,
+                                scope TEXT,
+                                tag TEXT,
+                                created_at REAL,
+                                accessed_at REAL
+                                )''')
+            connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed ON {self.table} (accessed_at)")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_scope ON {self.table} (scope, tag)")
+            meta = f"{self.table}_meta"
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {meta} (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                               f"entries INTEGER NOT NULL, bytes INTEGER NOT NULL)")
+            # 只在首次创建时统计一次已有记录（兼容没有统计行的旧缓存文件）
+            connection.execute(f"INSERT OR IGNORE INTO {meta} (id, entries, bytes) "
+                               f"SELECT 0, COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM {self.table}")
+            connection.execute(f"""CREATE TRIGGER IF NOT EXISTS {self.table}_count_insert AFTER INSERT ON {self.table}
+                                BEGIN UPDATE {meta} SET entries = entries + 1, bytes = bytes + LENGTH(NEW.value) WHERE id = 0; END""")
+            connection.execute(f"""CREATE TRIGGER IF NOT EXISTS {self.table}_count_delete AFTER DELETE ON {self.table}
+                                BEGIN UPDATE {meta} SET entries = entries - 1, bytes = bytes - LENGTH(OLD.value) WHERE id = 0; END""")
+            connection.execute(f"""CREATE TRIGGER IF NOT EXISTS {self.table}_count_update AFTER UPDATE OF value ON {self.table}
+                                BEGIN UPDATE {meta} SET bytes = bytes + LENGTH(NEW.value) - LENGTH(OLD.value) WHERE id = 0; END""")
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程一个连接；WAL 允许多个进程同时读写
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key: str, tag: Optional[str] = None) -> Optional[Any]:
+        """
+        读取一条缓存。过期或 tag 不一致的记录会被删除并记为未命中。
+
+        Args:
+            key (str): 缓存键。
+            tag (Optional[str]): 期望的 tag，例如数据库结构指纹。
+
+        Returns:
+            Optional[Any]: 命中时返回反序列化后的值，否则 None。
+        """
+        now = time.time()
+        with self._conn() as connection:
+            row = connection.execute(
+                f"SELECT value, tag, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            value, stored_tag, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._count("expired")
+                self._count("misses")
+                return None
+            if tag is not None and stored_tag != tag:
+                connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._count("invalidations")
+                self._count("misses")
+                return None
+            connection.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return json.loads(value)
+
+    def put(self, key: str, value: Any, scope: Optional[str] = None, tag: Optional[str] = None) -> None:
+        now = time.time()
+        with self._conn() as connection:
+            # 用 UPSERT 而不是 INSERT OR REPLACE：REPLACE 隐式删除旧行时不会触发 DELETE 触发器
+            connection.execute(
+                f"INSERT INTO {self.table} (key, value, scope, tag, created_at, accessed_at) VALUES (?,?,?,?,?,?) "
+                f"ON CONFLICT(key) DO UPDATE SET value = excluded.value, scope = excluded.scope, tag = excluded.tag, "
+                f"created_at = excluded.created_at, accessed_at = excluded.accessed_at",
+                (key, json.dumps(value, ensure_ascii=False), scope, tag, now, now)
+            )
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        count, size = connection.execute(f"SELECT entries, bytes FROM {self.table}_meta WHERE id = 0").fetchone()
+        excess = 0
+        if count > self.max_entries:
+            # 多淘汰 10%，避免之后每次写入都触发淘汰
+            excess = count - self.max_entries + max(self.max_entries // 10, 1)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # 按平均条目大小估算需要淘汰的条数，同样多留 10% 余量
+            average = size / count
+            excess = max(excess, int((size - self.max_bytes * 0.9) / average) + 1)
+        if not excess:
+            return
+        connection.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+            (excess,)
+        )
+        with self._stats_lock:
+            self.evictions += min(excess, count)
+
+    def invalidate(self, scope: str, keep_tag: Optional[str] = None) -> int:
+        """删除某个 scope 下的记录；给出 keep_tag 时只删除 tag 不同的记录"""
+        with self._conn() as connection:
+            if keep_tag is None:
+                cursor = connection.execute(f"DELETE FROM {self.table} WHERE scope = ?", (scope,))
+            else:
+                cursor = connection.execute(
+                    f"DELETE FROM {self.table} WHERE scope = ? AND (tag IS NULL OR tag <> ?)", (scope, keep_tag)
+                )
+        with self._stats_lock:
+            self.invalidations += cursor.rowcount
+        return cursor.rowcount
+
+    def purge_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        with self._conn() as connection:
+            cursor = connection.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl,))
+        with self._stats_lock:
+            self.expired += cursor.rowcount
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._conn() as connection:
+            connection.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        return self._conn().execute(f"SELECT entries FROM {self.table}_meta WHERE id = 0").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def __str__(self) -> str:
+        stats = self.stats()
+        return (f"{stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+                f"{stats['evictions']} evicted, {stats['invalidations']} invalidated")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    规范化问题或提示：NFKC、合并空白、忽略大小写。
+    引号内的字面量保持原样，因为 SEX = 'M' 和 SEX = 'm' 会得到不同的 SQL。
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    parts = re.split(r"('[^']*'|\"[^\"]*\"|`[^`]*`)", text)
+    normalized = []
+    for i, part in enumerate(parts):
+        # re.split 保留分组，奇数位置是引号包裹的字面量
+        normalized.append(part if i % 2 else part.casefold())
+    return re.sub(r"\s+", " ", "".join(normalized)).strip()
+
+
+class QuestionCache(SQLiteLRUCache):
+    """
+    整题结果缓存：键为 (db_name, 规范化问题, 规范化提示, 可选的自定义 schema)，
+    tag 为目标数据库的结构指纹，结构变化后旧结果自动失效。
+    """
+
+    def __init__(self, path: str = DEFAULT_RESULT_CACHE_PATH, max_entries: int = 10000,
+                 ttl: Optional[float] = 7 * 24 * 3600):
+        super().__init__(path, table="question_results", max_entries=max_entries, ttl=ttl)
+        self._checked_fingerprints: Dict[str, str] = {}
+
+    @staticmethod
+    def question_key(db_name: str, question: str, hint: str,
+                     db_schema: Optional[Dict[str, List[str]]] = None) -> str:
+        schema = json.dumps(db_schema, sort_keys=True, ensure_ascii=False) if db_schema else ""
+        payload = "\0".join([db_name, normalize_text(question), normalize_text(hint), schema])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _check_fingerprint(self, db_name: str, fingerprint: str) -> None:
+        # 每个进程内每个指纹只清理一次该数据库的旧结构结果
+        if self._checked_fingerprints.get(db_name) != fingerprint:
+            self.invalidate(db_name, keep_tag=fingerprint)
+            self._checked_fingerprints[db_name] = fingerprint
+
+    def lookup(self, db_name: str, question: str, hint: str, fingerprint: str,
+               db_schema: Optional[Dict[str, List[str]]] = None) -> Optional[Dict[str, Any]]:
+        self._check_fingerprint(db_name, fingerprint)
+        return self.get(self.question_key(db_name, question, hint, db_schema), tag=fingerprint)
+
+    def store(self, db_name: str, question: str, hint: str, fingerprint: str, result: Dict[str, Any],
+              db_schema: Optional[Dict[str, List[str]]] = None) -> None:
+        self._check_fingerprint(db_name, fingerprint)
+        self.put(self.question_key(db_name, question, hint, db_schema), result, scope=db_name, tag=fingerprint)
@@ -0,0 +1,72 @@
+import hashlib
+from functools import partial
+from typing import Any, Iterable, List, Sequence
+
+FINGERPRINT_MODES = ("unordered", "ordered")
+_DIGEST_SIZE = 16
+_MASK = (1 << (8 * _DIGEST_SIZE)) - 1
+_row_hash = partial(hashlib.blake2b, digest_size=_DIGEST_SIZE)
+
+
+def canonical_rows(rows: List[tuple]) -> List[tuple]:
+    """把整数值的浮点数换成整数，使 3 与 3.0 编码相同；按列检查，没有浮点数的列不逐值处理"""
+    columns = list(zip(*rows))
+    changed = False
+    for index, column in enumerate(columns):
+        if float in set(map(type, column)):
+            columns[index] = [int(value) if type(value) is float and value.is_integer() else value
+                              for value in column]
+            changed = True
+    return list(zip(*columns)) if changed else rows
+
+
+def encode_row(row: tuple) -> bytes:
+    """
+    行的规范编码。SQLite 只返回 None / int / float / str / bytes，它们的 repr 自带类型标记
+    （字符串带引号并转义、bytes 带 b 前缀），因此 '1' 与 1、('a', 'b') 与 ('ab', '') 的编码都不同。
+    """
+    return repr(row).encode("utf-8", "surrogatepass")
+
+
+class ResultFingerprint:
+    """
+    结果集的流式指纹，内存占用与行数无关。
+
+    每行先规范化（整数值的浮点数按整数处理，3 与 3.0 视为相等，与原先逐行比较元组的语义一致）并编码为带类型标记的字节串，
+    再用 blake2b 得到 128 位行摘要。ordered 模式把行摘要依次送入一个 blake2b，行顺序不同则指纹不同；
+    unordered 模式把行摘要按模 2^128 相加（多重集合哈希），与行顺序无关但区分重复行。
+    两种模式都把行数计入最终指纹。指纹与进程无关，可以持久化和跨进程比较。
+    """
+
+    def __init__(self, mode: str = "unordered"):
+        if mode not in FINGERPRINT_MODES:
+            raise ValueError(f"Unknown fingerprint mode '{mode}', expected one of {FINGERPRINT_MODES}")
+        self.mode = mode
+        self.row_count = 0
+        self._sum = 0
+        self._chain = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+
+    def update(self, row: Sequence[Any]) -> None:
+        self.update_many((row,))
+
+    def update_many(self, rows: Iterable[Sequence[Any]]) -> None:
+        # sqlite3 返回的行已经是元组，只有其他序列需要转换
+        rows = canonical_rows([row if type(row) is tuple else tuple(row) for row in rows])
+        digests = [_row_hash(encode_row(row)).digest() for row in rows]
+        if self.mode == "ordered":
+            self._chain.update(b"".join(digests))
+        else:
+            self._sum = (self._sum + sum(int.from_bytes(digest, "big") for digest in digests)) & _MASK
+        self.row_count += len(digests)
+
+    def hexdigest(self) -> str:
+        state = self._chain.hexdigest() if self.mode == "ordered" else f"{self._sum:032x}"
+        return hashlib.blake2b(f"{self.mode}:{self.row_count}:{state}".encode("ascii"),
+                               digest_size=_DIGEST_SIZE).hexdigest()
+
+
+def fingerprint_rows(rows: Iterable[Sequence[Any]], mode: str = "unordered") -> str:
+    """一次性计算一组行的指纹"""
+    fingerprint = ResultFingerprint(mode)
+    fingerprint.update_many(rows)
+    return fingerprint.hexdigest()
@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from connection_pool import get_connection_pool
+
+CATALOG_VERSION = 1
+
+_catalogs: Dict[str, "SchemaCatalog"] = {}
+_lock = threading.Lock()
+
+
+class SchemaCatalog:
+    """
+    数据库结构目录，只通过 PRAGMA 读取元数据，不加载任何表数据。
+    内存中按 db_name 缓存，并持久化为 JSON；SQLite 文件的 mtime/size 变化时失效。
+    """
+
+    def __init__(self, db_name: str, sqlite_mtime: int, sqlite_size: int, tables: Dict[str, Dict[str, Any]]):
+        self.db_name = db_name
+        self.sqlite_mtime = sqlite_mtime
+        self.sqlite_size = sqlite_size
+        self.tables = tables
+        self.fingerprint = self._compute_fingerprint(tables)
+
+    @staticmethod
+    def _compute_fingerprint(tables: Dict[str, Dict[str, Any]]) -> str:
+        payload = json.dumps(tables, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def build(cls, db_name: str, sqlite_path: Path) -> "SchemaCatalog":
+        stat = os.stat(sqlite_path)
+        tables = {}
+        with get_connection_pool(sqlite_path, db_name).connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            for (table_name,) in cursor.fetchall():
+                cursor.execute(f'PRAGMA table_info("{table_name}");')
+                columns = [
+                    {"name": col[1], "type": col[2], "notnull": bool(col[3]), "default": col[4], "pk": col[5]}
+                    for col in cursor.fetchall()
+                ]
+                cursor.execute(f'PRAGMA foreign_key_list("{table_name}");')
+                foreign_keys = [
+                    {"column": fk[3], "ref_table": fk[2], "ref_column": fk[4]}
+                    for fk in cursor.fetchall()
+                ]
+                tables[table_name] = {"columns": columns, "foreign_keys": foreign_keys}
+        return cls(db_name, stat.st_mtime_ns, stat.st_size, tables)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SchemaCatalog":
+        return cls(data["db_name"], data["sqlite_mtime"], data["sqlite_size"], data["tables"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": CATALOG_VERSION,
+            "db_name": self.db_name,
+            "sqlite_mtime": self.sqlite_mtime,
+            "sqlite_size": self.sqlite_size,
+            "fingerprint": self.fingerprint,
+            "tables": self.tables,
+        }
+
+    def is_fresh(self, sqlite_path: Path) -> bool:
+        try:
+            stat = os.stat(sqlite_path)
+        except OSError:
+            return False
+        return stat.st_mtime_ns == self.sqlite_mtime and stat.st_size == self.sqlite_size
+
+    def save(self, cache_path: Path) -> None:
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+
+    def table_names(self) -> List[str]:
+        return list(self.tables.keys())
+
+    def column_names(self, table_name: str) -> List[str]:
+        return [col["name"] for col in self.tables[table_name]["columns"]]
+
+    def table_columns_dict(self) -> Dict[str, List[str]]:
+        return {table_name: self.column_names(table_name) for table_name in self.tables}
+
+    def column_types_dict(self) -> Dict[str, Dict[str, str]]:
+        return {
+            table_name: {col["name"]: col["type"] for col in table_info["columns"]}
+            for table_name, table_info in self.tables.items()
+        }
+
+
+def _load_from_disk(cache_path: Path, sqlite_path: Path) -> Optional[SchemaCatalog]:
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CATALOG_VERSION:
+            return None
+        catalog = SchemaCatalog.from_dict(data)
+    except (OSError, ValueError, KeyError):
+        return None
+    return catalog if catalog.is_fresh(sqlite_path) else None
+
+
+def get_schema_catalog(db_name: str, sqlite_path: Path, cache_path: Optional[Path] = None) -> SchemaCatalog:
+    """
+    获取数据库结构目录：优先使用内存缓存，其次磁盘缓存，都失效时重新执行 PRAGMA 构建。
+
+    Args:
+        db_name (str): 数据库名称。
+        sqlite_path (Path): SQLite 文件路径。
+        cache_path (Optional[Path]): 持久化 JSON 路径，默认 <db>_schema.json。
+
+    Returns:
+        SchemaCatalog: 数据库结构目录。
+    """
+    sqlite_path = Path(sqlite_path)
+    if cache_path is None:
+        cache_path = sqlite_path.with_name(f"{db_name}_schema.json")
+
+    with _lock:
+        catalog = _catalogs.get(db_name)
+        if catalog is not None and catalog.is_fresh(sqlite_path):
+            return catalog
+
+        catalog = _load_from_disk(cache_path, sqlite_path)
+        if catalog is None:
+            if not sqlite_path.exists():
+                raise FileNotFoundError(f"SQLite database not found: {sqlite_path}")
+            catalog = SchemaCatalog.build(db_name, sqlite_path)
+            try:
+                catalog.save(cache_path)
+            except OSError as e:
+                print(f"Error saving schema catalog to {cache_path}: {e}")
+
+        _catalogs[db_name] = catalog
+        return catalog
@@ -0,0 +1,167 @@
+import re
+import time
+import hashlib
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from databasemanager import DatabaseManager
+from sql_executor import SandboxedExecutor
+
+# 引号字面量或数字，例如 SEX = 'M'、`T-BIL` >= '2.0'、1990
+_LITERAL_PATTERN = re.compile(r"'([^']*)'|\"([^\"]*)\"|(?<![\w.])(\d+(?:\.\d+)?)(?![\w.])")
+
+
+def _literals(text: str) -> List[Tuple[str, str]]:
+    """按出现顺序返回 (类型, 值)，类型为 quoted 或 number"""
+    literals = []
+    for match in _LITERAL_PATTERN.finditer(text or ""):
+        if match.group(3) is not None:
+            literals.append(("number", match.group(3)))
+        else:
+            literals.append(("quoted", match.group(1) if match.group(1) is not None else match.group(2)))
+    return literals
+
+
+class SemanticQuestionCache:
+    """
+    语义问题缓存：把 (问题, 提示) 嵌入后存进每个数据库自己的 {db}_question_cache 集合，
+    新问题按余弦相似度查找最近的已回答问题，超过阈值就复用它的 SQL。
+    复用前会对齐两个问题中的字面量（必要时替换 SQL 中对应的值），并用
+    受限执行器在只读连接上执行验证，出错或超时则回到完整流程。
+    """
+
+    def __init__(self, threshold: float = 0.95, candidates: int = 3, executor: Optional[SandboxedExecutor] = None):
+        """
+        Args:
+            threshold (float): 复用所需的最小余弦相似度。
+            candidates (int): 每次查找取回的最近邻数量，按相似度依次验证。
+            executor (Optional[SandboxedExecutor]): 验证 SQL 的受限执行器，通常与流水线共用一个。
+        """
+        self.threshold = threshold
+        self.candidates = candidates
+        self.executor = executor or SandboxedExecutor()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._collections = {}
+
+    @staticmethod
+    def _text(question: str, hint: str) -> str:
+        return f"Question: {question.strip()}\nHint: {(hint or '').strip()}"
+
+    def _collection(self, db_manager: DatabaseManager):
+        name = f"{db_manager.db_name}_question_cache"
+        if name not in self._collections:
+            self._collections[name] = db_manager.client.get_or_create_collection(
+                name=name, metadata={"hnsw:space": "cosine"}
+            )
+        return self._collections[name]
+
+    def lookup(self, db_name: str, question: str, hint: str) -> Optional[Dict[str, Any]]:
+        """
+        查找可复用的 SQL。
+
+        Args:
+            db_name (str): 数据库名称。
+            question (str): 用户问题。
+            hint (str): 提示信息。
+
+        Returns:
+            Optional[Dict[str, Any]]: 命中时返回 sql、similarity、cached_question、adapted、execution_time，否则 None。
+        """
+        start = time.perf_counter()
+        db_manager = DatabaseManager(db_name)
+        collection = self._collection(db_manager)
+        if collection.count() == 0:
+            self.misses += 1
+            return None
+
+        fingerprint = db_manager.get_schema_catalog().fingerprint
+        vector = db_manager.embedder.embed([self._text(question, hint)])[0]
+        result = collection.query(
+            query_embeddings=[vector],
+            n_results=min(self.candidates, collection.count()),
+            where={"fingerprint": fingerprint},
+            include=["metadatas", "distances"]
+        )
+
+        for meta, distance in zip(result["metadatas"][0], result["distances"][0]):
+            similarity = 1.0 - distance
+            if similarity < self.threshold:
+                break
+            sql, adapted = self._adapt_sql(meta, question, hint)
+            if sql is None:
+                continue
+            execution_time, error = self._verify(db_manager.sqlite_path, sql)
+            if error is not None:
+                self.rejected += 1
+                print(f"缓存的 SQL 验证失败，跳过: {error}")
+                continue
+            self.hits += 1
+            return {
+                "sql": sql,
+                "similarity": similarity,
+                "cached_question": meta["question"],
+                "adapted": adapted,
+                "execution_time": execution_time,
+                "lookup_time": time.perf_counter() - start,
+            }
+
+        self.misses += 1
+        return None
+
+    def _adapt_sql(self, meta: Dict[str, Any], question: str, hint: str) -> Tuple[Optional[str], bool]:
+        """
+        对齐字面量：完全一致时直接复用；数量和类型一致、且每个不同的旧值在 SQL 中恰好出现一次时，
+        替换成新值；其余情况（例如 SEX = 'M' 与 SEX = 'F' 无法定位）不复用。
+        """
+        sql = meta["sql"]
+        old = _literals(f"{meta['question']} {meta['hint']}")
+        new = _literals(f"{question} {hint}")
+        if old == new:
+            return sql, False
+        if [kind for kind, _ in old] != [kind for kind, _ in new]:
+            return None, False
+
+        for (kind, old_value), (_, new_value) in zip(old, new):
+            if old_value == new_value:
+                continue
+            if kind == "quoted":
+                pattern = re.compile("'" + re.escape(old_value.replace("'", "''")) + "'")
+                replacement = "'" + new_value.replace("'", "''") + "'"
+            else:
+                pattern = re.compile(r"(?<![\w.])" + re.escape(old_value) + r"(?![\w.])")
+                replacement = new_value
+            if len(pattern.findall(sql)) != 1:
+                return None, False
+            sql = pattern.sub(lambda _: replacement, sql)
+        return sql, True
+
+    def _verify(self, sqlite_path: Path, sql: str) -> Tuple[Optional[float], Optional[str]]:
+        execution = self.executor.execute(sqlite_path, sql)
+        return execution["execution_time"], execution["error"]
+
+    def store(self, db_name: str, question: str, hint: str, sql: str) -> None:
+        """记录一个已验证的 问题 -> SQL 对"""
+        db_manager = DatabaseManager(db_name)
+        collection = self._collection(db_manager)
+        text = self._text(question, hint)
+        collection.upsert(
+            ids=[hashlib.sha1(text.encode("utf-8")).hexdigest()],
+            embeddings=db_manager.embedder.embed([text]),
+            metadatas=[{
+                "question": question,
+                "hint": hint or "",
+                "sql": sql,
+                "fingerprint": db_manager.get_schema_catalog().fingerprint,
+            }]
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
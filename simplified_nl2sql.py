@@ -1,20 +1,29 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Callable, Type, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Any, Callable, Type, Optional, AsyncIterator, Iterator
+from dataclasses import dataclass, asdict, field
+from functools import lru_cache
+import contextvars
+import queue
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 import json
+import asyncio
 import dotenv
 import os
-import sqlite3
 import time
 import re
+import ast
+import threading
+from pathlib import Path
 from pydantic import BaseModel
 from typing import Literal
 from collections import defaultdict
 
 from prompt_all import *
 from databasemanager import DatabaseManager
+from llm_client import get_chat_model, acached_invoke
+from prompt_schema import render_schema, report_prompt_tokens
+from sql_executor import SandboxedExecutor
 
 @dataclass
 class AgentContext:
@@ -33,6 +42,88 @@ class FinalAnswer(BaseModel):
     title: str
     content: str
 
+class ReasoningTrace(BaseModel):
+    """单次调用模式下一次性返回的完整推理过程"""
+    steps: List[ReasoningStep]
+    final_sql: str
+
+# stepwise：每个推理步骤一次调用；single_call：一次调用返回全部步骤和 final_sql
+REASONING_MODES = ("stepwise", "single_call")
+
+# prompt：在系统提示词中给出 JSON schema；json_mode：另外要求接口返回 JSON 对象；
+# structured：由接口按 schema 约束输出，不再在提示词中附带 schema
+OUTPUT_MODES = ("prompt", "json_mode", "structured")
+
+@dataclass
+class ChainUsage:
+    """单条思维链的调用次数和 token 用量"""
+    calls: int = 0
+    cached_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    
+    def add(self, response: AIMessage) -> None:
+        self.calls += 1
+        if response.response_metadata.get("cache") == "hit":
+            self.cached_calls += 1
+            return
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.prompt_tokens += usage.get("input_tokens", 0)
+        self.completion_tokens += usage.get("output_tokens", 0)
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+    
+    def to_dict(self) -> Dict[str, int]:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
+
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="nl2sql-sync-loop", daemon=True).start()
+        return _sync_loop
+
+def run_sync(coro):
+    """在常驻后台事件循环中运行协程并阻塞等待结果，同步接口都是它的薄封装"""
+    loop = _get_sync_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from the background event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+@dataclass
+class ProgressEvent:
+    """
+    AgentExecutor.stream / astream 产生的进度事件。
+    type: run_start / node_start / node_finish / reasoning_step / candidate_sql /
+          execution_result / final_sql / cache_hit / done / error
+    """
+    type: str
+    node: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+# 当前请求的事件接收函数；contextvars 会随 asyncio 任务和 asyncio.to_thread 传递
+_event_sink: contextvars.ContextVar[Optional[Callable[[ProgressEvent], None]]] = contextvars.ContextVar("event_sink", default=None)
+
+def emit_event(event_type: str, node: Optional[str] = None, **data) -> None:
+    """向当前请求的事件流发送一个事件；不是流式执行时什么也不做"""
+    sink = _event_sink.get()
+    if sink is not None:
+        sink(ProgressEvent(type=event_type, node=node, data=data))
+
+_STREAM_END = object()
+
 class Node(ABC):
     def __init__(self, name: str):
         self.name = name
@@ -40,39 +131,74 @@ class Node(ABC):
     @abstractmethod
     def process(self, context: AgentContext) -> Dict[str, Any]:
         pass
+    
+    async def aprocess(self, context: AgentContext) -> Dict[str, Any]:
+        # 默认在线程中运行同步实现，原生异步的节点会覆盖此方法
+        return await asyncio.to_thread(self.process, context)
 
 class AgentNode(Node):
+    model_name = 'gpt-4o'
+    temperature = 0.6
+    
     def __init__(self, name: str):
         super().__init__(name)
-        self.chat_model = ChatOpenAI(
-            openai_api_base=os.getenv("OPENAI_API_BASE"),
-            model='gpt-4o',
-            temperature=0.6
-        )
         self.system_prompt = ""
+    
+    @property
+    def chat_model(self) -> ChatOpenAI:
+        # 使用时再取共享客户端，保证拿到当前事件循环对应的连接池
+        return get_chat_model(self.model_name, self.temperature)
+
+@lru_cache(maxsize=None)
+def _schema_instruction(format_schema: Type[BaseModel]) -> str:
+    return f"\nOutput must strictly follow this JSON schema:\n{json.dumps(format_schema.model_json_schema(), indent=2)}"
 
-def make_api_call(messages, max_tokens, is_final_answer=False):
+def _response_format(format_schema: Type[BaseModel], output_mode: str) -> Dict[str, Any]:
+    if output_mode == "json_mode":
+        return {"response_format": {"type": "json_object"}}
+    if output_mode == "structured":
+        return {"response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": format_schema.__name__, "schema": format_schema.model_json_schema(), "strict": False}
+        }}
+    return {}
+
+def _format_messages(messages, format_schema: Type[BaseModel], output_mode: str) -> list:
+    """转换为 langchain 消息；schema 说明只附加在本次请求的系统消息上，不修改调用方的 messages"""
+    formatted_messages = []
+    for i, msg in enumerate(messages):
+        if msg["role"] == "system":
+            content = msg["content"]
+            if i == 0 and output_mode != "structured":
+                content += _schema_instruction(format_schema)
+            formatted_messages.append(SystemMessage(content=content))
+        elif msg["role"] == "user":
+            formatted_messages.append(HumanMessage(content=msg["content"]))
+        elif msg["role"] == "assistant":
+            formatted_messages.append(AIMessage(content=msg["content"]))
+    return formatted_messages
+
+def make_api_call(messages, max_tokens, is_final_answer=False, sample=None, output_mode="prompt", usage=None):
+    return run_sync(amake_api_call(messages, max_tokens, is_final_answer, sample, output_mode, usage))
+
+async def amake_api_call(messages, max_tokens, is_final_answer=False, sample=None, output_mode="prompt",
+                         usage: Optional[ChainUsage] = None, format_schema: Optional[Type[BaseModel]] = None):
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode '{output_mode}', expected one of {OUTPUT_MODES}")
+    if format_schema is None:
+        format_schema = ReasoningStep if not is_final_answer else FinalAnswer
+    stage = {ReasoningStep: "reasoning_step", FinalAnswer: "final_answer", ReasoningTrace: "reasoning_trace"}[format_schema]
+    formatted_messages = _format_messages(messages, format_schema, output_mode)
+    options = _response_format(format_schema, output_mode)
+    
     for attempt in range(3):
         try:
-            format_schema = ReasoningStep if not is_final_answer else FinalAnswer
-            chat_model = ChatOpenAI(
-                openai_api_base=os.getenv("OPENAI_API_BASE"),
-                model='gpt-4o',
-                temperature=0.6
-            )
-            
-            messages[0]["content"] += f"\nOutput must strictly follow this JSON schema:\n{json.dumps(format_schema.model_json_schema(), indent=2)}"
+            chat_model = get_chat_model('gpt-4o', 0.6)
             
-            formatted_messages = []
-            for msg in messages:
-                if msg["role"] == "system":
-                    formatted_messages.append(SystemMessage(content=msg["content"]))
-                elif msg["role"] == "user":
-                    formatted_messages.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    formatted_messages.append(AIMessage(content=msg["content"]))
-            
-            response = chat_model.invoke(formatted_messages)
+            report_prompt_tokens(stage, formatted_messages)
+            response = await acached_invoke(chat_model, formatted_messages, sample=sample, **options)
+            if usage is not None:
+                usage.add(response)
             
     
             try:
@@ -92,17 +218,45 @@ def make_api_call(messages, max_tokens, is_final_answer=False):
                 
         except Exception as e:
             if attempt == 2:
-                if is_final_answer:
+                if format_schema is FinalAnswer:
                     return FinalAnswer(title="Error", content=f"Failed to generate final answer after 3 attempts. Error: {str(e)}")
-                else:
-                    return ReasoningStep(title="Error", 
-                                       content=f"Failed to generate step after 3 attempts. Error: {str(e)}", 
-                                       next_action="final_answer")
-            time.sleep(1)
+                error_step = ReasoningStep(title="Error", 
+                                           content=f"Failed to generate step after 3 attempts. Error: {str(e)}", 
+                                           next_action="final_answer")
+                if format_schema is ReasoningTrace:
+                    return ReasoningTrace(steps=[error_step], final_sql="")
+                return error_step
+            await asyncio.sleep(1)
 
 # o1-like思维链生成
-def generate_o1_reasoning(prompt):
-    messages = [
+def _windowed_history(base_messages, steps: List[ReasoningStep], history_window: Optional[int]) -> list:
+    """
+    拼接每一步请求的消息：最近 history_window 步保留完整 JSON，
+    更早的步骤压缩成一条标题加内容摘要，避免历史随步数平方增长。
+    """
+    history = [{"role": "assistant", "content": step.model_dump_json()} for step in steps]
+    if history_window is not None and len(steps) > history_window:
+        older = len(steps) - history_window
+        summary = "Summary of my earlier reasoning steps:\n" + "\n".join(
+            f"- {step.title}: {step.content[:200]}" for step in steps[:older]
+        )
+        history = [{"role": "assistant", "content": summary}] + history[older:]
+    return base_messages + history
+
+def generate_o1_reasoning(prompt, sample=None, history_window=None, output_mode="prompt", usage=None):
+    return run_sync(agenerate_o1_reasoning(prompt, sample, history_window, output_mode, usage))
+
+async def agenerate_o1_reasoning(prompt, sample=None, history_window: Optional[int] = None, output_mode: str = "prompt",
+                                 usage: Optional[ChainUsage] = None):
+    """
+    Args:
+        prompt (str): 题目、表结构等用户提示。
+        sample (Optional[int]): 候选链编号，用于响应缓存区分不同采样。
+        history_window (Optional[int]): 保留完整内容的最近步骤数，None 表示保留全部历史。
+        output_mode (str): prompt / json_mode / structured。
+        usage (Optional[ChainUsage]): 累计本条链的调用次数和 token 用量。
+    """
+    base_messages = [
         {"role": "system", "content": """You are an expert SQL designer that explains your reasoning step by step. For each step, provide a title that describes what you're doing in that step, along with the content. Decide if you need another step or if you're ready to give the final answer. 
 
 When your next_action is "final_answer", you MUST include a "final_sql" field with the complete SQL query.
@@ -150,8 +304,10 @@ Your response must be in JSON format!!
     
     while True:
         print(f"\n===== COT Step {step_count} =====")
-        step_data = make_api_call(messages, 300)
+        messages = _windowed_history(base_messages, steps, history_window)
+        step_data = await amake_api_call(messages, 300, sample=sample, output_mode=output_mode, usage=usage)
         steps.append(step_data)
+        emit_event("reasoning_step", "sql_designer", sample=sample, step=step_count, **step_data.model_dump())
         
         print(f"Title: {step_data.title}")
         print(f"Content: {step_data.content[:200]}..." if len(step_data.content) > 200 else f"内容: {step_data.content}")
@@ -159,8 +315,6 @@ Your response must be in JSON format!!
         if step_data.final_sql:
             print(f"Final SQL: {step_data.final_sql}")
         
-        messages.append({"role": "assistant", "content": step_data.model_dump_json()})
-        
         if step_data.next_action == 'final_answer' and hasattr(step_data, 'final_sql') and step_data.final_sql:
             return f"FINAL SQL: {step_data.final_sql}"
         
@@ -170,8 +324,9 @@ Your response must be in JSON format!!
         step_count += 1
     
     print("\n===== Generate Final Answer =====")
+    messages = _windowed_history(base_messages, steps, history_window)
     messages.append({"role": "user", "content": "Please provide the final answer based on your reasoning above. Make sure to include the final SQL query in the 'final_sql' field."})
-    final_data = make_api_call(messages, 200, is_final_answer=True)
+    final_data = await amake_api_call(messages, 200, is_final_answer=True, sample=sample, output_mode=output_mode, usage=usage)
     
   
     print(f"最终答案标题: {final_data.title}")
@@ -184,34 +339,70 @@ Your response must be in JSON format!!
     
     return final_data.content
 
+def generate_single_call_reasoning(prompt, sample=None, output_mode="prompt", usage=None):
+    return run_sync(agenerate_single_call_reasoning(prompt, sample, output_mode, usage))
+
+async def agenerate_single_call_reasoning(prompt, sample=None, output_mode: str = "prompt",
+                                          usage: Optional[ChainUsage] = None):
+    """
+    一次调用返回完整推理步骤和 final_sql（按 ReasoningTrace 校验），
+    用部分推理深度换取更少的网络往返；返回值格式与 agenerate_o1_reasoning 相同。
+    """
+    messages = [
+        {"role": "system", "content": SINGLE_CALL_REASONING_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    trace = await amake_api_call(messages, 1500, sample=sample, output_mode=output_mode, usage=usage,
+                                 format_schema=ReasoningTrace)
+    
+    for step_count, step_data in enumerate(trace.steps, 1):
+        emit_event("reasoning_step", "sql_designer", sample=sample, step=step_count, **step_data.model_dump())
+        print(f"\n===== COT Step {step_count} =====")
+        print(f"Title: {step_data.title}")
+        print(f"Content: {step_data.content[:200]}..." if len(step_data.content) > 200 else f"内容: {step_data.content}")
+    
+    final_sql = trace.final_sql or next((step.final_sql for step in reversed(trace.steps) if step.final_sql), None)
+    if final_sql:
+        print(f"FINAL SQL: {final_sql}")
+        return f"FINAL SQL: {final_sql}"
+    return trace.steps[-1].content if trace.steps else ""
+
 class TableAgent(AgentNode):
-    def __init__(self):
+    temperature = 0
+    
+    def __init__(self, schema_style: str = "ddl", token_budget: Optional[int] = None):
+        """
+        Args:
+            schema_style (str): 数据库结构的渲染方式，ddl 或 json（最小化）。
+            token_budget (Optional[int]): 结构和列描述部分的 token 预算，超出时逐级裁剪描述。
+        """
         super().__init__("table_selector")
-        self.chat_model = ChatOpenAI(
-            openai_api_base=os.getenv("OPENAI_API_BASE"),
-            model='gpt-4o',
-            temperature=0
-        )
         self.system_prompt = TABLE_SELECTOR_PROMPT
+        self.schema_style = schema_style
+        self.token_budget = token_budget
     
     def process(self, context: AgentContext) -> Dict[str, Any]:
+        return run_sync(self.aprocess(context))
+    
+    async def aprocess(self, context: AgentContext) -> Dict[str, Any]:
         try:
+            db_manager = DatabaseManager(context.db_name)
+            column_types = {}
             if "db_schema" in context.intermediate_results:
                 all_tables_columns = context.intermediate_results["db_schema"]
             else:
-                db_manager = DatabaseManager(context.db_name)
-                all_tables_columns = db_manager.get_table_columns_dict()
+                all_tables_columns = await asyncio.to_thread(db_manager.get_table_columns_dict)
+                column_types = db_manager.get_schema_catalog().column_types_dict()
 
-            table_column_description = self._get_table_column_descriptions(
-                all_tables_columns, 
-                context.db_name
-            )
+            description_index = db_manager.get_description_index()
+            table_column_description = await asyncio.to_thread(description_index.describe, all_tables_columns)
+            schema = render_schema(all_tables_columns, table_column_description, self.schema_style,
+                                   column_types, self.token_budget)
             
-            query = f'''################################################################################################################################################################################################
-QUESTION: {context.question}
+            query = f'''QUESTION: {context.question}
 HINT: {context.hint}
-DATABASE SCHEMA: {json.dumps(all_tables_columns, ensure_ascii=False, indent=4)}
-COLUMN DESCRIPTION: {json.dumps(table_column_description, ensure_ascii=False, indent=4)}
+DATABASE SCHEMA (with column descriptions):
+{schema}
 
 This schema provides a detailed definition of the database's structure, including tables, their columns, and any relevant details about relationships or constraints.  
 
@@ -246,13 +437,15 @@ Let's think step by step as the example:
     "table1": ["column1", "column2", "..."],
     "table2": ["column3", "column4", "..."]
 }}
-################################################################################################################################################################################################
+```
 '''
             
-            result = self.chat_model.invoke([
+            messages = [
                 SystemMessage(content=self.system_prompt),
                 HumanMessage(content=query)
-            ])
+            ]
+            report_prompt_tokens(self.name, messages)
+            result = await acached_invoke(self.chat_model, messages)
             print(result.content)
             selected_tables = self._parse_json_output(result.content)
             return {"selected_tables": selected_tables}
@@ -260,61 +453,6 @@ Let's think step by step as the example:
             print(f"TableAgent error: {str(e)}")
             raise
             
-    def _get_table_column_descriptions(self, all_tables_columns: Dict[str, List[str]], db_name: str) -> Dict[str, Dict]:
-        import pandas as pd
-        table_column_description = {}
-        base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", db_name)
-        
-        encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
-
-        for table_name, column_names in all_tables_columns.items():
-            table_path = os.path.join(base_path, "database_description", f"{table_name}.csv")
-            table_description = None
-            
-            for encoding in encodings:
-                try:
-                    table_description = pd.read_csv(table_path, encoding=encoding)
-                    break  
-                except UnicodeDecodeError:
-                    continue  
-                except Exception as e:
-                    print(f"读取表{table_name}时发生非编码错误: {str(e)}")
-                    break
-                
-            if table_description is None:
-                print(f"表{table_name}的描述文件无法使用任何编码读取")
-                table_column_description[table_name] = {}
-                continue
-            
-            try:
-                column_description = {}
-                
-                for column_name in column_names:
-                    result = table_description[
-                        table_description['original_column_name'].str.contains(
-                            column_name, case=False, na=False, regex=False
-                        )
-                    ]
-                    
-                    if not result.empty:
-                        column_info = {
-                            "column_description": result.iloc[0].get('column_description', ''),
-                            "value_description": result.iloc[0].get('value_description', '')
-                        }
-                        column_description[column_name] = column_info
-                    else:
-                        column_description[column_name] = {
-                            "column_description": "",
-                            "value_description": ""
-                        }
-                
-                table_column_description[table_name] = column_description
-            except Exception as e:
-                print(f"处理表 {table_name} 描述时出错: {str(e)}")
-                table_column_description[table_name] = {}
-            
-        return table_column_description
-            
     def _parse_json_output(self, content: str) -> Dict[str, List[str]]:
         output_text = content.strip()
         
@@ -344,43 +482,307 @@ Let's think step by step as the example:
         return {}
             
         
+class ValueRetrieverAgent(AgentNode):
+    temperature = 0
+    
+    def __init__(self,
+                 top_k: int = 3,
+                 latency_budget: float = 0.5,
+                 max_distance: Optional[float] = None,
+                 use_llm_keywords: bool = True,
+                 routed_columns: int = 5):
+        """
+        Args:
+            top_k (int): 每列最多返回的不同相似值数量。
+            latency_budget (float): 关键词嵌入加向量检索的总时间预算（秒），超时的列直接跳过。
+            max_distance (Optional[float]): 相似度距离上限，超过的值丢弃。
+            use_llm_keywords (bool): 是否用 KEYWORD_EXTRACTOR_PROMPT 调用模型提取关键词；否则只用问题和提示中的字面量。
+            routed_columns (int): 每个关键词经 MinHash/LSH 路由后保留的候选列数。
+        """
+        super().__init__("value_retriever")
+        self.system_prompt = KEYWORD_EXTRACTOR_PROMPT
+        self.top_k = top_k
+        self.latency_budget = latency_budget
+        self.max_distance = max_distance
+        self.use_llm_keywords = use_llm_keywords
+        self.routed_columns = routed_columns
+        self._collections = {}
+    
+    def process(self, context: AgentContext) -> Dict[str, Any]:
+        return run_sync(self.aprocess(context))
+    
+    async def aprocess(self, context: AgentContext) -> Dict[str, Any]:
+        try:
+            selected_tables = context.intermediate_results.get("selected_tables", {})
+            keywords = await self._extract_keywords(context)
+            if not keywords or not selected_tables:
+                return {"keywords": keywords, "similar_values": {}}
+            
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.latency_budget
+            db_manager = DatabaseManager(context.db_name)
+            similar_values = {}
+            
+            # 先查字面值索引，命中的关键词不再做向量检索
+            unresolved = keywords
+            columns = [(table, column) for table, cols in selected_tables.items() for column in cols]
+            value_index = db_manager.get_value_index()
+            if value_index is not None:
+                unresolved = await asyncio.to_thread(self._lexical_lookup, value_index, keywords, columns, similar_values)
+            if not unresolved:
+                return {"keywords": keywords, "similar_values": similar_values}
+            
+            # 用 MinHash/LSH 把剩余关键词路由到少数候选列，只查询这些列的向量集合
+            lsh_index = db_manager.get_lsh_index()
+            if lsh_index is not None:
+                routed = self._route_columns(lsh_index, unresolved, columns)
+                if routed is not None:
+                    selected_tables = {}
+                    for table, column in routed:
+                        selected_tables.setdefault(table, []).append(column)
+            
+            # 先确认有可查的向量集合，没有时不必嵌入；向量库不可用时与超时一样跳过
+            try:
+                collections = await asyncio.to_thread(self._column_collections, db_manager, selected_tables)
+            except Exception as e:
+                print(f"向量库不可用（{e}），跳过相似值检索")
+                return {"keywords": keywords, "similar_values": similar_values}
+            if not collections:
+                return {"keywords": keywords, "similar_values": similar_values}
+            
+            # 剩余关键词一次嵌入；嵌入服务超时或不可达（例如 Ollama 未启动）都只跳过相似值检索
+            try:
+                vectors = await asyncio.wait_for(
+                    asyncio.to_thread(db_manager.embedder.embed, unresolved),
+                    self.latency_budget
+                )
+            except asyncio.TimeoutError:
+                print(f"关键词嵌入超过时间预算 {self.latency_budget}s，跳过相似值检索")
+                return {"keywords": keywords, "similar_values": similar_values}
+            except Exception as e:
+                print(f"关键词嵌入失败（{e}），跳过相似值检索")
+                return {"keywords": keywords, "similar_values": similar_values}
+            
+            tasks = {
+                asyncio.create_task(asyncio.to_thread(self._query_collection, collection, vectors)): (table, column)
+                for (table, column), collection in collections.items()
+            }
+            if tasks:
+                done, pending = await asyncio.wait(tasks, timeout=max(deadline - loop.time(), 0))
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    print(f"{len(pending)} 列的相似值检索超过时间预算，已跳过")
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    table, column = tasks[task]
+                    if task.exception() is not None:
+                        # 集合可能已被重建（旧句柄失效），下次重新获取
+                        self._forget_collection(collections[(table, column)])
+                        continue
+                    self._merge_values(similar_values, table, column, task.result())
+            
+            return {"keywords": keywords, "similar_values": similar_values}
+        except Exception as e:
+            print(f"ValueRetrieverAgent error: {str(e)}")
+            raise
+    
+    def _merge_values(self, similar_values: Dict[str, Dict[str, List[str]]], table: str, column: str, values: List[str]) -> None:
+        if not values:
+            return
+        merged = similar_values.setdefault(table, {}).setdefault(column, [])
+        for value in values:
+            if value not in merged and len(merged) < self.top_k:
+                merged.append(value)
+    
+    def _lexical_lookup(self, value_index, keywords: List[str], columns: List[tuple],
+                        similar_values: Dict[str, Dict[str, List[str]]]) -> List[str]:
+        """字面值精确/模糊匹配，返回未命中的关键词"""
+        unresolved = []
+        for keyword in keywords:
+            matches = value_index.lookup(keyword, columns, limit=self.top_k)
+            if not matches:
+                unresolved.append(keyword)
+            for match in matches:
+                self._merge_values(similar_values, match["table"], match["column"], [match["value"]])
+        return unresolved
+    
+    def _route_columns(self, lsh_index, keywords: List[str], columns: List[tuple]) -> Optional[List[tuple]]:
+        """
+        返回所有关键词候选列的并集；只要有一个关键词没有路由到任何列
+        （可能是语义匹配而非字面相似，例如 male -> 'M'），返回 None 表示查询全部列。
+        """
+        routed = {}
+        for keyword in keywords:
+            candidates = lsh_index.route(keyword, columns, top_n=self.routed_columns)
+            if not candidates:
+                return None
+            for column, _ in candidates:
+                routed[column] = True
+        return list(routed)
+    
+    async def _extract_keywords(self, context: AgentContext) -> List[str]:
+        keywords = self._literal_keywords(f"{context.question} {context.hint}")
+        if self.use_llm_keywords:
+            messages = [
+                SystemMessage(content=self.system_prompt),
+                HumanMessage(content=f'Question: "{context.question}"\nHint: "{context.hint}"\nOutput:')
+            ]
+            report_prompt_tokens(self.name, messages)
+            result = await acached_invoke(self.chat_model, messages)
+            keywords.extend(self._parse_keywords(result.content))
+        return list(dict.fromkeys(k.strip() for k in keywords if k and k.strip()))
+    
+    def _literal_keywords(self, text: str) -> List[str]:
+        """问题和提示中被引号包裹的字面量，例如 SEX = 'M' 中的 M"""
+        return re.findall(r"'([^']+)'", text) + re.findall(r'"([^"]+)"', text)
+    
+    def _parse_keywords(self, content: str) -> List[str]:
+        matches = re.findall(r'\[.*?\]', content, re.DOTALL)
+        for match in reversed(matches):
+            try:
+                parsed = ast.literal_eval(match)
+            except (ValueError, SyntaxError):
+                continue
+            if isinstance(parsed, list):
+                return [str(item) for item in parsed]
+        print(f"无法解析关键词: {content}")
+        return []
+    
+    def _column_collections(self, db_manager: DatabaseManager, selected_tables: Dict[str, List[str]]) -> Dict[tuple, Any]:
+        """把选中的列映射到 save_vectordb 生成的 {db}_{table}_columnN 集合"""
+        catalog = db_manager.get_schema_catalog()
+        collections = {}
+        for table, columns in selected_tables.items():
+            if table not in catalog.tables:
+                continue
+            names = db_manager.convert_chromadb_name(db_manager.db_name, table, catalog.column_names(table))
+            for column in columns:
+                name = names.get(column)
+                if name is None:
+                    continue
+                # 只缓存已存在的集合：之后才建好索引的列下次查找就能用上
+                if name not in self._collections:
+                    try:
+                        self._collections[name] = db_manager.client.get_collection(name)
+                    except Exception:
+                        continue
+                collections[(table, column)] = self._collections[name]
+        return collections
+    
+    def _forget_collection(self, collection) -> None:
+        for name, cached in list(self._collections.items()):
+            if cached is collection:
+                del self._collections[name]
+    
+    def _query_collection(self, collection, vectors: List[List[float]]) -> List[str]:
+        # save_vectordb 为每个不同的值只存一个向量，最近的 top_k 个结果就是 top_k 个不同的值
+        result = collection.query(
+            query_embeddings=vectors,
+            n_results=self.top_k,
+            include=['metadatas', 'distances']
+        )
+        scored = {}
+        for metadatas, distances in zip(result['metadatas'], result['distances']):
+            kept = 0
+            for meta, distance in zip(metadatas, distances):
+                if self.max_distance is not None and distance > self.max_distance:
+                    continue
+                value = meta.get('text')
+                if value is None or value == 'null':
+                    continue
+                if value not in scored:
+                    kept += 1
+                scored[value] = min(distance, scored.get(value, distance))
+                if kept >= self.top_k:
+                    break
+        return [value for value, _ in sorted(scored.items(), key=lambda item: item[1])][:self.top_k]
+    
+        
 class SQLDesignerAgent(AgentNode):
-    def __init__(self):
+    def __init__(self,
+                 num_candidates: int = 3,
+                 max_workers: Optional[int] = None,
+                 chain_timeout: Optional[float] = None,
+                 agreement_quorum: Optional[int] = None,
+                 execution_quorum: Optional[int] = None,
+                 max_candidates: Optional[int] = None,
+                 schema_style: str = "ddl",
+                 token_budget: Optional[int] = None,
+                 history_window: Optional[int] = 4,
+                 output_mode: str = "prompt",
+                 reasoning_mode: str = "stepwise",
+                 executor: Optional[SandboxedExecutor] = None):
+        """
+        Args:
+            num_candidates (int): 并行生成的候选思维链数量。
+            max_workers (Optional[int]): 同时运行的思维链上限，默认等于 num_candidates；设为 1 即串行。
+            chain_timeout (Optional[float]): 单条思维链的时间预算（秒），超时的链被放弃。
+            agreement_quorum (Optional[int]): 当有这么多条候选给出相同 SQL 时，取消其余仍在运行的链。
+            execution_quorum (Optional[int]): 每个候选一产生就执行，当有这么多条候选返回相同结果集时，取消其余的链；
+                设置后优先于 agreement_quorum。
+            max_candidates (Optional[int]): 候选不一致时最多追加到的思维链总数，默认等于 num_candidates（不追加）。
+            schema_style (str): 选中表结构的渲染方式，ddl 或 json（最小化）。
+            token_budget (Optional[int]): 表结构和列描述部分的 token 预算，超出时逐级裁剪描述。
+            history_window (Optional[int]): 思维链每一步保留完整内容的最近步骤数，更早的步骤只发送摘要；None 表示发送全部历史。
+            output_mode (str): 推理步骤的输出约束方式，prompt / json_mode / structured。
+            reasoning_mode (str): 默认推理方式，stepwise 或 single_call；单个请求可通过中间结果 reasoning_mode 覆盖。
+            executor (Optional[SandboxedExecutor]): 按结果投票时执行候选的受限执行器。RefinerAgent 直接沿用这里的执行结果，
+                因此应与流水线中 RefinerAgent 使用同一个执行器，超时、行数上限和指纹模式才一致。
+        """
         super().__init__("sql_designer")
-        self.chat_model = ChatOpenAI(
-            openai_api_base=os.getenv("OPENAI_API_BASE"),
-            model='gpt-4o',
-            temperature=0.6
-        )
+        self.num_candidates = num_candidates
+        self.max_workers = max_workers or num_candidates
+        self.chain_timeout = chain_timeout
+        self.agreement_quorum = agreement_quorum
+        self.execution_quorum = execution_quorum
+        self.max_candidates = max(max_candidates or num_candidates, num_candidates)
+        # 只用于记录执行结果和计算投票键，执行本身使用传入的共享执行器
+        self.refiner = RefinerAgent(executor=executor)
+        self.schema_style = schema_style
+        self.token_budget = token_budget
+        self.history_window = history_window
+        self.output_mode = output_mode
+        self.reasoning_mode = reasoning_mode
     
     def process(self, context: AgentContext) -> Dict[str, Any]:
+        return run_sync(self.aprocess(context))
+    
+    async def aprocess(self, context: AgentContext) -> Dict[str, Any]:
         try:
             selected_tables = context.intermediate_results.get("selected_tables", {})
             
             db_manager = DatabaseManager(context.db_name)
-            keys_info = db_manager.get_primary_foreign_keys()
+            keys_info = await asyncio.to_thread(db_manager.get_primary_foreign_keys)
             
             # 获取表和列描述信息，不包含示例值
-            description = self._get_table_column_descriptions(
-                selected_tables, 
-                context.db_name
-            )
+            description = await asyncio.to_thread(db_manager.get_description_index().describe, selected_tables)
+            # 标注检索到的相似值
+            for table, columns in context.intermediate_results.get("similar_values", {}).items():
+                for column, values in columns.items():
+                    if column in description.get(table, {}):
+                        description[table][column]["EXAMPLE"] = values
                         
-            sql_candidates = []
+            o1_query = self._construct_o1_sql_query(
+                question=context.question,
+                hint=context.hint,
+                description=description,
+                filter_table_column=selected_tables,
+                primary_keys=keys_info["primary_keys"],
+                foreign_keys=keys_info["foreign_keys"],
+                column_types=db_manager.get_schema_catalog().column_types_dict()
+            )
             
-            # 生成3个候选SQL，全部使用o1-like思维链
-            for run in range(3):
-                print(f"使用o1-like思维链生成SQL... (运行 {run + 1}/3)")
-                o1_query = self._construct_o1_sql_query(
-                    question=context.question,
-                    hint=context.hint,
-                    description=description,
-                    filter_table_column=selected_tables,
-                    primary_keys=keys_info["primary_keys"],
-                    foreign_keys=keys_info["foreign_keys"]
-                )
-                o1_result = generate_o1_reasoning(o1_query)
-                sql_candidates.append(o1_result)
+            # 并行生成候选SQL，全部使用o1-like思维链
+            usages = []
+            executions = [] if self.execution_quorum else None
+            reasoning_mode = context.intermediate_results.get("reasoning_mode") or self.reasoning_mode
+            sql_candidates = await self._agenerate_candidates(
+                o1_query, usages, reasoning_mode,
+                sqlite_path=db_manager.sqlite_path if self.execution_quorum else None,
+                executions=executions
+            )
             
             # 清理SQL结果
             cleaned_sql_candidates = self._clean_sql_results(sql_candidates)
@@ -390,92 +792,145 @@ class SQLDesignerAgent(AgentNode):
             for i, sql in enumerate(cleaned_sql_candidates):
                 print(f"\nSQL {i+1}: {sql[:100]}..." if len(sql) > 100 else f"SQL {i+1}: {sql}")
             
-            return {
-                "sql_candidates": cleaned_sql_candidates
+            result = {
+                "sql_candidates": cleaned_sql_candidates,
+                "token_usage": [usage.to_dict() for usage in usages]
             }
+            if executions is not None:
+                # 候选已经执行过，RefinerAgent 直接使用这些结果
+                result["candidate_results"] = executions
+            return result
         except Exception as e:
             print(f"SQLDesignerAgent错误: {str(e)}")
             raise
     
-    def _get_table_column_descriptions(self, all_tables_columns: Dict[str, List[str]], db_name: str) -> Dict[str, Dict]:
-        import pandas as pd
-        table_column_description = {}
-        base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", db_name)
-        
-        encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
+    async def _agenerate_candidates(self, o1_query: str, usages: Optional[List[ChainUsage]] = None,
+                                    reasoning_mode: Optional[str] = None, sqlite_path: Optional[Path] = None,
+                                    executions: Optional[List[Dict[str, Any]]] = None) -> List[str]:
+        """
+        并发运行候选思维链，返回各链的原始输出。
 
-        for table_name, column_names in all_tables_columns.items():
-            table_path = os.path.join(base_path, "database_description", f"{table_name}.csv")
-            table_description = None
-            
-            for encoding in encodings:
-                try:
-                    table_description = pd.read_csv(table_path, encoding=encoding)
-                    break  
-                except UnicodeDecodeError:
-                    continue  
-                except Exception as e:
-                    print(f"读取表{table_name}时发生非编码错误: {str(e)}")
+        设置 execution_quorum 且给出 sqlite_path 时，每个候选一产生就在只读连接上执行并按结果集投票，
+        执行结果追加到 executions；否则按 agreement_quorum 对规范化后的 SQL 文本投票。
+        达到一致数量后取消剩余的链；剩余的链全部一致也凑不够票数时追加新的链，总数不超过 max_candidates。
+        usages 收集每条链（包括被取消的链）的用量。
+        """
+        reasoning_mode = reasoning_mode or self.reasoning_mode
+        if reasoning_mode not in REASONING_MODES:
+            raise ValueError(f"Unknown reasoning mode '{reasoning_mode}', expected one of {REASONING_MODES}")
+        semaphore = asyncio.Semaphore(self.max_workers)
+        candidates = []
+        votes = defaultdict(int)
+        execute = bool(self.execution_quorum) and sqlite_path is not None
+        quorum = self.execution_quorum if execute else self.agreement_quorum
+        
+        async def run_chain(run: int) -> str:
+            usage = ChainUsage()
+            if usages is not None:
+                usages.append(usage)
+            async with semaphore:
+                print(f"使用o1-like思维链生成SQL... (运行 {run + 1}/{self.max_candidates})")
+                if reasoning_mode == "single_call":
+                    reasoning = agenerate_single_call_reasoning(o1_query, sample=run, output_mode=self.output_mode, usage=usage)
+                else:
+                    reasoning = agenerate_o1_reasoning(o1_query, sample=run, history_window=self.history_window,
+                                                       output_mode=self.output_mode, usage=usage)
+                if self.chain_timeout:
+                    result = await asyncio.wait_for(reasoning, self.chain_timeout)
+                else:
+                    result = await reasoning
+                sql = self._clean_sql_results([result])
+                emit_event("candidate_sql", self.name, sample=run, sql=sql[0] if sql else None, usage=usage.to_dict())
+                return result
+        
+        async def vote(result: str) -> bool:
+            reached = False
+            for sql in self._clean_sql_results([result]):
+                if execute:
+                    execution = await asyncio.to_thread(self.refiner.execute_candidate, sqlite_path, sql)
+                    if executions is not None:
+                        executions.append(execution)
+                    if execution["status"] != "ok":
+                        continue
+                    key = self.refiner._result_key(execution)
+                else:
+                    key = ' '.join(sql.lower().split())
+                votes[key] += 1
+                reached = reached or votes[key] >= quorum
+            return reached
+        
+        tasks = {}
+        next_run = 0
+        
+        def launch(count: int) -> None:
+            nonlocal next_run
+            for _ in range(count):
+                tasks[asyncio.create_task(run_chain(next_run))] = next_run
+                next_run += 1
+        
+        launch(self.num_candidates)
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                reached = False
+                for task in done:
+                    del tasks[task]
+                    try:
+                        result = task.result()
+                    except asyncio.TimeoutError:
+                        print(f"思维链超过时间预算 {self.chain_timeout}s，已放弃")
+                        continue
+                    except Exception as e:
+                        print(f"思维链执行失败: {str(e)}")
+                        continue
+                    candidates.append(result)
+                    if quorum and await vote(result):
+                        reached = True
+                if reached:
+                    print(f"已有 {quorum} 个候选一致，取消其余思维链")
                     break
                 
-            if table_description is None:
-                print(f"表{table_name}的描述文件无法使用任何编码读取")
-                table_column_description[table_name] = {}
-                continue
-            
-            try:
-                column_description = {}
-                
-                for column_name in column_names:
-                    result = table_description[
-                        table_description['original_column_name'].str.contains(
-                            column_name, case=False, na=False, regex=False
-                        )
-                    ]
-                    
-                    if not result.empty:
-                        column_info = {
-                            "column_description": result.iloc[0].get('column_description', ''),
-                            "value_description": result.iloc[0].get('value_description', '')
-                        }
-                        column_description[column_name] = column_info
-                    else:
-                        column_description[column_name] = {
-                            "column_description": "",
-                            "value_description": ""
-                        }
-                
-                table_column_description[table_name] = column_description
-            except Exception as e:
-                print(f"处理表 {table_name} 描述时出错: {str(e)}")
-                table_column_description[table_name] = {}
-            
-        return table_column_description
+                # 仍在运行的链即使全部与票数最多的一组一致也达不到 quorum 时，追加新的链
+                if quorum:
+                    shortfall = quorum - max(votes.values(), default=0) - len(tasks)
+                    extra = min(shortfall, self.max_candidates - next_run)
+                    if extra > 0:
+                        print(f"候选结果不一致，追加 {extra} 条思维链")
+                        emit_event("escalate", self.name, extra=extra, total=next_run + extra)
+                        launch(extra)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        return candidates
     
     def _construct_o1_sql_query(self, **kwargs) -> str:
-       
-        return f'''
-    Question: {kwargs['question']}
-    Hint: {kwargs['hint']}
-
-    FILTER TABLE-COLUMN: {json.dumps(kwargs['filter_table_column'], ensure_ascii=False, indent=4)}
-    COLUMN DESCRIPTION: {json.dumps(kwargs['description'], ensure_ascii=False, indent=4)}
-    PRIMARY KEYS: {json.dumps(kwargs['primary_keys'], ensure_ascii=False, indent=4)}
-    JOIN CONDITION: {json.dumps(kwargs['foreign_keys'], ensure_ascii=False, indent=4)}
-    
-    IMPORTANT SQL DESIGN GUIDELINES:
-    
-    1. When finding maximum or minimum values based on specific conditions, use ORDER BY + LIMIT 1 instead of MAX/MIN in subqueries.
-    2. Pay attention to the data storage format when sorting, comparing sizes, or performing calculations. If the data is in string format, process it using INSTR or SUBSTR before comparison.
-    3. If your query includes an ORDER BY clause to sort results, only include columns used for sorting in the SELECT clause if specifically requested in the question. Otherwise, omit these columns from the SELECT clause.
-    4. Ensure you only output information requested in the question. If the question asks for specific columns, ensure the SELECT clause only includes those columns, nothing more.
-    5. The query should return all information requested in the question - no more, no less.
-    6. For key phrases mentioned in the question, we have marked the most similar values with "EXAMPLE" in front of the corresponding column names. This is an important hint indicating the correct columns to use for SQL queries.
-    7. NEVER use || ' ' || for string concatenation. This is strictly prohibited and will result in severe penalties.
-    
-    Please analyze this SQL problem and provide a solution.
-    Your response must be in JSON format!!
-    '''
+        # SQL 设计准则已在 generate_o1_reasoning 的系统提示词中，这里只放题目和精简后的表结构
+        tables = kwargs['filter_table_column']
+        schema = render_schema(tables, kwargs['description'], self.schema_style,
+                               kwargs.get('column_types'), self.token_budget)
+        primary_keys = "; ".join(
+            f"{table}({', '.join(columns)})"
+            for table, columns in kwargs['primary_keys'].items()
+            if columns and (not tables or table in tables)
+        )
+        join_conditions = "; ".join(
+            condition for condition in kwargs['foreign_keys']
+            # 部分硬编码的外键写成 'Match."league_id" = League."id"'，等号两侧带空格
+            if not tables or all(side.strip().split('."')[0] in tables for side in condition.split('='))
+        )
+        return f'''Question: {kwargs['question']}
+Hint: {kwargs['hint']}
+
+FILTER TABLE-COLUMN (with column descriptions):
+{schema}
+PRIMARY KEYS: {primary_keys or "none"}
+JOIN CONDITION: {join_conditions or "none"}
+
+Please analyze this SQL problem and provide a solution.
+Your response must be in JSON format!!
+'''
     
     def _clean_sql_results(self, sql_candidates: List[str]) -> List[str]:
         """清理SQL结果，提取实际的SQL语句"""
@@ -501,67 +956,97 @@ class SQLDesignerAgent(AgentNode):
         return cleaned_candidates
 
 class RefinerAgent(AgentNode):
-    def __init__(self):
+    temperature = 0
+    
+    def __init__(self, executor: Optional[SandboxedExecutor] = None, timing_runs: int = 3,
+                 time_tolerance: float = 0.1, max_timed_seconds: float = 1.0):
+        """
+        Args:
+            executor (Optional[SandboxedExecutor]): 候选 SQL 的受限执行器，默认每个查询 10 秒预算、最多 50 行。
+            timing_runs (int): 票数相同的候选之间比较代价时，每个候选重复执行测量热缓存耗时的次数。
+            time_tolerance (float): 热耗时与最快者相差在该比例（至少 0.5ms）以内视为一样快，改按查询计划代价选择。
+            max_timed_seconds (float): 首次执行超过该时间的候选不再重复执行，直接使用首次耗时。
+        """
         super().__init__("refiner")
-        self.chat_model = ChatOpenAI(
-            openai_api_base=os.getenv("OPENAI_API_BASE"),
-            model='gpt-4o',
-            temperature=0
-        )
+        self.executor = executor or SandboxedExecutor()
+        self.timing_runs = timing_runs
+        self.time_tolerance = time_tolerance
+        self.max_timed_seconds = max_timed_seconds
     
     def process(self, context: AgentContext) -> Dict[str, Any]:
+        return run_sync(self.aprocess(context))
+    
+    async def aprocess(self, context: AgentContext) -> Dict[str, Any]:
         try:
             sql_candidates = context.intermediate_results.get("sql_candidates", [])
             
             sql_candidates = [sql.strip() for sql in sql_candidates]
             sql_candidates = [sql[:-1] if sql.endswith(';') else sql for sql in sql_candidates]
             db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", context.db_name, f"{context.db_name}.sqlite")
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            results_list = []
             
-            for sql in sql_candidates:
-                results, execution_time, error = self._execute_sql(cursor, sql)
-                
-                if not error:
-                    results_list.append({
-                        "sql": sql,
-                        "execution_time": execution_time,
-                        "results": results[:3]  
-                    })
+            # SQLDesignerAgent 按结果投票时已经执行过全部候选
+            executions = context.intermediate_results.get("candidate_results")
+            if executions is None:
+                # SQLite 调用是阻塞的，放到线程中执行，execute_many 再在执行器自己的线程池里并行
+                executions = [self._record(entry) for entry in
+                              await asyncio.to_thread(self.executor.execute_many, db_path, sql_candidates)]
             
-            conn.close()
+            results_list = [entry for entry in executions if entry["status"] == "ok"]
+            # 出错和超时的候选都保留在输出中，而不是直接丢弃
+            failed_candidates = [
+                {"sql": entry["sql"], "status": entry["status"], "error": entry["error"]}
+                for entry in executions if entry["status"] != "ok"
+            ]
+            for entry in failed_candidates:
+                if entry["status"] == "timeout":
+                    print(f"候选 SQL 超时: {entry['sql'][:100]}")
             
+            candidate_costs = []
             if results_list:
-                best_sql = self._select_best_sql(results_list)
-                return {"final_sql": best_sql}
+                best_sql, candidate_costs = await asyncio.to_thread(self._select_best_sql, results_list, db_path)
             else:
-                return {"final_sql": "No valid SQL queries were generated.REJECTED"}
+                best_sql = "No valid SQL queries were generated.REJECTED"
+            return {"final_sql": best_sql, "failed_candidates": failed_candidates, "candidate_costs": candidate_costs}
         except Exception as e:
             print(f"RefinerAgent error: {str(e)}")
             raise
+    
+    def _record(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """发出 execution_result 事件；结果只保留前 3 行作为预览，投票使用完整结果集的指纹"""
+        rows = entry["results"][:3] if entry["results"] is not None else None
+        emit_event("execution_result", self.name, sql=entry["sql"], status=entry["status"],
+                   execution_time=entry["execution_time"], row_count=entry["row_count"],
+                   fingerprint=entry["fingerprint"], error=entry["error"],
+                   rows=[list(row) for row in rows] if rows is not None else None)
+        return {**entry, "results": rows}
+    
+    def execute_candidate(self, sqlite_path: Path, sql: str) -> Dict[str, Any]:
+        """用受限执行器执行一个候选 SQL，返回 sql、status、execution_time、results（前 3 行）、truncated、row_count、fingerprint 和 error"""
+        sql = sql.strip()
+        sql = sql[:-1] if sql.endswith(';') else sql
+        return self._record(self.executor.execute(sqlite_path, sql))
+    
+    @staticmethod
+    def _result_key(entry: Dict[str, Any]) -> str:
+        """投票用的结果集键：执行器对完整结果集计算的指纹（默认忽略行顺序）"""
+        return entry["fingerprint"]
             
-    def _execute_sql(self, cursor, sql: str) -> tuple:
-        start_time = time.time()
-        try:
-            cursor.execute(sql)
-            results = cursor.fetchmany(50)
-            execution_time = time.time() - start_time
-            return results, execution_time, None
-        except sqlite3.Error as e:
-            return None, None, str(e)
-            
-    def _select_best_sql(self, results_list: List[Dict]) -> str:
+    def _select_best_sql(self, results_list: List[Dict], db_path: Optional[str] = None) -> tuple:
+        """
+        按结果指纹投票；票数最多的组（可能有多个）中的候选再按代价选择：
+        先比较多次执行的热缓存耗时，相差在 time_tolerance 以内时选查询计划问题最少的。
+
+        Returns:
+            tuple: (最终 SQL, 每个参与代价比较的候选的 votes、耗时和查询计划)
+        """
         result_groups = defaultdict(list)
         for entry in results_list:
-            sorted_rows = sorted([tuple(row) for row in entry["results"]], key=lambda x: x)
-            group_key = tuple(sorted_rows)
-            print(group_key)
-            result_groups[group_key].append( (entry["sql"], entry["execution_time"]) )
+            group_key = self._result_key(entry)
+            print(f"{group_key[:12]} rows={entry['row_count']} {entry['sql'][:80]}")
+            result_groups[group_key].append(entry)
         
         if not result_groups:
-            return "No valid SQL queries generated.REJECTED"
+            return "No valid SQL queries generated.REJECTED", []
         
         
         max_votes = max(len(group) for group in result_groups.values())
@@ -571,23 +1056,51 @@ class RefinerAgent(AgentNode):
             if len(group) == max_votes
         ]
         
-        min_exec_queries = []
+        # 同一条 SQL 可能被多条思维链生成，只测量一次
+        finalists = {}
         for group in candidate_groups:
-            fastest_in_group = min(group, key=lambda x: x[1])
-            min_exec_queries.append(fastest_in_group)
-
-
-        best_query = min(min_exec_queries, key=lambda x: x[1])
-        return best_query[0]
+            for entry in group:
+                finalists.setdefault(entry["sql"], entry)
+        
+        costs = []
+        for sql, entry in finalists.items():
+            cost = {"sql": sql, "votes": max_votes, "cold_time": entry["execution_time"],
+                    "warm_times": [], "warm_time": entry["execution_time"]}
+            if db_path is not None:
+                cost.update({key: value for key, value in self.executor.explain(db_path, sql).items() if key != "error"})
+                if len(finalists) > 1 and entry["execution_time"] <= self.max_timed_seconds:
+                    measured = self.executor.measure(db_path, sql, self.timing_runs)
+                    if measured["warm_time"] is not None:
+                        cost.update(measured)
+            costs.append(cost)
+        
+        fastest = min(cost["warm_time"] for cost in costs)
+        tolerance = max(fastest * self.time_tolerance, 0.0005)
+        near_fastest = [cost for cost in costs if cost["warm_time"] <= fastest + tolerance]
+        best = min(near_fastest, key=lambda cost: (cost.get("penalty", 0), cost["warm_time"]))
+        for cost in costs:
+            cost["selected"] = cost is best
+        return best["sql"], costs
 
 class AgentExecutor:
-    def __init__(self):
+    def __init__(self, semantic_cache=None):
+        """
+        Args:
+            semantic_cache: 可选的语义问题缓存（semantic_cache.SemanticQuestionCache），
+                命中时直接返回已验证的 SQL，不再运行各个节点。
+        """
         self._nodes: List[Node] = []
+        self.semantic_cache = semantic_cache
     
     def add_node(self, node: Node) -> None:
         self._nodes.append(node)
     
-    def execute(self, question: str, hint: str, db_name: str, db_schema: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    def execute(self, question: str, hint: str, db_name: str, db_schema: Optional[Dict[str, List[str]]] = None,
+                reasoning_mode: Optional[str] = None) -> Dict[str, Any]:
+        return run_sync(self.aexecute(question, hint, db_name, db_schema, reasoning_mode))
+    
+    async def aexecute(self, question: str, hint: str, db_name: str, db_schema: Optional[Dict[str, List[str]]] = None,
+                       reasoning_mode: Optional[str] = None) -> Dict[str, Any]:
         context = AgentContext(
             question=question,
             hint=hint,
@@ -598,6 +1111,23 @@ class AgentExecutor:
         # 如果提供了数据库结构，添加到中间结果中
         if db_schema is not None:
             context.intermediate_results["db_schema"] = db_schema
+        # 本次请求的推理方式（stepwise / single_call），由 SQLDesignerAgent 读取
+        if reasoning_mode is not None:
+            context.intermediate_results["reasoning_mode"] = reasoning_mode
+        
+        # 自定义 schema 的请求不走语义缓存
+        use_cache = self.semantic_cache is not None and db_schema is None
+        if use_cache:
+            try:
+                hit = await asyncio.to_thread(self.semantic_cache.lookup, db_name, question, hint)
+            except Exception as e:
+                print(f"Semantic cache lookup failed: {str(e)}")
+                hit = None
+            if hit is not None:
+                print(f"语义缓存命中 (similarity={hit['similarity']:.3f}): {hit['cached_question']}")
+                emit_event("cache_hit", **hit)
+                emit_event("final_sql", sql=hit["sql"])
+                return {"final_sql": hit["sql"], "semantic_cache": hit}
         
         try:
             for node in self._nodes:
@@ -606,13 +1136,94 @@ class AgentExecutor:
                     print(f"Agent: {node.name}")
                 else:
                     print(f"Tool: {node.name}")
-                result = node.process(context)
+                emit_event("node_start", node.name)
+                start = time.perf_counter()
+                result = await node.aprocess(context)
                 print(f"输出结果:")
                 print(result)
                 context.intermediate_results.update(result)
+                emit_event("node_finish", node.name, elapsed=time.perf_counter() - start, result=result)
+            
+            final_sql = context.intermediate_results.get("final_sql", "")
+            if final_sql:
+                emit_event("final_sql", sql=final_sql)
+            if use_cache and final_sql and "REJECTED" not in final_sql:
+                try:
+                    await asyncio.to_thread(self.semantic_cache.store, db_name, question, hint, final_sql)
+                except Exception as e:
+                    print(f"Semantic cache store failed: {str(e)}")
             return context.intermediate_results
         except Exception as e:
             raise
+    
+    async def astream(self, question: str, hint: str, db_name: str, db_schema: Optional[Dict[str, List[str]]] = None,
+                      reasoning_mode: Optional[str] = None) -> AsyncIterator[ProgressEvent]:
+        """
+        以异步迭代器的形式执行，逐个产出 ProgressEvent，最后一个事件为 done（data["results"]）或 error。
+        调用方提前退出迭代（break / aclose）时，正在运行的节点和思维链会被取消。
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        
+        def sink(event: ProgressEvent) -> None:
+            # 事件可能来自 asyncio.to_thread 的工作线程
+            loop.call_soon_threadsafe(events.put_nowait, event)
+        
+        async def run() -> None:
+            _event_sink.set(sink)
+            sink(ProgressEvent("run_start", data={"question": question, "hint": hint, "db_name": db_name}))
+            try:
+                results = await self.aexecute(question, hint, db_name, db_schema, reasoning_mode)
+                sink(ProgressEvent("done", data={"results": results}))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                sink(ProgressEvent("error", data={"error": str(e)}))
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, _STREAM_END)
+        
+        # 任务创建时复制当前上下文，sink 只在该任务及其子任务中生效
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await events.get()
+                if event is _STREAM_END:
+                    break
+                yield event
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+    
+    def stream(self, question: str, hint: str, db_name: str, db_schema: Optional[Dict[str, List[str]]] = None,
+               reasoning_mode: Optional[str] = None) -> Iterator[ProgressEvent]:
+        """astream 的同步生成器版本，在后台事件循环中执行；提前关闭生成器会取消执行"""
+        events: "queue.Queue" = queue.Queue()
+        
+        async def pump() -> None:
+            try:
+                async for event in self.astream(question, hint, db_name, db_schema, reasoning_mode):
+                    events.put(event)
+            finally:
+                events.put(_STREAM_END)
+        
+        loop = _get_sync_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("stream() cannot be called from the background event loop; use astream() instead")
+        
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                event = events.get()
+                if event is _STREAM_END:
+                    break
+                yield event
+        finally:
+            future.cancel()
 
 def main():
     """主函数"""
@@ -621,10 +1232,12 @@ def main():
     # 创建执行器
     executor = AgentExecutor()
     
-    # 添加核心Agent
+    # 添加核心Agent，设计器和精炼器共用一个 SQL 执行器
+    sql_executor = SandboxedExecutor()
     executor.add_node(TableAgent())
-    executor.add_node(SQLDesignerAgent())
-    executor.add_node(RefinerAgent())
+    executor.add_node(ValueRetrieverAgent())
+    executor.add_node(SQLDesignerAgent(executor=sql_executor))
+    executor.add_node(RefinerAgent(executor=sql_executor))
     
     # 测试问题
     question = "有多少男患者的总胆红素水平升高？"
@@ -0,0 +1,190 @@
+import sys
+import time
+import statistics
+import sqlite3
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from connection_pool import get_connection_pool, PoolTimeout
+from result_fingerprint import ResultFingerprint
+from query_plan import explain_query_plan, analyze_plan
+
+EXECUTION_STATUSES = ("ok", "error", "timeout")
+
+# 候选 SQL 只允许读：连接会放回共享连接池，PRAGMA（例如 query_only=0）、临时表 / 视图 / 触发器、
+# 写入、事务和 ATTACH 都会改变之后借到这个连接的查询，因此只放行查询本身需要的动作
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def _authorizer(action: int, *args) -> int:
+    return sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def _row_size(row: tuple) -> int:
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class SandboxedExecutor:
+    """
+    受限的候选 SQL 执行器：连接从每个数据库共享的只读连接池借出，执行期间只允许读（禁止 PRAGMA、临时对象、写入和 ATTACH）；
+    通过 set_progress_handler 检查墙钟预算，超时的查询被中断并以 timeout 状态返回；
+    完整结果集以流式指纹（ResultFingerprint）汇总用于投票，只按行数和估算内存保留一小段预览；
+    多个候选可以在各自的连接上并行执行。
+    """
+
+    def __init__(self, timeout: Optional[float] = 10.0, max_rows: int = 50,
+                 max_result_bytes: Optional[int] = 8 * 1024 * 1024, max_workers: int = 4, progress_interval: int = 1000,
+                 fingerprint_mode: str = "unordered", fetch_size: int = 1000):
+        """
+        Args:
+            timeout (Optional[float]): 单个查询的墙钟预算（秒），包括取结果的时间；None 表示不限。
+            max_rows (int): 预览最多保留的行数，更多的行只标记 truncated；指纹始终覆盖全部行。
+            max_result_bytes (Optional[int]): 预览的估算内存上限，超过后不再保留新行并标记 truncated。
+            max_workers (int): execute_many 并行执行的连接数。
+            progress_interval (int): 每执行多少条 SQLite 虚拟机指令检查一次预算。
+            fingerprint_mode (str): 结果指纹模式，unordered（忽略行顺序）或 ordered。
+            fetch_size (int): 流式计算指纹时每批取回的行数。
+        """
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.max_result_bytes = max_result_bytes
+        self.max_workers = max_workers
+        self.progress_interval = progress_interval
+        self.fingerprint_mode = fingerprint_mode
+        self.fetch_size = fetch_size
+        ResultFingerprint(fingerprint_mode)  # 尽早检查模式名
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _connect(self, sqlite_path: Path) -> Tuple[sqlite3.Connection, Optional[int]]:
+        """从连接池借出连接并加上限制，返回连接和需要在归还时恢复的 SQLITE_LIMIT_LENGTH"""
+        connection = get_connection_pool(sqlite_path).acquire()
+        length_limit = None
+        try:
+            if self.max_result_bytes is not None and hasattr(connection, "setlimit"):
+                # 单个字符串 / BLOB 也不能超过结果内存上限
+                length_limit = connection.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, self.max_result_bytes)
+            connection.set_authorizer(_authorizer)
+        except Exception:
+            self._release(sqlite_path, connection, length_limit)
+            raise
+        return connection, length_limit
+
+    def _release(self, sqlite_path: Path, connection: sqlite3.Connection, length_limit: Optional[int]) -> None:
+        # 连接会被其他调用方复用，先撤销本次执行加上的限制
+        connection.set_progress_handler(None, 0)
+        connection.set_authorizer(None)
+        if length_limit is not None:
+            connection.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, length_limit)
+        # 授权器已经拒绝 PRAGMA，这里再确认一次只读状态，连接池归还时还会检查临时对象
+        try:
+            connection.execute("PRAGMA query_only = 1")
+        except sqlite3.Error:
+            pass
+        get_connection_pool(sqlite_path).release(connection)
+
+    def execute(self, sqlite_path: Path, sql: str) -> Dict[str, Any]:
+        """
+        执行一个候选 SQL。
+
+        Args:
+            sqlite_path (Path): 数据库文件路径。
+            sql (str): 候选 SQL。
+
+        Returns:
+            Dict[str, Any]: sql、status（ok / error / timeout）、execution_time、results（预览）、truncated、
+                row_count、fingerprint（完整结果集的指纹）、error。
+        """
+        entry = {"sql": sql, "status": "ok", "execution_time": None, "results": None, "truncated": False,
+                 "row_count": None, "fingerprint": None, "error": None}
+        start = time.perf_counter()
+        deadline = start + self.timeout if self.timeout is not None else None
+        connection = None
+        try:
+            # 借连接失败（连接池等待超时、数据库文件不存在）也只影响这一个候选
+            connection, length_limit = self._connect(sqlite_path)
+            if deadline is not None:
+                # 返回非零值时 SQLite 中断当前语句，抛出 OperationalError: interrupted
+                connection.set_progress_handler(lambda: time.perf_counter() > deadline, self.progress_interval)
+            cursor = connection.execute(sql)
+            fingerprint = ResultFingerprint(self.fingerprint_mode)
+            rows, size = [], 0
+            while True:
+                # 按批取行：每批都计入指纹，只有预览需要保留行本身
+                batch = cursor.fetchmany(self.fetch_size)
+                if not batch:
+                    break
+                fingerprint.update_many(batch)
+                for row in batch:
+                    if entry["truncated"]:
+                        break
+                    size += _row_size(row)
+                    if len(rows) >= self.max_rows or (self.max_result_bytes is not None and size > self.max_result_bytes):
+                        entry["truncated"] = True
+                        break
+                    rows.append(row)
+            entry["results"] = rows
+            entry["row_count"] = fingerprint.row_count
+            entry["fingerprint"] = fingerprint.hexdigest()
+            entry["execution_time"] = time.perf_counter() - start
+        except PoolTimeout as e:
+            entry["status"] = "timeout"
+            entry["execution_time"] = time.perf_counter() - start
+            entry["error"] = str(e)
+        except (sqlite3.Error, OSError) as e:
+            elapsed = time.perf_counter() - start
+            if deadline is not None and time.perf_counter() > deadline:
+                entry["status"] = "timeout"
+                entry["execution_time"] = elapsed
+                entry["error"] = f"timed out after {self.timeout}s"
+            else:
+                entry["status"] = "error"
+                entry["error"] = str(e)
+        finally:
+            if connection is not None:
+                self._release(sqlite_path, connection, length_limit)
+        return entry
+
+    def explain(self, sqlite_path: Path, sql: str) -> Dict[str, Any]:
+        """返回候选的查询计划和 analyze_plan 标出的全表扫描、缺索引的连接等问题，不执行查询"""
+        connection = None
+        try:
+            connection, length_limit = self._connect(sqlite_path)
+            return {**analyze_plan(explain_query_plan(connection, sql)), "error": None}
+        except (sqlite3.Error, OSError, PoolTimeout) as e:
+            return {"plan": [], "full_scans": [], "missing_index_joins": [], "temp_btrees": [], "penalty": 0,
+                    "error": str(e)}
+        finally:
+            if connection is not None:
+                self._release(sqlite_path, connection, length_limit)
+
+    def measure(self, sqlite_path: Path, sql: str, runs: int = 3) -> Dict[str, Any]:
+        """
+        重复执行同一个查询，测量页缓存已热时的耗时。
+
+        Args:
+            sqlite_path (Path): 数据库文件路径。
+            sql (str): 候选 SQL，调用方应已执行过一次（冷启动）。
+            runs (int): 重复次数。
+
+        Returns:
+            Dict[str, Any]: warm_times（每次耗时）和 warm_time（中位数，全部失败时为 None）。
+        """
+        times = []
+        for _ in range(runs):
+            entry = self.execute(sqlite_path, sql)
+            if entry["status"] != "ok":
+                break
+            times.append(entry["execution_time"])
+        return {"warm_times": times, "warm_time": statistics.median(times) if times else None}
+
+    def execute_many(self, sqlite_path: Path, sqls: List[str]) -> List[Dict[str, Any]]:
+        """在各自的连接上并行执行多个候选，按输入顺序返回结果"""
+        if len(sqls) <= 1 or self.max_workers <= 1:
+            return [self.execute(sqlite_path, sql) for sql in sqls]
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="nl2sql-sql")
+        return list(self._pool.map(lambda sql: self.execute(sqlite_path, sql), sqls))
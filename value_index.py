@@ -0,0 +1,147 @@
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+INDEX_VERSION = 1
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class LexicalValueIndex:
+    """
+    字面值索引，保存在 <db>_values.sqlite：
+    每列的去重文本值 + FTS5 trigram 全文索引。
+    查询先做规范化精确匹配，再做 trigram 子串匹配，单次查询在亚毫秒级。
+    """
+
+    def __init__(self, index_path: Path):
+        self.index_path = Path(index_path)
+        self._connection = sqlite3.connect(
+            f"{self.index_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        meta = dict(self._connection.execute("SELECT key, value FROM meta").fetchall())
+        self.source_mtime = int(meta.get("source_mtime", 0))
+        self.source_size = int(meta.get("source_size", 0))
+        self.columns: Dict[Tuple[str, str], int] = {
+            (table_name, column_name): col_id
+            for col_id, table_name, column_name in self._connection.execute(
+                "SELECT col_id, table_name, column_name FROM value_columns"
+            ).fetchall()
+        }
+        self._column_names = {col_id: key for key, col_id in self.columns.items()}
+
+    @classmethod
+    def build(cls, sqlite_path: Path, index_path: Path, tables_columns: Dict[str, List[str]]) -> "LexicalValueIndex":
+        """
+        一次批量构建：ATTACH 源数据库后完全在 SQLite 内部完成去重和建索引。
+
+        Args:
+            sqlite_path (Path): 源数据库路径。
+            index_path (Path): 索引文件路径。
+            tables_columns (Dict[str, List[str]]): 需要索引的表和列。
+
+        Returns:
+            LexicalValueIndex: 构建好的索引。
+        """
+        start = time.perf_counter()
+        stat = os.stat(sqlite_path)
+        tmp_path = f"{index_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        connection = sqlite3.connect(tmp_path, uri=True)
+        try:
+            connection.execute("PRAGMA journal_mode=OFF")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute("ATTACH DATABASE ? AS src", (f"{Path(sqlite_path).resolve().as_uri()}?mode=ro",))
+            connection.executescript('''
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE value_columns (col_id INTEGER PRIMARY KEY, table_name TEXT, column_name TEXT);
+                CREATE TABLE value_entries (value TEXT, norm TEXT, col_id INTEGER);
+            ''')
+            col_id = 0
+            for table_name, column_names in tables_columns.items():
+                for column_name in column_names:
+                    col_id += 1
+                    connection.execute("INSERT INTO value_columns VALUES (?,?,?)", (col_id, table_name, column_name))
+                    column = _quote(column_name)
+                    # 只索引以文本形式存储的值
+                    connection.execute(f'''
+                        INSERT INTO value_entries (value, norm, col_id)
+                        SELECT DISTINCT {column}, lower(trim({column})), {col_id}
+                        FROM src.{_quote(table_name)}
+                        WHERE typeof({column}) = 'text' AND trim({column}) <> ''
+                    ''')
+            connection.executescript('''
+                CREATE INDEX idx_value_entries_norm ON value_entries (norm, col_id);
+                CREATE VIRTUAL TABLE value_fts USING fts5(value, col_id UNINDEXED, tokenize='trigram');
+                INSERT INTO value_fts (rowid, value, col_id) SELECT rowid, value, col_id FROM value_entries;
+            ''')
+            connection.executemany("INSERT INTO meta VALUES (?,?)", [
+                ("version", str(INDEX_VERSION)),
+                ("source_mtime", str(stat.st_mtime_ns)),
+                ("source_size", str(stat.st_size)),
+            ])
+            connection.commit()
+            count = connection.execute("SELECT COUNT(*) FROM value_entries").fetchone()[0]
+        finally:
+            connection.close()
+        os.replace(tmp_path, index_path)
+        print(f"Lexical value index built: {count} distinct values in {time.perf_counter() - start:.2f}s")
+        return cls(index_path)
+
+    def is_fresh(self, sqlite_path: Path) -> bool:
+        try:
+            stat = os.stat(sqlite_path)
+        except OSError:
+            return False
+        return stat.st_mtime_ns == self.source_mtime and stat.st_size == self.source_size
+
+    def lookup(self, keyword: str, columns: Optional[List[Tuple[str, str]]] = None,
+               limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        查询一个关键词：先规范化精确匹配，没有结果再做 trigram 子串匹配（关键词至少 3 个字符）。
+
+        Args:
+            keyword (str): 关键词。
+            columns (Optional[List[Tuple[str, str]]]): 限定的 (表, 列)，默认全部列。
+            limit (int): 最多返回的匹配数。
+
+        Returns:
+            List[Dict[str, Any]]: 匹配列表，包含 table、column、value、match（exact / fuzzy）。
+        """
+        if columns is None:
+            col_ids = None
+        else:
+            col_ids = [self.columns[c] for c in columns if c in self.columns]
+            if not col_ids:
+                return []
+        col_filter = f" AND col_id IN ({','.join(str(i) for i in col_ids)})" if col_ids else ""
+
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT value, col_id FROM value_entries WHERE norm = lower(trim(?)){col_filter} LIMIT ?",
+                (keyword, limit)
+            ).fetchall()
+            match = "exact"
+            if not rows and len(keyword.strip()) >= 3:
+                phrase = '"' + keyword.strip().replace('"', '""') + '"'
+                rows = self._connection.execute(
+                    f"SELECT value, col_id FROM value_fts WHERE value_fts MATCH ?{col_filter} ORDER BY rank LIMIT ?",
+                    (phrase, limit)
+                ).fetchall()
+                match = "fuzzy"
+
+        return [
+            {"table": self._column_names[col_id][0], "column": self._column_names[col_id][1], "value": value, "match": match}
+            for value, col_id in rows
+        ]
+
+    def close(self) -> None:
+        self._connection.close()